@@ -0,0 +1,64 @@
+""" Benchmark recall@k against latency for the IVF index, compared with exact search."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_ann_index --chunks 200000 --dimensions 256
+
+# Standard Library Imports
+import argparse
+import time
+
+# Third-Party Packages
+import numpy as np
+
+# Local Modules
+from common.retrieval import EmbeddingIndex
+from common.ann_index import IvfIndex, default_list_count
+
+def make_clustered_embeddings(count, dimensions, topics, rng):
+    """Synthetic embeddings grouped around topic directions, as real chunk embeddings are."""
+    centres = rng.normal(size=(topics, dimensions)).astype(np.float32)
+    labels = rng.integers(0, topics, size=count)
+    return centres[labels] + 0.6 * rng.normal(size=(count, dimensions)).astype(np.float32)
+
+def recall(found, expected):
+    """Fraction of the exact top k that the approximate search also returned."""
+    total = 0
+    for hits, truth in zip(found, expected):
+        total += len({row for row, score in hits} & {row for row, score in truth}) / len(truth)
+    return total / len(expected)
+
+def time_per_query(search, queries):
+    start = time.perf_counter()
+    results = [search(query) for query in queries]
+    return results, (time.perf_counter() - start) / len(queries)
+
+def run_benchmark(count, dimensions, questions, k, lists, probes):
+    rng = np.random.default_rng(42)
+    matrix = make_clustered_embeddings(count, dimensions, max(1, count // 500), rng)
+    queries = matrix[rng.choice(count, questions, replace=False)] + 0.3 * rng.normal(size=(questions, dimensions)).astype(np.float32)
+
+    exact = EmbeddingIndex(matrix)
+    expected, exact_time = time_per_query(lambda query: exact.search(query, k), queries)
+
+    print(f"Chunks: {count}, dimensions: {dimensions}, questions: {questions}, k: {k}")
+    print(f"{'exact':24} recall@{k} 1.000  {exact_time * 1000:8.2f} ms per query")
+
+    for listCount in lists or [default_list_count(count)]:
+        start = time.perf_counter()
+        index = IvfIndex.build(matrix, listCount)
+        build = time.perf_counter() - start
+        print(f"IVF lists={listCount} built in {build:.1f}s")
+        for probe in probes:
+            found, ivf_time = time_per_query(lambda query: index.search(query, k, probe), queries)
+            print(f"{'  probe=' + str(probe):24} recall@{k} {recall(found, expected):.3f}  {ivf_time * 1000:8.2f} ms per query")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark IVF recall against latency")
+    parser.add_argument("--chunks", type=int, default=200000, help="number of stored embeddings")
+    parser.add_argument("--dimensions", type=int, default=256, help="length of each embedding")
+    parser.add_argument("--questions", type=int, default=100, help="number of queries")
+    parser.add_argument("--k", type=int, default=10, help="hits per query")
+    parser.add_argument("--lists", type=int, nargs="*", default=[], help="list counts to try, default 4 * sqrt(chunks)")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 16, 64], help="lists searched per query")
+    args = parser.parse_args()
+    run_benchmark(args.chunks, args.dimensions, args.questions, args.k, args.lists, args.probes)
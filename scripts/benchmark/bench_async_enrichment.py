@@ -0,0 +1,77 @@
+""" Benchmark the threaded and async summary stages against a local mock server with injected latency."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_async_enrichment --chunks 400 --latency 0.25
+
+# Standard Library Imports
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from text.enrich_text_summaries import enrich_text_summaries
+from benchmark.mock_openai_server import start_mock_server
+
+def write_master_text(destinationDir, count):
+    """Write a synthetic master_text.json with count chunks."""
+    chunks = [{"sourceId": f"https://example.com/page{i // 3}", "start": str(i % 3),
+               "text": f"Chunk {i} talks about topic {i % 17} " + "and more words " * 50} for i in range(count)]
+    os.makedirs(os.path.join(destinationDir, "output"), exist_ok=True)
+    with open(os.path.join(destinationDir, "output", "master_text.json"), "w", encoding="utf-8") as f:
+        json.dump(chunks, f)
+
+def run_once(server, count, asyncMode, workers):
+    """Run the summary stage once in a fresh directory, returning elapsed seconds and the output bytes."""
+    config = ApiConfiguration()
+    config.resourceEndpoint = server.endpoint
+    config.apiKey = "mock"
+    config.summaryCacheFile = ""
+    # Measure the client and server, not the quota
+    config.chatRequestsPerMinute = config.chatTokensPerMinute = 0
+    config.embedRequestsPerMinute = config.embedTokensPerMinute = 0
+    config.asyncMode = asyncMode
+    config.processingThreads = workers
+    config.maxConcurrentRequests = workers
+
+    destinationDir = tempfile.mkdtemp()
+    try:
+        write_master_text(destinationDir, count)
+        start = time.perf_counter()
+        enrich_text_summaries(config, destinationDir)
+        elapsed = time.perf_counter() - start
+        with open(os.path.join(destinationDir, "output", "master_enriched.json"), "rb") as f:
+            output = f.read()
+    finally:
+        shutil.rmtree(destinationDir)
+
+    return elapsed, output
+
+def run_benchmark(count, latency, threads, concurrency):
+    server = start_mock_server(latency)
+    try:
+        results = []
+        for workers in threads:
+            results.append((f"threads={workers}", *run_once(server, count, False, workers)))
+        for workers in concurrency:
+            results.append((f"async concurrency={workers}", *run_once(server, count, True, workers)))
+    finally:
+        server.shutdown()
+
+    reference = results[0][2]
+    print(f"Chunks: {count}, latency per request: {latency}s")
+    for name, elapsed, output in results:
+        identical = "identical" if output == reference else "DIFFERENT"
+        print(f"{name:28} {elapsed:7.2f}s {count / elapsed:8.1f} chunks/s  output {identical}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark threaded against async enrichment")
+    parser.add_argument("--chunks", type=int, default=400, help="number of synthetic chunks")
+    parser.add_argument("--latency", type=float, default=0.25, help="seconds the mock server waits per request")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8], help="thread counts for the threaded mode")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[64, 256], help="semaphore sizes for the async mode")
+    args = parser.parse_args()
+    run_benchmark(args.chunks, args.latency, args.threads, args.concurrency)
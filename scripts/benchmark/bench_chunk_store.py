@@ -0,0 +1,63 @@
+""" Benchmark peak memory of a streaming stage over the legacy JSON and the JSONL chunk files."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_chunk_store --chunks 5000 --dimensions 1536
+
+# Standard Library Imports
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from common.chunk_store import chunk_file_name, ChunkWriter
+from text.enrich_lite import enrich_lite
+
+def write_master_enriched(path, count, dimensions):
+    """Write a synthetic master_enriched file with count chunks, each with a summary and an embedding."""
+    random.seed(42)
+    with ChunkWriter(path) as writer:
+        for i in range(count):
+            writer.write({"sourceId": f"https://example.com/page{i // 3}", "start": str(i % 3),
+                          "text": f"Chunk {i} " + "and more words " * 200,
+                          "summary": f"Summary of chunk {i} " + "in fifty words " * 10,
+                          "ada_v2": [random.uniform(-1, 1) for _ in range(dimensions)]})
+
+def run_once(count, dimensions, chunkFileFormat, window):
+    """Run enrich_lite once, returning the input size in MB, elapsed seconds and peak traced memory in MB."""
+    config = ApiConfiguration()
+    config.chunkFileFormat = chunkFileFormat
+    config.chunkWindow = window
+
+    destinationDir = tempfile.mkdtemp()
+    try:
+        input_file = os.path.join(destinationDir, "output", chunk_file_name("master_enriched", config))
+        write_master_enriched(input_file, count, dimensions)
+        size = os.path.getsize(input_file) / 1e6
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        enrich_lite(destinationDir, config)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(destinationDir)
+
+    return size, elapsed, peak
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark enrich_lite over JSON and JSONL chunk files")
+    parser.add_argument("--chunks", type=int, default=5000, help="number of synthetic chunks")
+    parser.add_argument("--dimensions", type=int, default=1536, help="length of each embedding")
+    parser.add_argument("--window", type=int, default=1000, help="chunks held in memory at once")
+    args = parser.parse_args()
+
+    print(f"Chunks: {args.chunks}, dimensions: {args.dimensions}, window: {args.window}")
+    for chunkFileFormat in ["json", "jsonl"]:
+        size, elapsed, peak = run_once(args.chunks, args.dimensions, chunkFileFormat, args.window)
+        print(f"{chunkFileFormat:6} input {size:8.1f} MB  {elapsed:7.2f}s  peak memory {peak:8.1f} MB")
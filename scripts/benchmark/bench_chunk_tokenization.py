@@ -0,0 +1,76 @@
+""" Benchmark how much text the YouTube transcript chunker encodes, relative to the transcript length, on a synthetic 10 hour lecture playlist."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_chunk_tokenization --hours 10
+
+# Standard Library Imports
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+
+WORDS = ("so the gradient of the loss with respect to theta is what we use to update the parameters "
+         "and this is why the learning rate matters for convergence of the algorithm").split()
+
+class CountingTokenizer:
+    """Splits words and punctuation, as a stand-in for tiktoken, and counts the characters it is asked to encode."""
+
+    pattern = re.compile(r"\w+|[^\w\s]|\s+")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.characters = 0
+
+    def encode(self, text, **kwargs):
+        self.calls += 1
+        self.characters += len(text)
+        return self.pattern.findall(text)
+
+def write_lecture(path, hours, rng):
+    """A transcript with a segment of 8 to 14 words every 4 seconds, as YouTube captions come."""
+    segments = [{"text": " ".join(rng.choice(WORDS) for _ in range(rng.randrange(8, 15))), "start": str(seconds), "duration": 4}
+                for seconds in range(0, int(hours * 3600), 4)]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(segments, f)
+    return sum(len(segment["text"]) + 1 for segment in segments)
+
+def run_benchmark(hours, lectures):
+    os.environ.setdefault("GOOGLE_DEVELOPER_API_KEY", "unused")
+    tokenizer = CountingTokenizer()
+    with patch("tiktoken.encoding_for_model", return_value=tokenizer), patch("tiktoken.get_encoding", return_value=tokenizer):
+        from youtube.enrich_transcript_chunks import parse_json_vtt_transcript
+
+    config = ApiConfiguration()
+    maxTokens = config.maxTokens - config.summaryWordCount * 4
+    rng = random.Random(42)
+    directory = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(directory, f"lecture{i}.json") for i in range(lectures)]
+        characters = sum(write_lecture(path, hours / lectures, rng) for path in paths)
+        print(f"Playlist: {hours} hours in {lectures} lectures, {characters / 1e6:.1f}M characters of transcript")
+
+        start = time.perf_counter()
+        chunks = []
+        for path in paths:
+            parse_json_vtt_transcript(path, {"speaker": "", "title": "Lecture", "description": ""},
+                                      chunks, config.chunkDurationMins, maxTokens)
+        elapsed = time.perf_counter() - start
+        print(f"Chunked in {elapsed:.2f}s: {len(chunks)} chunks, {tokenizer.calls} encode calls, "
+              f"{tokenizer.characters / characters:.2f}x the transcript encoded")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark tokenization in the transcript chunker")
+    parser.add_argument("--hours", type=float, default=10, help="hours of lectures")
+    parser.add_argument("--lectures", type=int, default=10, help="number of lectures the hours are split over")
+    args = parser.parse_args()
+    run_benchmark(args.hours, args.lectures)
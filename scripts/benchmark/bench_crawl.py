@@ -0,0 +1,54 @@
+""" Benchmark download_html crawling a local synthetic site with injected latency, one thread against a pooled parallel crawl."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_crawl --pages 111 --fanout 10 --latency 0.05
+
+# Standard Library Imports
+import argparse
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from web.download_html import download_html
+from benchmark.mock_web_site import start_mock_web_site
+
+def run_once(pages, fanout, latency, depth, threads, requestsPerHost):
+    """Crawl a fresh site into a fresh directory, returning elapsed seconds and the site's request counts."""
+    config = ApiConfiguration()
+    config.crawlThreads = threads
+    config.crawlConnectionsPerHost = requestsPerHost
+    config.crawlRequestsPerHost = requestsPerHost
+
+    site = start_mock_web_site(pages, fanout, latency)
+    destinationDir = tempfile.mkdtemp()
+    try:
+        with patch("web.download_html.MAX_PAGE_DEPTH", depth):
+            start = time.perf_counter()
+            download_html(site.url, True, destinationDir, 10, config)
+            elapsed = time.perf_counter() - start
+    finally:
+        site.shutdown()
+        site.server_close()
+        shutil.rmtree(destinationDir)
+    return elapsed, site.requests, len(site.connections), site.maxInFlight
+
+def run_benchmark(pages, fanout, latency, depth, threads, requestsPerHost):
+    print(f"Pages: {pages}, fanout: {fanout}, latency: {latency * 1000:.0f} ms, depth: {depth}")
+    for label, count, perHost in [("sequential", 1, 1), ("parallel", threads, requestsPerHost)]:
+        elapsed, requests, connections, inFlight = run_once(pages, fanout, latency, depth, count, perHost)
+        print(f"{label:10} threads={count:<3} {elapsed:7.2f}s  {requests} requests over {connections} connections, "
+              f"at most {inFlight} in flight")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark download_html against a local site")
+    parser.add_argument("--pages", type=int, default=111, help="pages in the site")
+    parser.add_argument("--fanout", type=int, default=10, help="links from each page to child pages")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the server waits before each page")
+    parser.add_argument("--depth", type=int, default=2, help="MAX_PAGE_DEPTH for the crawl")
+    parser.add_argument("--threads", type=int, default=8, help="crawl threads for the parallel run")
+    parser.add_argument("--requests-per-host", type=int, default=8, help="requests in flight to the site for the parallel run")
+    args = parser.parse_args()
+    run_benchmark(args.pages, args.fanout, args.latency, args.depth, args.threads, args.requests_per_host)
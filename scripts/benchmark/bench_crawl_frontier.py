@@ -0,0 +1,90 @@
+""" Benchmark crawl bookkeeping, list scans against the CrawlFrontier's sets, and a full crawl of a local 10k page site."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_crawl_frontier --pages 10000 --fanout 10 --depth 4
+
+# Standard Library Imports
+import argparse
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+# Third-Party Packages
+from bs4 import BeautifulSoup
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from web.download_html import download_html, add_prefix, remove_exits, MAX_LINKS_PERPAGE
+from web.crawl_frontier import CrawlFrontier
+from benchmark.mock_web_site import start_mock_web_site, page_html, page_path
+
+def site_links(pages, fanout, base):
+    """The in-site links of every page, as find_page_links returns them, keyed by page URL."""
+    links = {}
+    for page in range(pages):
+        url = base + page_path(page, fanout)
+        soup = BeautifulSoup(page_html(page, pages, fanout), "html.parser")
+        links[url] = remove_exits(url, add_prefix(url, [str(a.get('href')) for a in soup.find_all('a')]))
+    return links
+
+def list_crawl(startUrl, links, maxDepth):
+    """The previous bookkeeping: every link checked against lists of the pages found so far."""
+    processedLinks = []
+    level = [startUrl]
+    depth = 0
+    while level:
+        processedLinks.extend(level)
+        if depth >= maxDepth:
+            break
+        nextLevel = []
+        for pageLinks in [links.get(url, []) for url in level]:
+            for link in [item for item in pageLinks if not item in processedLinks]:
+                if link not in nextLevel:
+                    nextLevel.append(link)
+        level = nextLevel
+        depth += 1
+    return processedLinks
+
+def frontier_crawl(startUrl, links, maxDepth):
+    frontier = CrawlFrontier(startUrl, maxDepth, MAX_LINKS_PERPAGE)
+    while frontier.expanding():
+        frontier.next_level([links.get(url, []) for url in frontier.level])
+    return frontier.pages
+
+def run_benchmark(pages, fanout, depth, threads, latency):
+    print(f"Pages: {pages}, fanout: {fanout}, depth: {depth}")
+
+    links = site_links(pages, fanout, "http://127.0.0.1")
+    startUrl = "http://127.0.0.1" + page_path(0, fanout)
+    for label, crawl in [("list scans", list_crawl), ("frontier sets", frontier_crawl)]:
+        start = time.perf_counter()
+        found = crawl(startUrl, links, depth)
+        print(f"Bookkeeping, {label:14} {time.perf_counter() - start:8.3f}s  {len(found)} pages")
+
+    config = ApiConfiguration()
+    config.crawlThreads = threads
+    config.crawlConnectionsPerHost = config.crawlRequestsPerHost = threads
+    site = start_mock_web_site(pages, fanout, latency)
+    destinationDir = tempfile.mkdtemp()
+    try:
+        with patch("web.download_html.MAX_PAGE_DEPTH", depth):
+            start = time.perf_counter()
+            download_html(site.url, True, destinationDir, 10, config)
+            elapsed = time.perf_counter() - start
+    finally:
+        site.shutdown()
+        site.server_close()
+        shutil.rmtree(destinationDir)
+    print(f"Full crawl over http.server, {threads} threads  {elapsed:8.1f}s  {site.requests} requests, "
+          f"{site.requests / elapsed:.0f} pages/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the crawl frontier on a local synthetic site")
+    parser.add_argument("--pages", type=int, default=10000, help="pages in the site")
+    parser.add_argument("--fanout", type=int, default=10, help="links from each page to child pages")
+    parser.add_argument("--depth", type=int, default=4, help="MAX_PAGE_DEPTH for the crawl")
+    parser.add_argument("--threads", type=int, default=8, help="crawl threads")
+    parser.add_argument("--latency", type=float, default=0, help="seconds the server waits before each page")
+    args = parser.parse_args()
+    run_benchmark(args.pages, args.fanout, args.depth, args.threads, args.latency)
@@ -0,0 +1,104 @@
+""" Benchmark how long the text chunker takes to read every document of a corpus in the flat, sharded and packed output layouts."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_document_store --documents 100000
+
+# Standard Library Imports
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+# Local Modules
+from common.document_layout import DocumentManifest, DocumentStore, document_files, open_document_store, sharded_name
+from text.enrich_text_chunks import load_metadata
+
+WORDS = ("attention transformer embedding gradient token layer model training inference vector network "
+         "loss batch weight context sequence decoder encoder prompt dataset the a of and to in is").split()
+
+def write_corpus(directory, layout, count):
+    """count single segment documents of 300 to 1500 words, as download_html writes them in layout."""
+    rng = random.Random(25)
+    os.makedirs(directory)
+    with (DocumentStore(directory) if layout == "packed" else DocumentManifest(directory)) as documents:
+        for i in range(count):
+            sourceId = f"example.com/docs/section{i % 100}/page{i}.html"
+            name = sharded_name(sourceId) if layout == "sharded" else sourceId.replace("/", "_")
+            metadata = {"speaker": "", "title": f"page{i}.html", "sourceId": sourceId, "filename": name + ".json.mdd",
+                        "description": f"page{i}.html", "hitTrackingId": "https://example.com"}
+            segments = [{"text": " ".join(rng.choice(WORDS) for _ in range(rng.randrange(300, 1500))), "start": "0"}]
+            if layout == "packed":
+                documents.put(sourceId, metadata, segments)
+                continue
+            os.makedirs(os.path.dirname(os.path.join(directory, name)), exist_ok=True)
+            with open(os.path.join(directory, name + ".json.mdd"), "w", encoding="utf-8") as f:
+                json.dump(segments, f, indent=4, ensure_ascii=False)
+            with open(os.path.join(directory, name + ".json"), "w", encoding="utf-8") as f:
+                json.dump(metadata, f)
+            if layout == "sharded":
+                documents.put(sourceId, name + ".json")
+    if layout == "flat":
+        os.remove(os.path.join(directory, "documents.sqlite"))
+
+def read_corpus(directory):
+    """Reads every document's metadata and segments the way enrich_text_chunks does. Returns the count and characters read."""
+    characters = 0
+    store = open_document_store(directory)
+    if store is not None:
+        with store:
+            documents = store.metadata()
+            for metadata in documents:
+                characters += sum(len(segment["text"]) for segment in store.segments(metadata["sourceId"]))
+        return len(documents), characters
+
+    documents = document_files(directory)
+    for document in documents:
+        metadata = load_metadata(document)
+        with open(os.path.join(directory, metadata["filename"]), encoding="utf-8") as f:
+            characters += sum(len(segment["text"]) for segment in json.load(f))
+    return len(documents), characters
+
+def drop_caches():
+    """Asks the OS to drop its page cache, so reads come from disk, if allowed."""
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+def run_benchmark(count):
+    root = tempfile.mkdtemp()
+    try:
+        results = {}
+        for layout in ("flat", "sharded", "packed"):
+            directory = os.path.join(root, layout)
+            start = time.perf_counter()
+            write_corpus(directory, layout, count)
+            written = time.perf_counter() - start
+
+            cold = drop_caches()
+            start = time.perf_counter()
+            documents, characters = read_corpus(directory)
+            first = time.perf_counter() - start
+            start = time.perf_counter()
+            read_corpus(directory)
+            second = time.perf_counter() - start
+
+            files = sum(len(names) for _, _, names in os.walk(directory))
+            results[layout] = characters
+            print(f"{layout:8} write {written:7.2f}s  read {'cold' if cold else 'first'} {first:7.2f}s  warm {second:7.2f}s  "
+                  f"{documents} documents  {files} files")
+        print(f"Same text read in every layout: {len(set(results.values())) == 1}")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark reading a corpus in each output layout")
+    parser.add_argument("--documents", type=int, default=20000, help="documents in the synthetic corpus")
+    args = parser.parse_args()
+    run_benchmark(args.documents)
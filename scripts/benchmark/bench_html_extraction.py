@@ -0,0 +1,66 @@
+""" Benchmark HTML to text extraction: pages per second and tokens per page for each installed extractor against the legacy whole-page text."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_html_extraction --pages 200
+
+# Standard Library Imports
+import argparse
+import random
+import time
+
+# Local Modules
+from common.html_text import get_html_extractor, available_html_extractors, HTML_EXTRACTORS
+
+WORDS = ("attention transformer embedding gradient token layer model training inference vector "
+         "network loss batch weight context sequence decoder encoder prompt dataset").split()
+
+def synthetic_page(rng):
+    """A blog style page: scripts and styles, a long nav, an article, a sidebar and a link-heavy footer."""
+    def sentence(count):
+        return " ".join(rng.choice(WORDS) for _ in range(count)).capitalize() + "."
+
+    nav = "".join(f'<li><a href="/section/{i}">Section {i} {rng.choice(WORDS)}</a></li>' for i in range(120))
+    article = "".join(f"<h2>{sentence(5)}</h2>" + "".join(f"<p>{sentence(25)} <b>{sentence(4)}</b> {sentence(15)}</p>" for _ in range(4))
+                      for _ in range(8))
+    aside = "".join(f'<li><a href="/post/{i}">{sentence(6)}</a></li>' for i in range(30))
+    footer = "".join(f'<a href="/legal/{i}">{sentence(3)}</a> ' for i in range(60))
+    script = "var config = {" + ",".join(f'"k{i}": "{rng.random()}"' for i in range(400)) + "};"
+    style = "".join(f".c{i} {{ margin: {i}px; color: #{i:06x}; }}\n" for i in range(300))
+    return (f"<!DOCTYPE html><html><head><title>{sentence(6)}</title><style>{style}</style><script>{script}</script></head>"
+            f"<body><header><nav><ul>{nav}</ul></nav></header><main><article><h1>{sentence(8)}</h1>{article}</article></main>"
+            f"<aside><ul>{aside}</ul></aside><footer>{footer}</footer></body></html>").encode("utf-8")
+
+def make_token_counter():
+    """cl100k_base token counts if tiktoken can load its encoding here, else an estimate from the length."""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return (lambda text: len(encoding.encode(text, disallowed_special=()))), "tokens"
+    except Exception:
+        return (lambda text: len(text) // 4), "tokens (estimated, 4 characters each)"
+
+def run_benchmark(count, repeats):
+    rng = random.Random(42)
+    pages = [synthetic_page(rng) for _ in range(count)]
+    count_tokens, unit = make_token_counter()
+
+    print(f"Pages: {count}, average {sum(len(page) for page in pages) / count / 1024:.0f} KB of HTML each")
+    print(f"Not installed: {', '.join(name for name in HTML_EXTRACTORS if name not in available_html_extractors()) or 'none'}")
+
+    for name in ["legacy"] + [name for name in available_html_extractors() if name != "legacy"]:
+        extractor = get_html_extractor(name)
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            texts = [extractor(page) for page in pages]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        tokens = sum(count_tokens(text) for text in texts) / count
+        print(f"{name:12} {count / best:8.1f} pages/s  {tokens:8.0f} {unit} per page")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark HTML text extractors")
+    parser.add_argument("--pages", type=int, default=200, help="number of synthetic pages")
+    parser.add_argument("--repeats", type=int, default=3, help="runs to time, best is reported")
+    args = parser.parse_args()
+    run_benchmark(args.pages, args.repeats)
@@ -0,0 +1,90 @@
+""" Benchmark download_markdown converting a large Markdown checkout serially against process pools of increasing size."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_markdown_conversion --files 5000 --processes 2 4 8
+# or on a local checkout:           python -m benchmark.bench_markdown_conversion --repo ../../some-docs-repo
+
+# Standard Library Imports
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import time
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from github.download_markdown import download_markdown
+
+WORDS = ("attention transformer embedding gradient token layer model training inference vector network "
+         "loss batch weight context sequence decoder encoder prompt dataset the a of and to in is").split()
+
+def write_checkout(directory, count):
+    """A docs tree of count Markdown files of 200 to 3000 words, with headings, lists, links, tables and code."""
+    rng = random.Random(22)
+    for i in range(count):
+        lines = [f"# Document {i}", ""]
+        words = rng.randrange(200, 3000)
+        while words > 0:
+            paragraph = " ".join(rng.choice(WORDS) for _ in range(min(words, 80)))
+            words -= 80
+            kind = rng.random()
+            if kind < 0.1:
+                lines += [f"## {paragraph[:30]}", ""]
+            elif kind < 0.2:
+                lines += [f"- {paragraph[:60]}", f"- [{paragraph[:10]}](https://example.com/{i})", ""]
+            elif kind < 0.25:
+                lines += ["| a | b |", "|---|---|", f"| {paragraph[:10]} | {paragraph[10:20]} |", ""]
+            elif kind < 0.3:
+                lines += ["```python", "model.fit(x, y)", "```", ""]
+            lines += [f"{paragraph} with **bold** and `code`.", ""]
+        folder = os.path.join(directory, f"section{i % 50:02d}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"doc{i:05d}.md"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+def output_digest(directory):
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        digest.update(name.encode("utf-8"))
+        with open(os.path.join(directory, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def run_once(repo, processes):
+    config = ApiConfiguration()
+    config.markdownProcesses = processes
+    destination = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        download_markdown(repo, "repo", destination, config)
+        elapsed = time.perf_counter() - start
+        return elapsed, len(os.listdir(destination)) // 2, output_digest(destination)
+    finally:
+        shutil.rmtree(destination)
+
+def run_benchmark(repo, count, processCounts):
+    directory = tempfile.mkdtemp()
+    try:
+        if repo is None:
+            repo = os.path.join(directory, "checkout")
+            write_checkout(repo, count)
+        print(f"Repo: {repo}, cores: {os.cpu_count()}")
+
+        serial, files, expected = run_once(repo, 0)
+        print(f"serial           {serial:7.2f}s  {files / serial:8.1f} files/s  {files} files")
+        for processes in processCounts:
+            elapsed, files, digest = run_once(repo, processes)
+            print(f"{processes:3} processes    {elapsed:7.2f}s  {files / elapsed:8.1f} files/s  "
+                  f"x{serial / elapsed:.2f}  identical: {digest == expected}")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark process pool Markdown conversion")
+    parser.add_argument("--repo", help="local checkout to convert instead of a synthetic one")
+    parser.add_argument("--files", type=int, default=5000, help="Markdown files in the synthetic checkout")
+    parser.add_argument("--processes", type=int, nargs="+", default=[2, 4], help="pool sizes to try")
+    args = parser.parse_args()
+    run_benchmark(args.repo, args.files, args.processes)
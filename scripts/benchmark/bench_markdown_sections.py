@@ -0,0 +1,126 @@
+""" Benchmark structural chunking of Markdown at its headings against chunking the flattened text, on a course repo."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory, on a local clone of microsoft/generative-ai-for-beginners:
+#    python -m benchmark.bench_markdown_sections --repo ../../generative-ai-for-beginners
+# Without --repo, a synthetic course of the same shape is generated: lessons with a title, a few
+# second level sections, some with third level subsections, paragraphs, lists and code blocks.
+
+# Standard Library Imports
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from contextlib import nullcontext
+from unittest.mock import patch
+
+# Third-Party Packages
+import tiktoken
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from github.download_markdown import download_markdown
+from text.enrich_text_chunks import enrich_text_chunks, ENCODING_MODEL
+
+WORDS = ("attention transformer embedding gradient token layer model training inference vector network "
+         "loss batch weight context sequence decoder encoder prompt dataset the a of and to in is").split()
+
+class RegexTokenizer:
+    """Stands in for tiktoken where its encoding cannot be downloaded: splits words and punctuation."""
+
+    pattern = re.compile(r"\w+|[^\w\s]")
+
+    def encode(self, text, **kwargs):
+        return self.pattern.findall(text)
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+def paragraph(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def write_course(directory, lessons):
+    """A course of lesson READMEs with the heading structure of microsoft/generative-ai-for-beginners."""
+    rng = random.Random(19)
+    for lesson in range(lessons):
+        lines = [f"# Lesson {lesson + 1}: {paragraph(rng, 4)}", "", paragraph(rng, rng.randrange(40, 150)), ""]
+        for section in range(rng.randrange(4, 9)):
+            lines += [f"## {paragraph(rng, 3)}", "", paragraph(rng, rng.randrange(40, 300)), ""]
+            if rng.random() < 0.3:
+                lines += ["```python", "response = client.completions.create(prompt=prompt)", "```", ""]
+            for subsection in range(rng.choice([0, 0, 1, 2, 3])):
+                lines += [f"### {paragraph(rng, 3)}", "", paragraph(rng, rng.randrange(30, 200)), "",
+                          *[f"- {paragraph(rng, 8)}" for _ in range(rng.randrange(0, 4))], ""]
+        lessonDir = os.path.join(directory, f"{lesson + 1:02d}-lesson")
+        os.makedirs(lessonDir)
+        # download_markdown names its output after the file name alone, so each lesson's file name is its own
+        with open(os.path.join(lessonDir, f"lesson-{lesson + 1:02d}.md"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+def read_chunks(markdownDir):
+    with open(os.path.join(markdownDir, "output", "master_text.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def section_starts(markdownDir):
+    """The opening words of every section, to tell whether a chunk starts at a section."""
+    starts = set()
+    for name in os.listdir(markdownDir):
+        if name.endswith(".sections"):
+            with open(os.path.join(markdownDir, name), "r", encoding="utf-8") as f:
+                starts.update(" ".join(section["text"].split()[:6]) for section in json.load(f))
+    return starts
+
+def run_benchmark(repo, lessons):
+    try:
+        tiktoken.encoding_for_model(ENCODING_MODEL)
+        tokenizer = None
+        counter = tiktoken.encoding_for_model(ENCODING_MODEL)
+        print("Tokenizer: tiktoken")
+    except Exception:
+        tokenizer = counter = RegexTokenizer()
+        print("Tokenizer: regex stand-in, tiktoken's encoding could not be loaded")
+
+    directory = tempfile.mkdtemp()
+    try:
+        if repo is None:
+            repo = os.path.join(directory, "generative-ai-for-beginners")
+            write_course(repo, lessons)
+            print(f"Repo: synthetic course of {lessons} lessons")
+        else:
+            print(f"Repo: {repo}")
+
+        config = ApiConfiguration()
+        config.chunkingMode = "sections"
+        markdownDir = os.path.join(directory, "markdown")
+        os.makedirs(markdownDir)
+        start = time.perf_counter()
+        download_markdown(repo, "generative-ai-for-beginners", markdownDir, config)
+        print(f"Markdown converted, with sections, in {time.perf_counter() - start:.2f}s")
+        starts = section_starts(markdownDir)
+
+        with patch("text.enrich_text_chunks.tiktoken.encoding_for_model", return_value=tokenizer) if tokenizer else nullcontext():
+            for mode in ["segments", "sections"]:
+                config.chunkingMode = mode
+                start = time.perf_counter()
+                enrich_text_chunks(config, markdownDir)
+                elapsed = time.perf_counter() - start
+                chunks = read_chunks(markdownDir)
+                tokens = [len(counter.encode(chunk["text"], disallowed_special=())) for chunk in chunks]
+                atSection = sum(1 for chunk in chunks if " ".join(chunk["text"].split()[:6]) in starts
+                                or chunk["start"] == "0")
+                print(f"{mode:9} {elapsed:6.2f}s  {len(chunks):5} chunks  {sum(tokens):8} tokens  "
+                      f"{sum(tokens) / max(1, len(chunks)):6.0f} tokens/chunk  "
+                      f"{atSection / max(1, len(chunks)):4.0%} of chunks start at a section or document")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Markdown section chunking")
+    parser.add_argument("--repo", help="local clone of a Markdown repo, e.g. microsoft/generative-ai-for-beginners")
+    parser.add_argument("--lessons", type=int, default=200, help="lessons in the synthetic course, without --repo")
+    args = parser.parse_args()
+    run_benchmark(args.repo, args.lessons)
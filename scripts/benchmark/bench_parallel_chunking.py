@@ -0,0 +1,89 @@
+""" Benchmark enrich_text_chunks serially against process pools of increasing size on a synthetic markdown corpus."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_parallel_chunking --documents 2000 --processes 1 2 4 8
+
+# Standard Library Imports
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from contextlib import nullcontext
+from unittest.mock import patch
+
+# Third-Party Packages
+import tiktoken
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from text.enrich_text_chunks import enrich_text_chunks, ENCODING_MODEL
+
+WORDS = ("attention transformer embedding gradient token layer model training inference vector network "
+         "loss batch weight context sequence decoder encoder prompt dataset the a of and to in is").split()
+
+class RegexTokenizer:
+    """Stands in for tiktoken where its encoding cannot be downloaded: splits words and punctuation, at a similar cost."""
+
+    pattern = re.compile(r"\w+|[^\w\s]")
+
+    def encode(self, text, **kwargs):
+        return self.pattern.findall(text)
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+def write_corpus(directory, count):
+    """Markdown style documents of 300 to 6000 words, written as download_markdown writes them."""
+    rng = random.Random(42)
+    for i in range(count):
+        name = f"doc{i:05d}.md"
+        words = rng.randrange(300, 6000)
+        text = " ".join(rng.choice(WORDS) for _ in range(words))
+        with open(os.path.join(directory, name + ".json.mdd"), "w", encoding="utf-8") as f:
+            json.dump([{"text": text, "start": "0"}], f)
+        with open(os.path.join(directory, name + ".json"), "w", encoding="utf-8") as f:
+            json.dump({"speaker": "", "title": name, "sourceId": f"repo/docs/{name}", "filename": name + ".json.mdd",
+                       "description": name, "hitTrackingId": "repo"}, f)
+
+def run_once(directory, processes):
+    config = ApiConfiguration()
+    config.chunkingProcesses = processes
+    start = time.perf_counter()
+    enrich_text_chunks(config, directory)
+    elapsed = time.perf_counter() - start
+    with open(os.path.join(directory, "output", "master_text.json"), "rb") as f:
+        return elapsed, f.read()
+
+def run_benchmark(count, processCounts):
+    try:
+        tiktoken.encoding_for_model(ENCODING_MODEL)
+        tokenizer = None
+        print("Tokenizer: tiktoken")
+    except Exception:
+        tokenizer = RegexTokenizer()
+        print("Tokenizer: regex stand-in, tiktoken's encoding could not be loaded")
+
+    directory = tempfile.mkdtemp()
+    try:
+        write_corpus(directory, count)
+        print(f"Documents: {count}, cores: {os.cpu_count()}")
+        with patch("text.enrich_text_chunks.tiktoken.encoding_for_model", return_value=tokenizer) if tokenizer else nullcontext():
+            serial, expected = run_once(directory, 0)
+            print(f"serial           {serial:7.2f}s  {count / serial:8.1f} documents/s")
+            for processes in processCounts:
+                elapsed, output = run_once(directory, processes)
+                print(f"{processes:3} processes    {elapsed:7.2f}s  {count / elapsed:8.1f} documents/s  "
+                      f"x{serial / elapsed:.2f}  identical: {output == expected}")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark process pool chunking")
+    parser.add_argument("--documents", type=int, default=2000, help="number of synthetic documents")
+    parser.add_argument("--processes", type=int, nargs="+", default=[2, 4], help="pool sizes to try")
+    args = parser.parse_args()
+    run_benchmark(args.documents, args.processes)
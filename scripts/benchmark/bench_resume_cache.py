@@ -0,0 +1,83 @@
+""" Benchmark the resume cache lookup used by the summary and embedding stages on a synthetic master_enriched.json."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_resume_cache --chunks 50000
+
+# Standard Library Imports
+import argparse
+import json
+import os
+import tempfile
+import time
+
+# Local Modules
+from common.common_functions import build_chunk_index
+from text.enrich_text_embeddings import find_cached_chunks
+
+CHUNKS_PER_SOURCE = 6
+
+def make_synthetic_chunks(count, dimensions):
+    """Build chunks shaped like master_enriched.json, several per sourceId as for transcripts and web pages."""
+    chunks = []
+    for i in range(count):
+        chunks.append({
+            "sourceId": f"source{i // CHUNKS_PER_SOURCE:06d}",
+            "start": str((i % CHUNKS_PER_SOURCE) * 600),
+            "text": f"Synthetic chunk {i} " + "lorem ipsum dolor sit amet " * 40,
+            "summary": f"Summary of chunk {i}",
+            "ada_v2": [0.001 * (i % 1000)] * dimensions
+        })
+    return chunks
+
+def linear_scan(chunks, current_chunks):
+    """The lookup as it was before the index: a scan of the whole cache for every chunk."""
+    for chunk in chunks:
+        for i in current_chunks:
+            if i.get('sourceId') == chunk.get('sourceId'):
+                if i.get("summary") and i.get("ada_v2"):
+                    chunk["summary"] = i.get("summary")
+                    chunk["ada_v2"] = i.get("ada_v2")
+                    break
+
+def run_benchmark(count, sample, dimensions):
+    """Time a no-change re-run with both lookups and print the results."""
+
+    # Round trip through a file so load time is part of the measurement, as in a real re-run
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_file = os.path.join(temp_dir, "master_enriched.json")
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(make_synthetic_chunks(count, dimensions), f)
+
+        start = time.perf_counter()
+        with open(cache_file, "r", encoding="utf-8") as f:
+            current = json.load(f)
+        with open(cache_file, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        load_seconds = time.perf_counter() - start
+
+    # Before: the scan is quadratic, so time a sample of chunks and scale up
+    sample = min(sample, count)
+    start = time.perf_counter()
+    linear_scan(chunks[-sample:], current)
+    scan_seconds = (time.perf_counter() - start) * count / sample
+
+    # After: build the index once, then one dictionary lookup per chunk
+    start = time.perf_counter()
+    remaining = find_cached_chunks(chunks, build_chunk_index(current))
+    index_seconds = time.perf_counter() - start
+    assert not remaining
+
+    print(f"Chunks: {count}")
+    print(f"Load cache and input: {load_seconds:.2f}s")
+    print(f"Linear scan lookup: {scan_seconds:.2f}s (extrapolated from the last {sample} chunks)")
+    print(f"Indexed lookup: {index_seconds:.2f}s")
+    print(f"Speed up: {scan_seconds / index_seconds:.0f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the resume cache lookup")
+    parser.add_argument("--chunks", type=int, default=50000, help="number of synthetic chunks")
+    parser.add_argument("--sample", type=int, default=500, help="chunks timed with the linear scan before extrapolating")
+    # Vector length only affects load time, so the default keeps the synthetic file small
+    parser.add_argument("--dimensions", type=int, default=16, help="length of each synthetic ada_v2 vector")
+    args = parser.parse_args()
+    run_benchmark(args.chunks, args.sample, args.dimensions)
@@ -0,0 +1,62 @@
+""" Benchmark downloading YouTube transcripts one at a time against a shared thread pool, on mocked YouTube APIs with latency."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_transcript_download --playlists 5 --videos 40 --latency 0.3
+
+# Standard Library Imports
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from benchmark.mock_youtube import MockTranscriptApi, MockYouTube, mock_playlists
+
+def run_once(download, playlists, latency, threads, requestsPerMinute):
+    config = ApiConfiguration()
+    config.transcriptThreads = threads
+    config.transcriptRequestsPerMinute = requestsPerMinute
+    config.transcriptRetryMaxSeconds = 1
+    # One video in twenty is throttled once, as YouTube does under load
+    throttled = [video for playlist in playlists.values() for video in
+                 (item["snippet"]["resourceId"]["videoId"] for item in playlist[::20])]
+    api = MockTranscriptApi(latency, throttled=throttled)
+
+    directory = tempfile.mkdtemp()
+    try:
+        with patch("youtube.download_transcripts.YouTubeTranscriptApi", api), \
+             patch("youtube.download_transcripts.googleapiclient.discovery.build", return_value=MockYouTube(playlists, latency)):
+            start = time.perf_counter()
+            download(list(playlists), directory, config)
+            elapsed = time.perf_counter() - start
+        downloaded = sum(1 for name in os.listdir(directory) if name.endswith(".json.vtt"))
+    finally:
+        shutil.rmtree(directory)
+    return elapsed, downloaded, api.maxInFlight
+
+def run_benchmark(playlistCount, videos, latency, threadCounts, requestsPerMinute):
+    os.environ.setdefault("GOOGLE_DEVELOPER_API_KEY", "unused")
+    with patch("tiktoken.encoding_for_model"), patch("tiktoken.get_encoding"):
+        from youtube.download_transcripts import download_transcripts_for_playlists
+
+    playlists = mock_playlists(playlistCount, videos)
+    print(f"Playlists: {playlistCount} of {videos} videos, {latency * 1000:.0f} ms a call, limit {requestsPerMinute} requests a minute")
+    serial = None
+    for threads in threadCounts:
+        elapsed, downloaded, inFlight = run_once(download_transcripts_for_playlists, playlists, latency, threads, requestsPerMinute)
+        serial = serial or elapsed
+        print(f"{threads:3} threads  {elapsed:7.2f}s  {downloaded / elapsed:6.1f} videos/s  "
+              f"{downloaded} transcripts  {inFlight} in flight at most  x{serial / elapsed:.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark concurrent transcript downloads")
+    parser.add_argument("--playlists", type=int, default=5, help="number of playlists")
+    parser.add_argument("--videos", type=int, default=40, help="videos in each playlist")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds each YouTube call takes")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8, 16], help="pool sizes to try, the first is the baseline")
+    parser.add_argument("--limit", type=int, default=ApiConfiguration().transcriptRequestsPerMinute, help="transcript requests a minute, 0 for none")
+    args = parser.parse_args()
+    run_benchmark(args.playlists, args.videos, args.latency, args.threads, args.limit)
@@ -0,0 +1,69 @@
+""" Benchmark file size and load time of embeddings as JSON float arrays against a float32 .npy sidecar."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory:  python -m benchmark.bench_vector_store --chunks 5000 --dimensions 1536
+
+# Standard Library Imports
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+# Third-Party Packages
+import numpy as np
+
+# Local Modules
+from common.vector_store import load_embedding_file, split_vector_file, vector_file_path
+
+def write_lite_file(path, count, dimensions):
+    """Write a synthetic master_enriched_lite.json, in the layout enrich_lite has always written."""
+    random.seed(42)
+    lite = [{"sourceId": f"https://example.com/page{i // 3}", "start": str(i % 3), "seconds": 120,
+             "summary": f"Summary of chunk {i} " + "in fifty words " * 10,
+             "ada_v2": [random.uniform(-0.1, 0.1) for _ in range(dimensions)]} for i in range(count)]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(lite, f)
+
+def time_load(path, repeats):
+    """Best of repeats: load the file and touch every vector, as a full scan would."""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks, matrix = load_embedding_file(path)
+        total = float(np.asarray(matrix).sum())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run_benchmark(count, dimensions, repeats):
+    directory = tempfile.mkdtemp()
+    try:
+        legacy = os.path.join(directory, "master_enriched_lite.json")
+        split = os.path.join(directory, "master_enriched_lite_split.json")
+        write_lite_file(legacy, count, dimensions)
+        split_vector_file(legacy, split)
+
+        legacy_size = os.path.getsize(legacy) / 1e6
+        split_json_size = os.path.getsize(split) / 1e6
+        split_npy_size = os.path.getsize(vector_file_path(split)) / 1e6
+
+        legacy_time = time_load(legacy, repeats)
+        split_time = time_load(split, repeats)
+    finally:
+        shutil.rmtree(directory)
+
+    print(f"Chunks: {count}, dimensions: {dimensions}")
+    print(f"JSON with ada_v2 arrays   {legacy_size:8.1f} MB                         load {legacy_time:7.3f}s")
+    print(f"JSON + float32 .npy       {split_json_size + split_npy_size:8.1f} MB "
+          f"({split_json_size:.1f} MB + {split_npy_size:.1f} MB)  load {split_time:7.3f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark JSON embeddings against a .npy sidecar")
+    parser.add_argument("--chunks", type=int, default=5000, help="number of synthetic chunks")
+    parser.add_argument("--dimensions", type=int, default=1536, help="length of each embedding")
+    parser.add_argument("--repeats", type=int, default=3, help="loads to time, best is reported")
+    args = parser.parse_args()
+    run_benchmark(args.chunks, args.dimensions, args.repeats)
@@ -0,0 +1,120 @@
+""" A local stand-in for the Azure OpenAI chat and embeddings endpoints, with injected latency."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import json
+import hashlib
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+EMBEDDING_DIMENSIONS = 8
+
+def fake_embedding(text):
+    """A deterministic vector derived from the text, so runs can be compared byte for byte."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [digest[i] / 255.0 for i in range(EMBEDDING_DIMENSIONS)]
+
+def fake_summary(text):
+    """A deterministic summary derived from the text."""
+    return "Summary: " + " ".join(text.split()[:8])
+
+
+class MockOpenAiHandler(BaseHTTPRequestHandler):
+    """Answers /openai/deployments/<name>/chat/completions and /embeddings after sleeping for the server latency."""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length))
+
+        throttled = self.server.count_request()
+        time.sleep(self.server.latency)
+
+        if throttled:
+            data = json.dumps({"error": {"code": "429", "message": "Rate limit is exceeded."}}).encode("utf-8")
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("retry-after-ms", str(self.server.retryAfterMs))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        path = self.path.split("?")[0]
+        if path.endswith("/embeddings"):
+            inputs = request["input"]
+            body = {
+                "object": "list",
+                "model": request.get("model", ""),
+                "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(text)} for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}
+            }
+        elif path.endswith("/chat/completions"):
+            body = {
+                "id": "mock",
+                "object": "chat.completion",
+                "created": 0,
+                "model": request.get("model", ""),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": fake_summary(request["messages"][-1]["content"])},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            }
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in self.server.rateLimitHeaders.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockOpenAiServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the injected latency and a request count.
+    Set throttleNext to answer that many requests with 429 and retry-after-ms,
+    and rateLimitHeaders to add x-ratelimit-* headers to every success.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, latency : float) -> None:
+        super().__init__(("127.0.0.1", 0), MockOpenAiHandler)
+        self.latency = latency
+        self.requests = 0
+        self.throttleNext = 0
+        self.retryAfterMs = 0
+        self.rateLimitHeaders = {}
+        self.lock = threading.Lock()
+
+    def count_request(self):
+        """Counts a request, returning True if it should be throttled."""
+        with self.lock:
+            self.requests += 1
+            if self.throttleNext > 0:
+                self.throttleNext -= 1
+                return True
+            return False
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def start_mock_server(latency : float):
+    """Starts a MockOpenAiServer on a free local port in a background thread."""
+    server = MockOpenAiServer(latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,131 @@
+""" A local synthetic web site for crawler tests and benchmarks, with injected latency and connection tracking."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SITE_ROOT = "/site/"
+
+def page_path(page : int, fanout : int):
+    """The path of a page in a tree of pages, where page k's children are k * fanout + 1 .. k * fanout + fanout."""
+    if page == 0:
+        return SITE_ROOT
+    return page_path((page - 1) // fanout, fanout) + f"p{page}/"
+
+def page_html(page : int, pages : int, fanout : int, version : int = 0):
+    """A page linking to its children, its parent, the root, an anchor, an external site and a page in another branch."""
+    links = [page_path(child, fanout) for child in range(page * fanout + 1, min(pages, page * fanout + fanout + 1))]
+    links += [page_path((page - 1) // fanout, fanout) if page else SITE_ROOT, SITE_ROOT, "#top",
+              "https://example.com/elsewhere", page_path((page * 7919) % pages, fanout)]
+    anchors = "".join(f'<a href="{link}">link</a> ' for link in links)
+    text = f"Page {page} version {version} of the synthetic site. " + "Some words about machine learning and the page topic. " * 20
+    return f"<html><head><title>Page {page}</title></head><body><p>{text}</p>{anchors}</body></html>"
+
+
+class MockWebSiteHandler(BaseHTTPRequestHandler):
+    """
+    Serves the pages of the site over keep-alive HTTP/1.1 after sleeping for the server latency.
+    Each page has an ETag from its version, unless the site sends none, and If-None-Match with
+    the current ETag gets a 304, or a 503 error page while the site is failing revalidation.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.start_request(self.client_address)
+        try:
+            time.sleep(self.server.latency)
+            page = self.server.paths.get(self.path.split("?")[0])
+            if page is None:
+                self.send_error(404)
+                return
+
+            version = self.server.versions.get(page, 0)
+            etag = f'"{page}-{version}"'
+            if self.server.failRevalidation and self.headers.get("If-None-Match"):
+                data = ("<html><body><p>" + "Service unavailable, please try again later. " * 20 + "</p></body></html>").encode("utf-8")
+                self.send_response(503)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("ETag", '"error"')
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            if self.server.etags and self.headers.get("If-None-Match") == etag:
+                self.server.count_not_modified()
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            data = page_html(page, self.server.pages, self.server.fanout, version).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            if self.server.etags:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            self.server.end_request()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockWebSite(ThreadingHTTPServer):
+    """
+    Threaded HTTP server for a tree of `pages` pages with `fanout` children each. Counts requests,
+    304 answers, the most requests ever in flight at once, and the distinct client connections used.
+    Bump a page's entry in versions to change its content and ETag, clear etags to send no validators,
+    or set failRevalidation to answer every conditional request with a 503.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, pages : int, fanout : int, latency : float, etags : bool = True) -> None:
+        super().__init__(("127.0.0.1", 0), MockWebSiteHandler)
+        self.pages = pages
+        self.fanout = fanout
+        self.latency = latency
+        self.etags = etags
+        self.failRevalidation = False
+        self.paths = {page_path(page, fanout): page for page in range(pages)}
+        self.versions = {}
+        self.requests = 0
+        self.notModified = 0
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    def start_request(self, clientAddress):
+        with self.lock:
+            self.requests += 1
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+            self.connections.add(clientAddress)
+
+    def count_not_modified(self):
+        with self.lock:
+            self.notModified += 1
+
+    def end_request(self):
+        with self.lock:
+            self.inFlight -= 1
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}{SITE_ROOT}"
+
+
+def start_mock_web_site(pages : int, fanout : int, latency : float = 0, etags : bool = True):
+    """Starts a MockWebSite on a free local port in a background thread."""
+    server = MockWebSite(pages, fanout, latency, etags)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,131 @@
+""" Stand-ins for YouTubeTranscriptApi and the YouTube Data API client, with injected latency and failures, for transcript download tests and benchmarks."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import threading
+import time
+
+# Third-Party Packages
+from youtube_transcript_api import NoTranscriptFound, TooManyRequests
+
+
+def video_id(playlist : int, video : int):
+    return f"pl{playlist}v{video:03d}"
+
+
+def playlist_item(playlistId : str, videoId : str):
+    """A playlistItems resource with the snippet fields download_transcripts reads."""
+    return {"snippet": {"title": f"Video {videoId}", "description": f"About {videoId}", "playlistId": playlistId,
+                        "resourceId": {"videoId": videoId}}}
+
+
+class MockTranscriptApi:
+    """
+    Answers get_transcript after sleeping for latency, like YouTubeTranscriptApi. Videos in throttled
+    answer TooManyRequests for their first throttleCount calls, and videos in missing have no transcript.
+    Counts calls per video and the most calls in flight at once.
+    """
+
+    def __init__(self, latency : float, throttled=(), throttleCount : int = 1, missing=()) -> None:
+        self.latency = latency
+        self.throttled = set(throttled)
+        self.throttleCount = throttleCount
+        self.missing = set(missing)
+        self.calls = {}
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.lock = threading.Lock()
+
+    def get_transcript(self, videoId : str):
+        with self.lock:
+            self.calls[videoId] = self.calls.get(videoId, 0) + 1
+            calls = self.calls[videoId]
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+        try:
+            time.sleep(self.latency)
+            if videoId in self.missing:
+                raise NoTranscriptFound(videoId, ["en"], None)
+            if videoId in self.throttled and calls <= self.throttleCount:
+                raise TooManyRequests(videoId)
+            return [{"text": f"Segment {i} of\n{videoId}", "start": i * 4.0, "duration": 4.0} for i in range(20)]
+        finally:
+            with self.lock:
+                self.inFlight -= 1
+
+
+class MockRequest:
+    def __init__(self, response : dict, latency : float) -> None:
+        self.response = response
+        self.latency = latency
+
+    def execute(self):
+        time.sleep(self.latency)
+        return self.response
+
+
+class MockPlaylistItems:
+    def __init__(self, youtube) -> None:
+        self.youtube = youtube
+
+    def list(self, part, playlistId, maxResults, pageToken=None):
+        items = self.youtube.playlists[playlistId]
+        begin = int(pageToken or 0)
+        end = begin + maxResults
+        response = {"items": items[begin:end]}
+        if end < len(items):
+            response["nextPageToken"] = str(end)
+        return MockRequest(response, self.youtube.latency)
+
+
+class MockVideos:
+    def __init__(self, youtube) -> None:
+        self.youtube = youtube
+
+    def list(self, part, id, maxResults=None):
+        ids = id.split(",")
+        assert len(ids) <= 50, "videos.list takes at most 50 ids"
+        self.youtube.videoRequests.append(ids)
+        items = [self.youtube.video_item(videoId, part) for videoId in ids if videoId not in self.youtube.deleted]
+        return MockRequest({"items": items}, self.youtube.latency)
+
+
+class MockYouTube:
+    """
+    Stands in for googleapiclient.discovery.build("youtube", "v3"), serving playlistItems().list from
+    playlists: id -> items, and videos().list for any video not in deleted. A video's view count, and
+    so its etag, goes up with views[videoId]. Records the ids asked for in each videos.list call.
+    """
+
+    def __init__(self, playlists : dict, latency : float = 0, deleted=()) -> None:
+        self.playlists = playlists
+        self.latency = latency
+        self.deleted = set(deleted)
+        self.views = {}
+        self.videoRequests = []
+
+    def playlistItems(self):
+        return MockPlaylistItems(self)
+
+    def videos(self):
+        return MockVideos(self)
+
+    def video_item(self, videoId : str, part : str):
+        views = self.views.get(videoId, 100)
+        item = {"kind": "youtube#video", "etag": f"{videoId}-{views}", "id": videoId}
+        if "contentDetails" in part:
+            item["contentDetails"] = {"duration": f"PT1H{len(videoId)}M5S", "caption": "true"}
+        if "statistics" in part:
+            item["statistics"] = {"viewCount": str(views), "likeCount": "7", "commentCount": "2"}
+        return item
+
+
+def mock_playlists(playlists : int, videos : int, shared : int = 0):
+    """playlists playlists of videos videos each; the last shared videos of each playlist are also in the next one."""
+    result = {}
+    for playlist in range(playlists):
+        items = [playlist_item(f"PL{playlist}", video_id(playlist, video)) for video in range(videos)]
+        if playlist > 0 and shared:
+            items += [playlist_item(f"PL{playlist}", video_id(playlist - 1, video)) for video in range(videos - shared, videos)]
+        result[f"PL{playlist}"] = items
+    return result
@@ -29,11 +29,49 @@ class ApiConfiguration:
         self.modelName="gpt-35-turbo-16k"
         self.embedModelName="text-embedding-ada-002"
         self.processingThreads = 1
+        self.asyncMode = False          # Use AsyncAzureOpenAI with up to maxConcurrentRequests in flight instead of threads
+        self.maxConcurrentRequests = 64
         self.openAiRequestTimeout = 60
+        self.chatRequestsPerMinute = 1440  # Quota of the chat deployment, Azure default is 240K TPM and 6 RPM per 1K TPM. 0 turns the limit off
+        self.chatTokensPerMinute = 240000
+        self.embedRequestsPerMinute = 1440 # Quota of the embedding deployment
+        self.embedTokensPerMinute = 240000
         self.summaryWordCount = 50      # 50 word summary
         self.chunkDurationMins = 10     # 10 minute long video clips
         self.maxTokens = 4096           # Upper limit on total tokens in an API call. 10 minutes of video = 600 words = 2400 tokens, plus approx 2x headroom
         self.discardIfBelow = 100       # Dont index if less than 100 tokens in an article
+        self.embeddingBatchSize = 64    # Max number of chunks sent in one embeddings call
+        self.embeddingBatchTokens = 32000 # Max total tokens across all chunks in one embeddings call
+        self.embeddingCacheFile = os.path.join("data", "cache", "embeddings.sqlite") # Set to "" to turn the cache off
+        self.embeddingCacheMaxEntries = 100000 # Approx 12KB per ada_v2 vector, so about 1.2GB on disk
+        self.summaryCacheFile = os.path.join("data", "cache", "summaries.sqlite") # Set to "" to turn the cache off
+        self.summaryCacheMaxEntries = 500000
+        self.chunkFileFormat = "json"   # "json" for one list per master_*.json file, "jsonl" for one chunk per line, streamed
+        self.chunkWindow = 1000         # Chunks each stage holds in memory at once
+        self.liteVectorFormat = "json"  # "npy" moves ada_v2 out of master_enriched_lite into a float32 master_enriched_lite.npy
+        self.buildAnnIndex = False      # Build master_enriched.ivf.npz for approximate search after the embedding stage
+        self.annLists = 0               # IVF lists, 0 picks about 4 * sqrt(chunks)
+        self.annProbe = 16              # Lists searched per query by default; more is slower but finds more of the true top k
+        self.crawlThreads = 8           # Threads fetching web pages in download_html
+        self.crawlConnectionsPerHost = 8 # Keep-alive connections pooled per host
+        self.crawlRequestsPerHost = 4   # Requests in flight to any one host, to stay polite
+        self.crawlRequestTimeout = 30   # Seconds before a page fetch is abandoned
+        self.crawlPageMemoryBytes = 64 * 1024 * 1024 # Page bodies kept in memory between link discovery and text extraction, the rest spill to a temp directory
+        self.crawlRevalidate = True     # Re-crawls ask for pages already downloaded with If-None-Match / If-Modified-Since, rather than skipping them; pages sent without either are still skipped
+        self.htmlExtractor = "legacy"   # "selectolax", "lxml" or "html.parser" keep a page's main content without nav, script, style and footer; "auto" picks the fastest installed, "legacy" takes the whole page's text
+        self.chunkingProcesses = 0      # Worker processes chunking documents in enrich_text_chunks, 0 or 1 chunks in the main process
+        self.chunkingMode = "segments"  # "sections" chunks Markdown at its headings, packing whole sections up to the token budget; "segments" chunks the flattened text
+        self.markdownProcesses = 0      # Worker processes converting Markdown in download_markdown, 0 or 1 converts in the main process
+        self.outputLayout = "flat"      # How downloaders name output files: "flat" after the file or URL in one directory, "sharded" by hash of the sourceId in ab/cd/ subdirectories listed in documents.sqlite, "packed" as rows of store.sqlite with segments in pack files
+        self.markdownIncremental = False # Convert only the Markdown files whose git blob SHA changed since the last run, and delete the output of removed files
+        self.transcriptThreads = 8      # Threads downloading YouTube transcripts, shared by every playlist
+        self.transcriptRequestsPerMinute = 600 # Limit on transcript requests to YouTube, shared by every thread. 0 turns the limit off
+        self.youTubeApiRequestsPerMinute = 600 # Limit on YouTube Data API requests
+        self.transcriptAttempts = 4     # Tries at a YouTube call that fails with throttling, a server error or a dropped connection
+        self.transcriptRetryMaxSeconds = 30 # Longest random exponential wait between those tries
+        self.videoMetadataCacheFile = os.path.join("data", "cache", "videos.sqlite") # videos.list items by video id. Set to "" to turn the cache off
+        self.videoMetadataCacheMaxEntries = 100000
+        self.videoMetadataMaxAgeDays = 7 # Cached video statistics older than this are fetched again
 
     apiType: str
     apiKey: str
@@ -44,11 +82,49 @@ class ApiConfiguration:
     modelName: str
     embedModelName: str
     processingThreads: int
+    asyncMode: bool
+    maxConcurrentRequests: int
     openAiRequestTimeout: int
+    chatRequestsPerMinute: int
+    chatTokensPerMinute: int
+    embedRequestsPerMinute: int
+    embedTokensPerMinute: int
     summaryWordCount: int
     chunkDurationMins: int
     maxTokens: int
     discardIfBelow: int 
+    embeddingBatchSize: int
+    embeddingBatchTokens: int
+    embeddingCacheFile: str
+    embeddingCacheMaxEntries: int
+    summaryCacheFile: str
+    summaryCacheMaxEntries: int
+    chunkFileFormat: str
+    chunkWindow: int
+    liteVectorFormat: str
+    buildAnnIndex: bool
+    annLists: int
+    annProbe: int
+    crawlThreads: int
+    crawlConnectionsPerHost: int
+    crawlRequestsPerHost: int
+    crawlRequestTimeout: float
+    crawlPageMemoryBytes: int
+    crawlRevalidate: bool
+    htmlExtractor: str
+    chunkingProcesses: int
+    chunkingMode: str
+    markdownProcesses: int
+    markdownIncremental: bool
+    outputLayout: str
+    transcriptThreads: int
+    transcriptRequestsPerMinute: int
+    youTubeApiRequestsPerMinute: int
+    transcriptAttempts: int
+    transcriptRetryMaxSeconds: float
+    videoMetadataCacheFile: str
+    videoMetadataCacheMaxEntries: int
+    videoMetadataMaxAgeDays: float
 
 
 
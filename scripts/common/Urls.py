@@ -3,6 +3,9 @@ import os
 import json
 import logging
 
+# Local Modules
+from common.chunk_store import read_chunks
+
 logging.basicConfig(level=logging.INFO)
 
 youTubeUrls = [  
@@ -76,28 +79,18 @@ def countUrlHits(destinationDir, urls, input_filename, output_filename):
         logger.error("Output folder not provided")
         exit(1)
 
-    chunks = []
     total_chunks = 0
 
     logger.debug("Starting hit counting")
 
-    # Load the chunks from a JSON file
+    # Stream the chunks from a JSON or JSONL file
     input_file = os.path.join(destinationDir, input_filename)  # Adjusted input_file path
 
     logger.debug("Input file path: %s", input_file)
 
-    try:
-        with open(input_file, "r", encoding="utf-8") as f:
-            chunks = json.load(f)
-    except FileNotFoundError:
+    if not os.path.isfile(input_file):
         logger.error("Input file '%s' not found", input_file)
         exit(1)
-    except Exception as e:
-        logger.error("Error loading JSON file: %s", str(e))
-        exit(1)
-
-    total_chunks = len(chunks)
-    logger.debug("Total chunks to be processed: %s", total_chunks)
 
     # Build an empty array to accumulate hits
     hits = [None] * len(urls)
@@ -109,25 +102,32 @@ def countUrlHits(destinationDir, urls, input_filename, output_filename):
         hits[i] = hit
 
     # Iterate through chunks accumulating hit count
-    for chunk in chunks:
-        haveHit = False
-        haveAda = False
-
-        ada = chunk.get('hitTrackingId')
-        if (len(ada) > 0):
-            haveAda = True
-
-        for hit in hits:
-            source = chunk.get('hitTrackingId')
-            if source in hit.path:
-                hit.hits += 1
-                haveHit = True
-
-        #if not haveHit:
-            #raise AssertionError('All chunks should have a hit: ' + chunk.get('sourceId'))
+    try:
+        for chunk in read_chunks(input_file):
+            total_chunks += 1
+            haveHit = False
+            haveAda = False
+
+            ada = chunk.get('hitTrackingId')
+            if (len(ada) > 0):
+                haveAda = True
+
+            for hit in hits:
+                source = chunk.get('hitTrackingId')
+                if source in hit.path:
+                    hit.hits += 1
+                    haveHit = True
+
+            #if not haveHit:
+                #raise AssertionError('All chunks should have a hit: ' + chunk.get('sourceId'))
+
+            #if not haveAda:
+                #raise AssertionError('All chunks should have an ada')
+    except ValueError as e:
+        logger.error("Error loading JSON file: %s", str(e))
+        exit(1)
 
-        #if not haveAda:
-            #raise AssertionError('All chunks should have an ada')
+    logger.debug("Total chunks processed: %s", total_chunks)
 
     # Print the results
     for hit in hits:
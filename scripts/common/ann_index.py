@@ -0,0 +1,169 @@
+""" Approximate nearest neighbour search over chunk embeddings with an inverted file (IVF-flat) index in pure NumPy."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard library imports
+import os
+import math
+
+# Third-Party Packages
+import numpy as np
+
+# Local Modules
+from common.retrieval import normalize_rows, top_k
+from common.chunk_store import read_chunks, hash_chunk_key
+from common.common_functions import make_chunk_key
+
+# k-means is trained on a sample of this many points per list, which is plenty to place the centroids
+TRAINING_POINTS_PER_LIST = 64
+# Rows assigned to lists at a time, which bounds the scores matrix during build
+ASSIGN_BLOCK = 4096
+
+def chunk_keys(chunks):
+    """The hash_chunk_key of each chunk's make_chunk_key, as one row of bytes per chunk."""
+    digests = b"".join(hash_chunk_key(make_chunk_key(chunk)) for chunk in chunks)
+    return np.frombuffer(digests, dtype=np.uint8).reshape(-1, 20)
+
+
+def default_list_count(rows : int):
+    """About 4 * sqrt(rows) lists, the usual starting point for IVF."""
+    return max(1, min(rows, int(4 * math.sqrt(rows))))
+
+
+def assign_lists(vectors, centroids):
+    """Returns the index of the nearest centroid, by cosine similarity, for each row of vectors."""
+    assignments = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], ASSIGN_BLOCK):
+        block = vectors[start:start + ASSIGN_BLOCK]
+        assignments[start:start + ASSIGN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(vectors, lists : int, iterations : int, rng):
+    """Spherical k-means on a sample of the normalised vectors."""
+    sampleSize = min(vectors.shape[0], lists * TRAINING_POINTS_PER_LIST)
+    sample = vectors[np.sort(rng.choice(vectors.shape[0], sampleSize, replace=False))]
+    centroids = sample[rng.choice(sampleSize, lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=lists)
+
+        # A list that lost all its points is restarted on a random point
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = sample[rng.choice(sampleSize, len(empty))]
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+
+class IvfIndex:
+    """
+    Splits the embeddings into lists around k-means centroids. A query is scored against
+    the centroids, then exhaustively against the vectors in its nearest probe lists only,
+    so search reads about probe / lists of the corpus.
+
+    Vectors are stored normalised and grouped by list, so each list is one contiguous block.
+    Hits are (row, score) pairs like EmbeddingIndex, where row is the vector's row in the
+    matrix the index was built from. keys, if given, holds the chunk_keys of those rows, so
+    a saved index can be checked against the chunks it is used with.
+    """
+
+    def __init__(self, centroids, offsets, rows, vectors, probe : int, keys=None) -> None:
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.vectors = vectors
+        self.probe = probe
+        self.keys = keys
+
+    probe: int
+
+    @classmethod
+    def build(cls, matrix, lists : int = 0, probe : int = 16, iterations : int = 10, seed : int = 42, keys=None):
+        """Trains the centroids and groups matrix's rows by list. lists=0 picks default_list_count."""
+        vectors = normalize_rows(matrix)
+        lists = lists or default_list_count(vectors.shape[0])
+        lists = max(1, min(lists, vectors.shape[0]))
+
+        centroids = train_centroids(vectors, lists, iterations, np.random.default_rng(seed))
+        assignments = assign_lists(vectors, centroids)
+
+        rows = np.argsort(assignments, kind="stable")
+        offsets = np.zeros(lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=lists))
+
+        return cls(centroids, offsets, rows, vectors[rows], probe, keys)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def search(self, query, k : int, probe : int = 0):
+        """Returns about the k best hits for one query embedding, best first."""
+        return self.search_batch([query], k, probe)[0]
+
+    def search_batch(self, queries, k : int, probe : int = 0):
+        """Returns about the k best hits for each of a list of query embeddings, best first."""
+        queries = normalize_rows(queries)
+        probe = min(probe or self.probe, self.centroids.shape[0])
+        nearest, _ = top_k(queries @ self.centroids.T, probe)
+
+        results = []
+        for query, lists in zip(queries, nearest):
+            # Score each probed list as a contiguous slice, without copying its vectors
+            spans = [(self.offsets[i], self.offsets[i + 1]) for i in lists]
+            scores = np.concatenate([self.vectors[start:end] @ query for start, end in spans])
+            positions = np.concatenate([np.arange(start, end) for start, end in spans])
+            best, values = top_k(scores[np.newaxis, :], k)
+            results.append(list(zip(self.rows[positions[best[0]]].tolist(), values[0].tolist())))
+
+        return results
+
+    def save(self, path : str):
+        arrays = {"keys": self.keys} if self.keys is not None else {}
+        np.savez(path, centroids=self.centroids, offsets=self.offsets, rows=self.rows,
+                 vectors=self.vectors, probe=np.array(self.probe), **arrays)
+
+    @classmethod
+    def load(cls, path : str, keys=None):
+        """Loads a saved index. If keys is given, raises ValueError unless the index was built from rows with those chunk_keys."""
+        with np.load(path) as data:
+            stored = data["keys"] if "keys" in data.files else None
+            if keys is not None and (stored is None or not np.array_equal(stored, keys)):
+                raise ValueError(f"{path} was not built from these chunks, rebuild it")
+            return cls(data["centroids"], data["offsets"], data["rows"], data["vectors"], int(data["probe"]), stored)
+
+
+def ann_index_path(chunkPath : str):
+    """Returns the index path that goes with a chunk file, e.g. master_enriched.json -> master_enriched.ivf.npz."""
+    return os.path.splitext(chunkPath)[0] + ".ivf.npz"
+
+
+def build_ann_index_file(chunkPath : str, lists : int = 0, probe : int = 16):
+    """
+    Builds an IvfIndex over the ada_v2 embeddings in a chunk file and saves it beside it, with
+    the chunk_keys of the chunks. Hit rows are positions in the chunk file, counting only chunks
+    that have an embedding.
+    """
+    chunks = []
+    vectors = []
+    for chunk in read_chunks(chunkPath):
+        if chunk.get("ada_v2"):
+            vectors.append(np.asarray(chunk.pop("ada_v2"), dtype=np.float32))
+            chunks.append(chunk)
+    if not vectors:
+        return None
+
+    index = IvfIndex.build(np.stack(vectors), lists, probe, keys=chunk_keys(chunks))
+    index.save(ann_index_path(chunkPath))
+    return index
+
+
+def load_ann_index_file(chunkPath : str):
+    """
+    Loads the IvfIndex saved beside a chunk file, checking it was built from the chunks now in the
+    file, in the same order, so its hit rows still name the same chunks. Raises ValueError if not.
+    """
+    keys = chunk_keys(chunk for chunk in read_chunks(chunkPath) if chunk.get("ada_v2"))
+    return IvfIndex.load(ann_index_path(chunkPath), keys)
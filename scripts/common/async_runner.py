@@ -0,0 +1,29 @@
+""" Runs enrichment work on an asyncio event loop with a bounded number of requests in flight."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard library imports
+import asyncio
+
+def run_async(make_client, worker, items, concurrency : int):
+    """
+    Calls worker(client, item) for every item, with at most concurrency calls in flight.
+
+    make_client is called inside the event loop so the client's connection pool belongs
+    to that loop, and the client is closed once every item is done. Workers store their
+    results on the item itself, so callers read results back in their own order.
+    """
+
+    async def run_all():
+        client = make_client()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(item):
+            async with semaphore:
+                await worker(client, item)
+
+        try:
+            await asyncio.gather(*(run_one(item) for item in items))
+        finally:
+            await client.close()
+
+    asyncio.run(run_all())
@@ -0,0 +1,185 @@
+""" Reads and writes the master_*.json chunk files, either as one JSON list or as JSONL with one chunk per line."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory to convert between formats:
+#    python -m common.chunk_store data/web/output/master_enriched.json data/web/output/master_enriched.jsonl
+
+# Standard library imports
+import os
+import json
+import hashlib
+import argparse
+import threading
+from itertools import islice
+
+from common.ApiConfiguration import ApiConfiguration
+
+JSONL_EXTENSION = ".jsonl"
+
+def chunk_file_name(name : str, config : ApiConfiguration):
+    """Returns the file name for a master chunk file, e.g. master_text.json or master_text.jsonl, as set by config.chunkFileFormat."""
+    if config.chunkFileFormat == "jsonl":
+        return name + JSONL_EXTENSION
+    return name + ".json"
+
+
+def is_jsonl(path : str):
+    return path.endswith(JSONL_EXTENSION)
+
+
+def read_chunks(path : str):
+    """
+    Yields the chunks in a chunk file in file order.
+    A JSONL file is read a line at a time; a legacy JSON file has to be loaded whole.
+    """
+    if is_jsonl(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        yield from chunks
+
+
+def read_chunk_windows(path : str, size : int):
+    """Yields the chunks in a chunk file as lists of up to size chunks."""
+    chunks = read_chunks(path)
+    while True:
+        window = list(islice(chunks, size))
+        if not window:
+            return
+        yield window
+
+
+def count_chunks(path : str):
+    """Counts the chunks in a chunk file, without keeping them if it is JSONL."""
+    if is_jsonl(path):
+        with open(path, "rb") as f:
+            return sum(1 for line in f if line.strip())
+    with open(path, "r", encoding="utf-8") as f:
+        return len(json.load(f))
+
+
+class ChunkWriter:
+    """
+    Writes chunks to a chunk file as they are produced.
+
+    A JSONL file gets each chunk as soon as write is called. A legacy JSON file has to be
+    written as one list, so chunks are held until close, sorted by sortKey if given, and
+    dumped with the same layout the stages have always used. Either way the file is written
+    under a temporary name and only replaces path on close, so a stage can read its old
+    output while it writes the new one, and a failed run leaves the old output in place.
+    """
+
+    def __init__(self, path : str, sortKey=None, indent=4, ensureAscii=False) -> None:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.sortKey = sortKey
+        self.indent = indent
+        self.ensureAscii = ensureAscii
+        self.count = 0
+        self.buffered = []
+        self.temporaryPath = path + ".tmp"
+        self.file = open(self.temporaryPath, "w", encoding="utf-8")
+
+    path: str
+    indent: int
+    ensureAscii: bool
+    count: int
+    temporaryPath: str
+
+    def write(self, chunk : dict):
+        self.count += 1
+        if is_jsonl(self.path):
+            self.file.write(json.dumps(chunk, ensure_ascii=self.ensureAscii))
+            self.file.write("\n")
+        else:
+            self.buffered.append(chunk.copy())
+
+    def close(self):
+        """Finishes the file and moves it into place."""
+        if not is_jsonl(self.path):
+            if self.sortKey:
+                self.buffered.sort(key=self.sortKey)
+            json.dump(self.buffered, self.file, ensure_ascii=self.ensureAscii, indent=self.indent)
+            self.buffered = []
+        self.file.close()
+        os.replace(self.temporaryPath, self.path)
+
+    def abandon(self):
+        """Throws the partly written file away, leaving any previous file at path untouched."""
+        self.file.close()
+        os.remove(self.temporaryPath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abandon()
+
+
+def hash_chunk_key(key : tuple):
+    # A 20 byte digest keeps the index small however long the sourceIds are
+    return hashlib.sha1(repr(key).encode("utf-8")).digest()
+
+
+class ChunkFileIndex:
+    """
+    Resume index over a JSONL chunk file that holds file offsets rather than chunks.
+
+    Behaves like the dict from build_chunk_index: get(key) returns the first chunk with that
+    make_chunk_key that has both a summary and an embedding, read back from disk on demand.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path : str, make_key) -> None:
+        self.offsets = {}
+        self.lock = threading.Lock()
+        self.file = open(path, "rb")
+
+        offset = 0
+        for line in self.file:
+            if line.strip():
+                chunk = json.loads(line)
+                if chunk.get("summary") and chunk.get("ada_v2"):
+                    self.offsets.setdefault(hash_chunk_key(make_key(chunk)), offset)
+            offset += len(line)
+
+    def get(self, key : tuple):
+        offset = self.offsets.get(hash_chunk_key(key))
+        if offset is None:
+            return None
+        with self.lock:
+            self.file.seek(offset)
+            line = self.file.readline()
+        return json.loads(line)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def close(self):
+        self.file.close()
+
+
+def convert_chunk_file(inputPath : str, outputPath : str):
+    """Converts a chunk file between the legacy JSON and the JSONL formats, keeping the chunk order."""
+    with ChunkWriter(outputPath) as writer:
+        for chunk in read_chunks(inputPath):
+            writer.write(chunk)
+    return writer.count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a chunk file between JSON and JSONL, by file extension")
+    parser.add_argument("input", help="chunk file to read, .json or .jsonl")
+    parser.add_argument("output", help="chunk file to write, .json or .jsonl")
+    args = parser.parse_args()
+    print(f"Converted {convert_chunk_file(args.input, args.output)} chunks")
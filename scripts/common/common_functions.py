@@ -1,11 +1,32 @@
 # Standard library imports
 import os
-from openai import AzureOpenAI
+import json
+import hashlib
+import threading
+from array import array
+from contextlib import contextmanager
+from openai import AzureOpenAI, AsyncAzureOpenAI
+import tiktoken
 
 from common.ApiConfiguration import ApiConfiguration
+from common.content_cache import ContentCache, make_cache_key
+from common.rate_limiter import RateLimiter, create_with_limit, create_with_limit_async
+from common.chunk_store import ChunkFileIndex, is_jsonl
 
 config = ApiConfiguration()
 
+# Caches are shared by every thread and stage in the process, keyed by file path
+open_caches = {}
+open_caches_lock = threading.Lock()
+
+# Rate limiters are shared by every thread and stage in the process, keyed by deployment,
+# because Azure quotas apply per deployment
+open_limiters = {}
+open_limiters_lock = threading.Lock()
+
+# Loaded on first use, so importing this module does not need the tiktoken download
+tokenizer = None
+
 def ensure_directory_exists(directory):
     """
     Checks if the directory at the given destination exists.
@@ -26,13 +47,296 @@ def ensure_directory_exists(directory):
 HTML_DESTINATION_DIR = os.path.join("data", "web")
 ensure_directory_exists(HTML_DESTINATION_DIR)
 
+def open_cache(path : str, maxEntries : int):
+   """
+   Returns the shared cache stored at path, opening it on first use.
+   Returns None if path is empty, which turns the cache off.
+   """
+
+   if not path:
+      return None
+
+   with open_caches_lock:
+      cache = open_caches.get(path)
+      if cache is None:
+         cache = ContentCache(path, maxEntries)
+         open_caches[path] = cache
+
+   return cache
+
+
+def open_embedding_cache(config : ApiConfiguration):
+   """Returns the shared embedding cache named in config, or None if it is turned off."""
+
+   return open_cache(config.embeddingCacheFile, config.embeddingCacheMaxEntries)
+
+
+def open_summary_cache(config : ApiConfiguration):
+   """Returns the shared summary cache named in config, or None if it is turned off."""
+
+   return open_cache(config.summaryCacheFile, config.summaryCacheMaxEntries)
+
+
+def make_summary_key(text : str, systemPrompt : str, temperature : float, config : ApiConfiguration):
+   """
+   Keys a summary on everything that shapes it: the chunk text, the system prompt,
+   the requested word count, the chat deployment and the temperature.
+   """
+
+   return make_cache_key(text, systemPrompt, config.summaryWordCount, config.azureDeploymentName, temperature)
+
+
+def make_embedding_key(text : str, config : ApiConfiguration):
+   """
+   Keys an embedding on the whitespace-normalised text and the embedding deployment,
+   so the same text re-cut into a different chunk still finds its vector.
+   """
+
+   return make_cache_key(" ".join(text.split()), config.azureEmbedDeploymentName)
+
+
+def open_rate_limiter(deployment : str, requestsPerMinute : int, tokensPerMinute : int):
+   """
+   Returns the shared rate limiter for a deployment, creating it on first use.
+   Returns None if both limits are 0, which turns rate limiting off.
+   """
+
+   if not requestsPerMinute and not tokensPerMinute:
+      return None
+
+   with open_limiters_lock:
+      limiter = open_limiters.get(deployment)
+      if limiter is None:
+         limiter = RateLimiter(requestsPerMinute, tokensPerMinute)
+         open_limiters[deployment] = limiter
+
+   return limiter
+
+
+def open_chat_limiter(config : ApiConfiguration):
+   """Returns the shared rate limiter for the chat deployment, or None if it is turned off."""
+
+   return open_rate_limiter(config.azureDeploymentName, config.chatRequestsPerMinute, config.chatTokensPerMinute)
+
+
+def open_embed_limiter(config : ApiConfiguration):
+   """Returns the shared rate limiter for the embedding deployment, or None if it is turned off."""
+
+   return open_rate_limiter(config.azureEmbedDeploymentName, config.embedRequestsPerMinute, config.embedTokensPerMinute)
+
+
+def count_tokens(text : str):
+
+   global tokenizer
+   if tokenizer is None:
+      tokenizer = tiktoken.get_encoding("cl100k_base")
+   return len(tokenizer.encode(text, disallowed_special=()))
+
+
+def estimate_chat_tokens(messages : list, maxTokens : int):
+   """
+   Estimates the tokens a chat call counts against the quota. Azure counts max_tokens
+   up front, as well as the prompt, so we do the same.
+   """
+
+   # Roughly 4 tokens of framing per message
+   return sum(count_tokens(message["content"]) + 4 for message in messages) + maxTokens
+
+
+def create_chat_completion(client : AzureOpenAI, config : ApiConfiguration, **kwargs):
+   """Calls chat.completions.create through the chat deployment's rate limiter."""
+
+   limiter = open_chat_limiter(config)
+   tokens = estimate_chat_tokens(kwargs["messages"], kwargs.get("max_tokens") or 0) if limiter else 0
+   return create_with_limit(limiter, client.chat.completions, tokens, **kwargs)
+
+
+async def create_chat_completion_async(client : AsyncAzureOpenAI, config : ApiConfiguration, **kwargs):
+   """Async version of create_chat_completion."""
+
+   limiter = open_chat_limiter(config)
+   tokens = estimate_chat_tokens(kwargs["messages"], kwargs.get("max_tokens") or 0) if limiter else 0
+   return await create_with_limit_async(limiter, client.chat.completions, tokens, **kwargs)
+
+
+def encode_embedding(embedding : list):
+   # Stored as float64 so vectors come back exactly as the API returned them
+   return array("d", embedding).tobytes()
+
+
+def decode_embedding(value : bytes):
+   embedding = array("d")
+   embedding.frombytes(value)
+   return embedding.tolist()
+
+
+def lookup_cached_embeddings(inputs : list, config : ApiConfiguration):
+   """
+   Returns the cached vector for each input, or None where there is none, plus the cache keys.
+   The keys are None if the cache is turned off.
+   """
+
+   embeddings = [None] * len(inputs)
+   keys = None
+
+   cache = open_embedding_cache(config)
+   if cache:
+      keys = [make_embedding_key(text, config) for text in inputs]
+      for i, key in enumerate(keys):
+         cached = cache.get(key)
+         if cached is not None:
+            embeddings[i] = decode_embedding(cached)
+
+   return embeddings, keys
+
+
+def store_embeddings(response, missing : list, embeddings : list, keys : list, config : ApiConfiguration):
+   """
+   Places each vector in an embeddings response at the position given by its index,
+   and adds it to the cache.
+   """
+
+   cache = open_embedding_cache(config)
+   for item in response.data:
+      position = missing[item.index]
+      embeddings[position] = item.embedding
+      if cache:
+         cache.put(keys[position], encode_embedding(item.embedding))
+
+
 def get_embedding(text : str, client : AzureOpenAI, config : ApiConfiguration):
 
-   text = text.replace("\n", " ")
-   response = client.embeddings.create(input = [text], 
-                                   model=config.azureEmbedDeploymentName,
-                                   timeout=config.openAiRequestTimeout)
-   
-   return response.data[0].embedding
+   return get_embeddings([text], client, config)[0]
+
+
+def get_embeddings(texts : list, client : AzureOpenAI, config : ApiConfiguration):
+   """
+   Gets embeddings for a list of texts in a single API call.
+
+   Texts already in the embedding cache are not sent. The service may return the
+   vectors in any order, so each one is placed back at the position given by its index.
+   """
+
+   inputs = [text.replace("\n", " ") for text in texts]
+   embeddings, keys = lookup_cached_embeddings(inputs, config)
+
+   missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+   if not missing:
+      return embeddings
+
+   request = [inputs[i] for i in missing]
+   limiter = open_embed_limiter(config)
+   tokens = sum(count_tokens(text) for text in request) if limiter else 0
+   response = create_with_limit(limiter, client.embeddings, tokens,
+                                input = request, 
+                                model=config.azureEmbedDeploymentName,
+                                timeout=config.openAiRequestTimeout)
+   store_embeddings(response, missing, embeddings, keys, config)
+
+   return embeddings
+
+
+async def get_embedding_async(text : str, client : AsyncAzureOpenAI, config : ApiConfiguration):
+
+   embeddings = await get_embeddings_async([text], client, config)
+   return embeddings[0]
+
+
+async def get_embeddings_async(texts : list, client : AsyncAzureOpenAI, config : ApiConfiguration):
+   """Async version of get_embeddings, for use with AsyncAzureOpenAI."""
+
+   inputs = [text.replace("\n", " ") for text in texts]
+   embeddings, keys = lookup_cached_embeddings(inputs, config)
+
+   missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+   if not missing:
+      return embeddings
+
+   request = [inputs[i] for i in missing]
+   limiter = open_embed_limiter(config)
+   tokens = sum(count_tokens(text) for text in request) if limiter else 0
+   response = await create_with_limit_async(limiter, client.embeddings, tokens,
+                                            input = request, 
+                                            model=config.azureEmbedDeploymentName,
+                                            timeout=config.openAiRequestTimeout)
+   store_embeddings(response, missing, embeddings, keys, config)
+
+   return embeddings
+
+
+def make_async_client(config : ApiConfiguration):
+   """Creates the async client used when config.asyncMode is set."""
+
+   return AsyncAzureOpenAI(
+      azure_endpoint = config.resourceEndpoint, 
+      api_key=config.apiKey,  
+      api_version=config.apiVersion,
+      max_retries=0  # tenacity retries instead, so every 429 reaches the rate limiter
+   )
+
+
+def make_chunk_key(chunk : dict):
+   """
+   Builds a stable identity for a chunk from its sourceId, its start and a hash of its text.
+
+   Many chunks share a sourceId (every clip of one video, every window of one web page),
+   so the sourceId alone does not identify a chunk.
+   """
+
+   text = chunk.get("text") or ""
+   digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+   return (chunk.get("sourceId"), chunk.get("start"), digest)
+
+
+def build_chunk_index(chunks : list):
+   """
+   Indexes previously enriched chunks that have both a summary and an embedding by make_chunk_key.
+
+   The index is built once when a stage loads its cache, so looking up each new chunk is O(1)
+   rather than a scan of the whole cache. Where two cached chunks share a key, the first wins.
+   """
+
+   index = {}
+   for chunk in chunks:
+      if chunk.get("summary") and chunk.get("ada_v2"):
+         index.setdefault(make_chunk_key(chunk), chunk)
+
+   return index
+
+
+def open_chunk_index(path : str):
+   """
+   Opens a resume index over the chunk file at path, empty if there is no file yet.
+
+   A JSONL file is indexed by file offset, so only the chunks that are looked up are read
+   back in. A legacy JSON file has to be loaded whole and is indexed with build_chunk_index.
+   """
+
+   if not os.path.isfile(path):
+      return {}
+
+   if is_jsonl(path):
+      return ChunkFileIndex(path, make_chunk_key)
+
+   with open(path, "r", encoding="utf-8") as f:
+      return build_chunk_index(json.load(f))
+
+
+def close_chunk_index(index):
+
+   if isinstance(index, ChunkFileIndex):
+      index.close()
+
 
+@contextmanager
+def chunk_index(path : str):
+   """
+   open_chunk_index as a context manager, closing the index on exit. Nested inside the stage's
+   ChunkWriter, the index lets go of the file before the writer replaces it, which Windows needs.
+   """
 
+   index = open_chunk_index(path)
+   try:
+      yield index
+   finally:
+      close_chunk_index(index)
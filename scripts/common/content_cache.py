@@ -0,0 +1,104 @@
+""" A persistent, content-addressed key/value cache stored in SQLite."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard library imports
+import os
+import sqlite3
+import hashlib
+import threading
+
+KEY_SEPARATOR = "\x1f"
+
+def make_cache_key(*parts):
+    """Hashes the parts that determine a cached value into a single key."""
+    joined = KEY_SEPARATOR.join(str(part) for part in parts)
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+
+class ContentCache:
+    """
+    Maps keys from make_cache_key to bytes, persisted in a SQLite file.
+
+    Every read or write stamps the entry with a use counter. Once the cache holds more
+    than maxEntries, the least recently used entries are evicted. Hits, misses and
+    evictions are counted for the stats report. Safe to share between threads.
+    """
+
+    def __init__(self, path : str, maxEntries : int) -> None:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, lastUsed INTEGER NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_lastUsed ON cache (lastUsed)")
+
+        self.entries = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self.useCounter = self.connection.execute("SELECT COALESCE(MAX(lastUsed), 0) FROM cache").fetchone()[0]
+
+    path: str
+    maxEntries: int
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    useCounter: int
+
+    def get(self, key : str):
+        """Returns the value stored for key, or None."""
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.useCounter += 1
+            self.connection.execute("UPDATE cache SET lastUsed = ? WHERE key = ?", (self.useCounter, key))
+            return row[0]
+
+    def put(self, key : str, value : bytes):
+        """Stores value for key, evicting the least recently used entries if the cache is full."""
+        with self.lock:
+            self.useCounter += 1
+            # Update in place if the key is stored, so entries counts exactly without a COUNT(*)
+            updated = self.connection.execute(
+                "UPDATE cache SET value = ?, lastUsed = ? WHERE key = ?", (value, self.useCounter, key)).rowcount
+            if updated:
+                return
+
+            self.connection.execute("INSERT INTO cache (key, value, lastUsed) VALUES (?, ?, ?)", (key, value, self.useCounter))
+            self.entries += 1
+            excess = self.entries - self.maxEntries
+            if excess > 0:
+                evicted = self.connection.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY lastUsed LIMIT ?)", (excess,)).rowcount
+                self.evictions += evicted
+                self.entries -= evicted
+
+    def stats(self):
+        """Returns hit, miss, eviction and entry counts."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": self.entries
+            }
+
+    def close(self):
+        """Closes the underlying database."""
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,223 @@
+""" Where the downloaders write each document's files, and how the chunkers find them again."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard library imports
+import os
+import glob
+import json
+import hashlib
+import sqlite3
+import threading
+
+# Lists the documents of a sharded directory; not a .json file, so the chunkers do not take it for metadata
+DOCUMENT_MANIFEST_FILE = "documents.sqlite"
+
+# Holds the metadata of every document of a packed directory, and where its segments are in the pack files
+DOCUMENT_STORE_FILE = "store.sqlite"
+PACK_FILE_NAME = "segments-{:05d}.pack"
+PACK_MAX_BYTES = 256 * 1024 * 1024
+
+# "flat" names a document's files after its file name or URL, all in one directory. Names can clash, and
+# a directory of hundreds of thousands of files is slow to list. "sharded" names them by a hash of the
+# sourceId, two directory levels down, e.g. ab/cd/abcd...ef.json, and lists them in the manifest. "packed"
+# keeps every document's metadata in one database and appends its segments to a few large pack files, so
+# the chunkers read a whole corpus with one query and a read per document, rather than opening two files
+OUTPUT_LAYOUTS = ("flat", "sharded", "packed")
+
+def sharded_name(sourceId : str):
+    """The name, relative to the output directory, a document's files start with in the sharded layout."""
+    digest = hashlib.sha1(sourceId.encode("utf-8")).hexdigest()
+    return f"{digest[0:2]}/{digest[2:4]}/{digest}"
+
+
+class DocumentManifest:
+    """
+    Maps the sourceId of each document in a sharded output directory to its metadata file, relative
+    to the directory, persisted in a SQLite file there. Safe to share between threads.
+    """
+
+    def __init__(self, directory : str) -> None:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(os.path.join(directory, DOCUMENT_MANIFEST_FILE), check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS documents (sourceId TEXT PRIMARY KEY, path TEXT NOT NULL)")
+
+    directory: str
+
+    def put(self, sourceId : str, path : str):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO documents (sourceId, path) VALUES (?, ?)", (sourceId, path))
+
+    def remove(self, sourceId : str):
+        with self.lock:
+            self.connection.execute("DELETE FROM documents WHERE sourceId = ?", (sourceId,))
+
+    def paths(self):
+        """Returns {sourceId: metadata file path} for every document, in sourceId order."""
+        with self.lock:
+            rows = self.connection.execute("SELECT sourceId, path FROM documents ORDER BY sourceId").fetchall()
+        return {sourceId: os.path.join(self.directory, path) for sourceId, path in rows}
+
+    def close(self):
+        """Closes the underlying database."""
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DocumentStore:
+    """
+    The documents of a packed output directory. Each document's metadata is kept in a SQLite table,
+    with the pack file, offset and length of its segments, and of its sections if it has them, which
+    are appended to the pack files as JSON. Writing a document again appends it again, and the old
+    copy is left unused in its pack file. Safe to share between threads, but not between processes.
+    """
+
+    def __init__(self, directory : str, packMaxBytes : int = PACK_MAX_BYTES) -> None:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.packMaxBytes = packMaxBytes
+        self.lock = threading.Lock()
+        self.writer = None      # the pack file being appended to
+        self.writerPack = None
+        self.readers = {}       # pack number -> open pack file
+        self.locations = {}     # sourceId -> location, from the last call to metadata
+
+        self.connection = sqlite3.connect(os.path.join(directory, DOCUMENT_STORE_FILE), check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents (sourceId TEXT PRIMARY KEY, metadata TEXT NOT NULL, pack INTEGER NOT NULL, "
+            "segmentsOffset INTEGER NOT NULL, segmentsLength INTEGER NOT NULL, sectionsOffset INTEGER, sectionsLength INTEGER)")
+
+    directory: str
+
+    def has(self, sourceId : str, sections : bool = False):
+        """Whether sourceId is stored, with its sections if sections is set."""
+        with self.lock:
+            row = self.connection.execute("SELECT sectionsOffset FROM documents WHERE sourceId = ?", (sourceId,)).fetchone()
+        return row is not None and (not sections or row[0] is not None)
+
+    def put(self, sourceId : str, metadata : dict, segments : list, sections : list = None):
+        """Stores a document's metadata, segments and optionally sections, replacing any stored before."""
+        segmentsRecord = json.dumps(segments, ensure_ascii=False).encode("utf-8")
+        sectionsRecord = json.dumps(sections, ensure_ascii=False).encode("utf-8") if sections is not None else b""
+
+        with self.lock:
+            pack = self.open_writer(len(segmentsRecord) + len(sectionsRecord))
+            segmentsOffset = self.writer.tell()
+            self.writer.write(segmentsRecord)
+            sectionsOffset = self.writer.tell() if sections is not None else None
+            self.writer.write(sectionsRecord)
+            self.writer.flush()
+
+            self.connection.execute(
+                "INSERT OR REPLACE INTO documents (sourceId, metadata, pack, segmentsOffset, segmentsLength, sectionsOffset, sectionsLength) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sourceId, json.dumps(metadata, ensure_ascii=False), pack, segmentsOffset, len(segmentsRecord),
+                 sectionsOffset, len(sectionsRecord) if sections is not None else None))
+            self.locations.pop(sourceId, None)
+
+    def open_writer(self, size : int):
+        """Returns the number of the pack file to append size bytes to, starting a new one when the last is full."""
+        if self.writer is None:
+            packs = [name for name in os.listdir(self.directory) if name.startswith("segments-") and name.endswith(".pack")]
+            self.writerPack = max((int(name[9:-5]) for name in packs), default=0)
+            self.writer = open(os.path.join(self.directory, PACK_FILE_NAME.format(self.writerPack)), "ab")
+        if self.writer.tell() > 0 and self.writer.tell() + size > self.packMaxBytes:
+            self.writer.close()
+            self.writerPack += 1
+            self.writer = open(os.path.join(self.directory, PACK_FILE_NAME.format(self.writerPack)), "ab")
+        return self.writerPack
+
+    def remove(self, sourceId : str):
+        with self.lock:
+            self.connection.execute("DELETE FROM documents WHERE sourceId = ?", (sourceId,))
+            self.locations.pop(sourceId, None)
+
+    def metadata(self):
+        """Returns the metadata of every document, in sourceId order, with one query."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT sourceId, metadata, pack, segmentsOffset, segmentsLength, sectionsOffset, sectionsLength "
+                "FROM documents ORDER BY sourceId").fetchall()
+            self.locations = {row[0]: row[2:] for row in rows}
+        return [json.loads(row[1]) for row in rows]
+
+    def segments(self, sourceId : str):
+        """Returns the segments stored for sourceId."""
+        pack, segmentsOffset, segmentsLength, sectionsOffset, sectionsLength = self.location(sourceId)
+        return self.read(pack, segmentsOffset, segmentsLength)
+
+    def sections(self, sourceId : str):
+        """Returns the sections stored for sourceId, or None if it has none."""
+        pack, segmentsOffset, segmentsLength, sectionsOffset, sectionsLength = self.location(sourceId)
+        if sectionsOffset is None:
+            return None
+        return self.read(pack, sectionsOffset, sectionsLength)
+
+    def location(self, sourceId : str):
+        with self.lock:
+            location = self.locations.get(sourceId)
+            if location is None:
+                location = self.connection.execute(
+                    "SELECT pack, segmentsOffset, segmentsLength, sectionsOffset, sectionsLength FROM documents WHERE sourceId = ?",
+                    (sourceId,)).fetchone()
+        if location is None:
+            raise KeyError(sourceId)
+        return location
+
+    def read(self, pack : int, offset : int, length : int):
+        with self.lock:
+            reader = self.readers.get(pack)
+            if reader is None:
+                reader = open(os.path.join(self.directory, PACK_FILE_NAME.format(pack)), "rb")
+                self.readers[pack] = reader
+            reader.seek(offset)
+            record = reader.read(length)
+        return json.loads(record)
+
+    def close(self):
+        """Closes the underlying database and pack files."""
+        with self.lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+            for reader in self.readers.values():
+                reader.close()
+            self.readers.clear()
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_document_store(directory : str):
+    """The DocumentStore of directory if it was downloaded in the packed layout, otherwise None."""
+    if os.path.exists(os.path.join(directory, DOCUMENT_STORE_FILE)):
+        return DocumentStore(directory)
+    return None
+
+
+def document_files(directory : str):
+    """The metadata files of the documents in directory: from its manifest if it is sharded, otherwise every .json file in it."""
+    if os.path.exists(os.path.join(directory, DOCUMENT_MANIFEST_FILE)):
+        with DocumentManifest(directory) as manifest:
+            return list(manifest.paths().values())
+    return glob.glob(os.path.join(directory, "*.json"))
@@ -0,0 +1,114 @@
+""" Plain text from HTML: pluggable extractors that drop boilerplate and keep a page's main content, using a C-backed parser when one is installed."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import re
+
+# Third-Party Packages
+from bs4 import BeautifulSoup
+
+# Optional C-backed parsers, not in requirements.txt; "auto" uses the first one installed. Without one,
+# "auto" falls back to html.parser, which is slower than "legacy", so "legacy" stays the default
+try:
+    from selectolax.parser import HTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+try:
+    import lxml.html as lxml_html
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_html = None
+    lxml_etree = None
+
+# Elements whose text is never page content
+BOILERPLATE_TAGS = ["script", "style", "noscript", "template", "svg", "nav", "footer"]
+
+# Text from inline elements is joined with spaces, so "with <b>care</b>." reads "with care ." until tidied
+SPACE_BEFORE_PUNCTUATION = re.compile(r" ([.,;:!?)\]])")
+SPACE_AFTER_BRACKET = re.compile(r"([(\[]) ")
+
+def collapse_whitespace(text : str):
+    """Joins the words of text with single spaces, which also removes line feeds, and closes up punctuation."""
+    text = " ".join(text.split())
+    return SPACE_AFTER_BRACKET.sub(r"\1", SPACE_BEFORE_PUNCTUATION.sub(r"\1", text))
+
+
+def extract_with_legacy(html):
+    """The text of the whole page, navigation and footers included, as the downloaders always took it."""
+    soup = BeautifulSoup(html, "html.parser")
+    return soup.get_text().replace("\n", " ")
+
+
+def extract_with_beautifulsoup(html):
+    """Main content text using BeautifulSoup's pure Python html.parser."""
+    soup = BeautifulSoup(html, "html.parser")
+
+    # The main content is the page's <main>, its role="main" element or its only <article>, else the whole body
+    root = soup.find("main") or soup.find(attrs={"role": "main"})
+    if root is None:
+        articles = soup.find_all("article")
+        root = articles[0] if len(articles) == 1 else (soup.body or soup)
+
+    # Boilerplate only needs removing from the part of the tree we take text from
+    for tag in root(BOILERPLATE_TAGS):
+        tag.decompose()
+    return collapse_whitespace(root.get_text(" "))
+
+
+def extract_with_lxml(html):
+    """Main content text using lxml."""
+    try:
+        tree = lxml_html.fromstring(html)
+    except lxml_etree.LxmlError:
+        return ""   # lxml will not parse an empty document
+    lxml_etree.strip_elements(tree, lxml_etree.Comment, *BOILERPLATE_TAGS, with_tail=False)
+
+    roots = tree.xpath("//main") or tree.xpath("//*[@role='main']")
+    if not roots:
+        articles = tree.xpath("//article")
+        roots = articles if len(articles) == 1 else (tree.xpath("//body") or [tree])
+    return collapse_whitespace(" ".join(roots[0].itertext()))
+
+
+def extract_with_selectolax(html):
+    """Main content text using selectolax's Modest parser."""
+    tree = SelectolaxParser(html)
+    tree.strip_tags(BOILERPLATE_TAGS)
+
+    root = tree.css_first("main") or tree.css_first("[role=main]")
+    if root is None:
+        articles = tree.css("article")
+        root = articles[0] if len(articles) == 1 else (tree.body or tree.root)
+    if root is None:
+        return ""
+    return collapse_whitespace(root.text(separator=" "))
+
+
+# Name -> (extractor, whether its parser is installed). "auto" picks the first installed in this order
+HTML_EXTRACTORS = {
+    "selectolax": (extract_with_selectolax, SelectolaxParser is not None),
+    "lxml": (extract_with_lxml, lxml_html is not None),
+    "html.parser": (extract_with_beautifulsoup, True),
+    "legacy": (extract_with_legacy, True)
+}
+
+def available_html_extractors():
+    """Names of the extractors whose parser is installed, fastest first."""
+    return [name for name, (extractor, installed) in HTML_EXTRACTORS.items() if installed]
+
+
+def get_html_extractor(name : str = "legacy"):
+    """
+    Returns the function that turns an HTML str or bytes into plain text for an extractor name,
+    or for "auto" the fastest installed one that keeps only the main content.
+    """
+    if name == "auto":
+        name = available_html_extractors()[0]
+
+    if name not in HTML_EXTRACTORS:
+        raise ValueError(f"Unknown HTML extractor: {name}, expected one of auto, {', '.join(HTML_EXTRACTORS)}")
+    extractor, installed = HTML_EXTRACTORS[name]
+    if not installed:
+        raise ValueError(f"HTML extractor {name} needs a package that is not installed")
+    return extractor
@@ -0,0 +1,84 @@
+""" Splits Markdown into sections at its headings, keeping each section's heading path, for structural chunking."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import re
+
+# Written beside a document's .json.mdd, e.g. README.md.json.sections; not a .json file, so the chunkers do not take it for metadata
+SECTIONS_EXTENSION = ".sections"
+
+ATX_HEADING = re.compile(r"^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$")
+SETEXT_UNDERLINE = re.compile(r"^ {0,3}(=+|-+)[ \t]*$")
+CODE_FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+
+# Inline markup dropped from heading titles: images, link targets, emphasis and code marks
+IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+EMPHASIS = re.compile(r"[*_`]+")
+
+def sections_file_name(mddFileName : str):
+    """Returns the sections file that goes with a .json.mdd file, e.g. README.md.json.mdd -> README.md.json.sections."""
+    if mddFileName.endswith(".mdd"):
+        mddFileName = mddFileName[:-len(".mdd")]
+    return mddFileName + SECTIONS_EXTENSION
+
+
+def heading_title(text : str):
+    """The plain text of a heading, without links, images or emphasis."""
+    text = LINK.sub(r"\1", IMAGE.sub("", text))
+    return " ".join(EMPHASIS.sub("", text).split())
+
+
+def split_markdown_sections(md : str):
+    """
+    Splits Markdown at its ATX (# Title) and setext (Title / ===) headings, ignoring anything
+    inside fenced code blocks. Returns (path, markdown) pairs in document order, where path is
+    the list of heading titles from the top level down to the section's own heading, and
+    markdown is the section's text from its heading line up to the next heading. Text before
+    the first heading is a section with an empty path.
+    """
+    sections = []
+    headings = []       # (level, title) from the top level down
+    lines = []
+    fence = None
+
+    def close_section():
+        if any(line.strip() for line in lines):
+            sections.append(([title for level, title in headings], "\n".join(lines)))
+
+    def open_section(level, title, headingLines):
+        nonlocal lines
+        close_section()
+        while headings and headings[-1][0] >= level:
+            headings.pop()
+        headings.append((level, heading_title(title)))
+        lines = headingLines
+
+    for line in md.splitlines():
+        fenceMatch = CODE_FENCE.match(line)
+        if fence is not None:
+            if fenceMatch and fenceMatch.group(1)[0] == fence[0] and len(fenceMatch.group(1)) >= len(fence):
+                fence = None
+            lines.append(line)
+            continue
+        if fenceMatch:
+            fence = fenceMatch.group(1)
+            lines.append(line)
+            continue
+
+        atx = ATX_HEADING.match(line)
+        if atx:
+            open_section(len(atx.group(1)), atx.group(2) or "", [line])
+            continue
+
+        # A line of = or - directly under a line of text makes that line a heading; after a blank line, --- is a rule
+        setext = SETEXT_UNDERLINE.match(line)
+        if setext and lines and lines[-1].strip() and not ATX_HEADING.match(lines[-1]):
+            title = lines.pop()
+            open_section(1 if setext.group(1)[0] == "=" else 2, title.strip(), [title, line])
+            continue
+
+        lines.append(line)
+
+    close_section()
+    return sections
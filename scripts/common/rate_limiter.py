@@ -0,0 +1,174 @@
+""" Client-side token bucket rate limiting for Azure OpenAI requests-per-minute and tokens-per-minute quotas."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard library imports
+import asyncio
+import threading
+import time
+
+# Third-Party Packages
+from openai import RateLimitError
+from tenacity.wait import wait_base
+
+# Azure enforces quotas over windows shorter than a minute, so we only allow
+# a burst of ten seconds' worth of requests or tokens
+BURST_SECONDS = 10
+
+class RateLimiter:
+    """
+    Two token buckets, one for requests and one for tokens, shared by every thread and
+    coroutine calling one deployment.
+
+    Each call reserves one request and its estimated tokens up front. If a bucket goes
+    negative the caller waits until it has refilled, so callers queue in arrival order
+    instead of all retrying at once. Response headers from the service pull the buckets
+    down to what the service says is left, and retry-after pauses everyone.
+    A limit of 0 turns that bucket off.
+    """
+
+    def __init__(self, requestsPerMinute : int, tokensPerMinute : int, clock=time.monotonic) -> None:
+        self.requestRate = requestsPerMinute / 60
+        self.tokenRate = tokensPerMinute / 60
+        self.requestCapacity = self.requestRate * BURST_SECONDS
+        self.tokenCapacity = self.tokenRate * BURST_SECONDS
+        self.requestLevel = self.requestCapacity
+        self.tokenLevel = self.tokenCapacity
+        self.clock = clock
+        self.updated = clock()
+        self.pausedUntil = 0.0
+        self.lock = threading.Lock()
+
+    requestRate: float
+    tokenRate: float
+    requestCapacity: float
+    tokenCapacity: float
+    requestLevel: float
+    tokenLevel: float
+    updated: float
+    pausedUntil: float
+
+    def refill(self, now : float):
+        elapsed = max(0.0, now - self.updated)
+        self.requestLevel = min(self.requestCapacity, self.requestLevel + elapsed * self.requestRate)
+        self.tokenLevel = min(self.tokenCapacity, self.tokenLevel + elapsed * self.tokenRate)
+        self.updated = now
+
+    def reserve(self, tokens : int):
+        """Takes one request and tokens from the buckets, returning the seconds the caller must wait before sending."""
+        with self.lock:
+            now = self.clock()
+            self.refill(now)
+
+            wait = max(0.0, self.pausedUntil - now)
+            if self.requestRate:
+                self.requestLevel -= 1
+                if self.requestLevel < 0:
+                    wait = max(wait, -self.requestLevel / self.requestRate)
+            if self.tokenRate:
+                self.tokenLevel -= tokens
+                if self.tokenLevel < 0:
+                    wait = max(wait, -self.tokenLevel / self.tokenRate)
+
+            return wait
+
+    def acquire(self, tokens : int):
+        """Blocks the calling thread until a request of this many tokens fits in the quota."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens : int):
+        """Waits, without blocking the event loop, until a request of this many tokens fits in the quota."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """Adapts to the x-ratelimit-remaining-* and retry-after headers on a response. Returns whether retry-after paused the limiter."""
+        if headers is None:
+            return False
+
+        with self.lock:
+            now = self.clock()
+            self.refill(now)
+
+            remaining = parse_header_number(headers.get("x-ratelimit-remaining-requests"))
+            if remaining is not None and self.requestRate:
+                self.requestLevel = min(self.requestLevel, remaining)
+
+            remaining = parse_header_number(headers.get("x-ratelimit-remaining-tokens"))
+            if remaining is not None and self.tokenRate:
+                self.tokenLevel = min(self.tokenLevel, remaining)
+
+            retryAfter = parse_header_number(headers.get("retry-after-ms"))
+            if retryAfter is not None:
+                retryAfter = retryAfter / 1000
+            else:
+                retryAfter = parse_header_number(headers.get("retry-after"))
+            if retryAfter is not None:
+                self.pausedUntil = max(self.pausedUntil, now + retryAfter)
+            return retryAfter is not None
+
+
+def parse_header_number(value):
+    """Reads a numeric header value, returning None if it is missing or not a number."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class wait_unless_rate_limited(wait_base):
+    """
+    Tenacity wait strategy that retries a 429 straight away when a rate limiter took a
+    retry-after from it, because the limiter already holds the next attempt until then.
+    A 429 with no limiter or no retry-after, and any other error, waits as the fallback
+    strategy says.
+    """
+
+    def __init__(self, fallback : wait_base) -> None:
+        self.fallback = fallback
+
+    def __call__(self, retry_state):
+        if getattr(retry_state.outcome.exception(), "limiterPaused", False):
+            return 0
+        return self.fallback(retry_state)
+
+
+def create_with_limit(limiter : RateLimiter, resource, tokens : int, **kwargs):
+    """
+    Calls resource.create(**kwargs) through the limiter, for example client.chat.completions,
+    and feeds the response headers back into it.
+    """
+    if limiter is None:
+        return resource.create(**kwargs)
+
+    limiter.acquire(tokens)
+    try:
+        raw = resource.with_raw_response.create(**kwargs)
+    except RateLimitError as rate_error:
+        # Marks the error for wait_unless_rate_limited
+        rate_error.limiterPaused = limiter.update_from_headers(rate_error.response.headers)
+        raise
+
+    limiter.update_from_headers(raw.headers)
+    return raw.parse()
+
+
+async def create_with_limit_async(limiter : RateLimiter, resource, tokens : int, **kwargs):
+    """Async version of create_with_limit, for resources on AsyncAzureOpenAI."""
+    if limiter is None:
+        return await resource.create(**kwargs)
+
+    await limiter.acquire_async(tokens)
+    try:
+        raw = await resource.with_raw_response.create(**kwargs)
+    except RateLimitError as rate_error:
+        # Marks the error for wait_unless_rate_limited
+        rate_error.limiterPaused = limiter.update_from_headers(rate_error.response.headers)
+        raise
+
+    limiter.update_from_headers(raw.headers)
+    return raw.parse()
@@ -0,0 +1,66 @@
+""" Exact top-k cosine similarity search over chunk embeddings, as one matrix product per batch of queries."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Third-Party Packages
+import numpy as np
+
+# Queries scored together in one product, which bounds the scores matrix at QUERY_BLOCK x chunks
+QUERY_BLOCK = 256
+
+def normalize_rows(matrix):
+    """Returns a float32 copy of matrix with each row scaled to unit length. All-zero rows stay zero."""
+    matrix = np.array(matrix, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    matrix /= norms
+    return matrix
+
+
+def top_k(scores, k : int):
+    """Returns the indices and values of the k highest scores in each row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+class EmbeddingIndex:
+    """
+    Holds every chunk embedding as one pre-normalised float32 matrix, so a query costs
+    one matrix-vector product and an argpartition rather than a Python loop over chunks.
+
+    Hits are (row, score) pairs, where row is the chunk's row in the matrix passed in and
+    score is the cosine similarity.
+    """
+
+    def __init__(self, matrix) -> None:
+        self.matrix = normalize_rows(matrix)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def search(self, query, k : int):
+        """Returns the k best hits for one query embedding, best first."""
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries, k : int):
+        """Returns the k best hits for each of a list of query embeddings, best first."""
+        queries = normalize_rows(queries)
+        results = []
+
+        for start in range(0, queries.shape[0], QUERY_BLOCK):
+            scores = queries[start:start + QUERY_BLOCK] @ self.matrix.T
+            rows, values = top_k(scores, k)
+            for row_list, value_list in zip(rows.tolist(), values.tolist()):
+                results.append(list(zip(row_list, value_list)))
+
+        return results
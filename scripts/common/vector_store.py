@@ -0,0 +1,135 @@
+""" Stores embeddings as a contiguous float32 .npy matrix next to a chunk file, instead of as JSON float arrays."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Run from the scripts directory to split the vectors out of an existing file:
+#    python -m common.vector_store data/embeddings_lite.json data/embeddings_lite_split.json
+
+# Standard library imports
+import os
+import argparse
+
+# Third-Party Packages
+import numpy as np
+
+# Local Modules
+from common.chunk_store import read_chunks, ChunkWriter
+
+VECTOR_FIELD = "ada_v2"
+ROW_FIELD = "vectorRow"
+
+def vector_file_path(chunkPath : str):
+    """Returns the .npy path that goes with a chunk file, e.g. master_enriched_lite.json -> master_enriched_lite.npy."""
+    return os.path.splitext(chunkPath)[0] + ".npy"
+
+
+class VectorWriter:
+    """
+    Appends vectors to a float32 .npy file one row at a time.
+
+    The row count is only known at the end, so rows go to a raw temporary file and
+    close writes the .npy header followed by the rows. Memory use does not grow with
+    the number of vectors.
+    """
+
+    def __init__(self, path : str) -> None:
+        self.path = path
+        self.rows = 0
+        self.dimensions = None
+        self.temporaryPath = path + ".tmp"
+        self.file = open(self.temporaryPath, "wb")
+
+    path: str
+    rows: int
+    temporaryPath: str
+
+    def add(self, vector):
+        """Appends a vector, returning its row number."""
+        row = np.asarray(vector, dtype=np.float32)
+        if self.dimensions is None:
+            self.dimensions = row.shape[0]
+        elif row.shape != (self.dimensions,):
+            raise ValueError(f"Vector has {row.shape[0]} dimensions, expected {self.dimensions}")
+
+        self.file.write(row.tobytes())
+        self.rows += 1
+        return self.rows - 1
+
+    def close(self):
+        self.file.close()
+
+        header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+                  "fortran_order": False,
+                  "shape": (self.rows, self.dimensions or 0)}
+        with open(self.path, "wb") as out, open(self.temporaryPath, "rb") as raw:
+            np.lib.format.write_array_header_1_0(out, header)
+            while True:
+                block = raw.read(1 << 20)
+                if not block:
+                    break
+                out.write(block)
+
+        os.remove(self.temporaryPath)
+
+    def abandon(self):
+        self.file.close()
+        os.remove(self.temporaryPath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abandon()
+
+
+def split_vector(chunk : dict, writer : VectorWriter):
+    """Moves a chunk's embedding into the vector file, leaving its row number in its place."""
+    vector = chunk.pop(VECTOR_FIELD, None)
+    if vector is not None:
+        chunk[ROW_FIELD] = writer.add(vector)
+    return chunk
+
+
+def load_vectors(path : str):
+    """Maps a vector file into memory without reading it; rows are paged in as they are used."""
+    return np.load(path, mmap_mode="r")
+
+
+def load_embedding_file(chunkPath : str):
+    """
+    Loads a chunk file and its embeddings as (chunks, matrix), where chunk i's vector is
+    matrix[chunk["vectorRow"]].
+
+    If the chunks have no vectorRow the embeddings are read from their ada_v2 arrays, so
+    files written before the vector sidecar existed load the same way.
+    """
+    chunks = list(read_chunks(chunkPath))
+
+    if any(ROW_FIELD in chunk for chunk in chunks):
+        return chunks, load_vectors(vector_file_path(chunkPath))
+
+    vectors = []
+    for chunk in chunks:
+        vector = chunk.pop(VECTOR_FIELD, None)
+        if vector is not None:
+            chunk[ROW_FIELD] = len(vectors)
+            vectors.append(vector)
+    return chunks, np.array(vectors, dtype=np.float32)
+
+
+def split_vector_file(inputPath : str, outputPath : str):
+    """Copies a chunk file with its ada_v2 arrays moved into a .npy file beside outputPath."""
+    with ChunkWriter(outputPath, indent=None) as chunkWriter, VectorWriter(vector_file_path(outputPath)) as vectorWriter:
+        for chunk in read_chunks(inputPath):
+            chunkWriter.write(split_vector(chunk, vectorWriter))
+    return vectorWriter.rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move the ada_v2 arrays in a chunk file into a float32 .npy file")
+    parser.add_argument("input", help="chunk file with ada_v2 arrays, .json or .jsonl")
+    parser.add_argument("output", help="chunk file to write; the .npy file is written beside it")
+    args = parser.parse_args()
+    print(f"Split {split_vector_file(args.input, args.output)} vectors")
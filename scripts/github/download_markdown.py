@@ -10,10 +10,19 @@ import threading
 import queue
 import pathlib
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 
 # Third-Party Packages
 from markdown import markdown
-from bs4 import BeautifulSoup
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from common.html_text import get_html_extractor
+from common.markdown_sections import split_markdown_sections, sections_file_name
+from common.document_layout import DocumentManifest, DocumentStore, sharded_name
+from github.markdown_manifest import MarkdownManifest, MARKDOWN_MANIFEST_FILE, file_blob_sha
 
 class Counter:
     """Thread-safe counter"""
@@ -38,45 +47,81 @@ def makeSourceId(repoSourceDir, repoName, filePath):
     unix = Path(composite).as_posix()
     return unix
 
-def md_to_plain_text(md):
-    """Converts Markdown content into plain text"""
+def md_to_plain_text(md, extractor=None):
+    """Converts Markdown content into plain text, with the given HTML extractor or the legacy one"""
     html = markdown(md)
-    soup = BeautifulSoup(html, features='html.parser')
-    fullText = soup.get_text()
-    nolineFeeds = fullText.replace("\n", " ")
-    return nolineFeeds
+    extractor = extractor or get_html_extractor()
+    return extractor(html)
     
-def get_markdown(fileName, counter_id, repoSourceDir, repoName, markdownDestinationDir, logger):
-    """Reads Markdown content from a file and writes out as plain text"""
+def md_to_sections(md, extractor=None):
+    """Splits Markdown content at its headings, returning {"path", "text"} for each section that has plain text"""
+    sections = []
+    for path, sectionMd in split_markdown_sections(md):
+        text = md_to_plain_text(sectionMd, extractor)
+        if text.strip():
+            sections.append({"path": path, "text": text})
+    return sections
+
+def output_name(fileName, sourceId, layout="flat"):
+    """The name, relative to the output directory, a Markdown file's output files start with. The packed layout
+    writes no files of its own, and keeps this name only in the metadata"""
+    if layout == "sharded":
+        return sharded_name(sourceId)
+    return Path(fileName).name.replace("\\", "_")
+
+def markdown_document(fileName, sourceId, fakeName, repoName, extractor, writeSections):
+    """Converts a Markdown file, returning its metadata, its plain text segments, and its sections if writeSections is set"""
+    markdown_content = Path(fileName).read_text(encoding="utf-8")
 
-    sourceId = makeSourceId(repoSourceDir, repoName, fileName)
-    fakeName = Path(fileName).name.replace("\\", "_")
-    contentOutputFileName = os.path.join(markdownDestinationDir, fakeName + ".json.mdd")
-    metaOutputFilename = os.path.join(markdownDestinationDir, fakeName + ".json")
+    sections = md_to_sections(markdown_content, extractor) if writeSections else None
 
-    # if markdown file already exists, skip it
-    if os.path.exists(contentOutputFileName):
-        logger.debug("Skipping file %d, %s", counter_id, fileName)
-        return False    
-    
-    markdown_content = Path(fileName).read_text(encoding="utf-8")
-    plainText = md_to_plain_text(markdown_content) 
+    plainText = md_to_plain_text(markdown_content, extractor) 
 
     jsonSeg = {"text": plainText, "start": "0"}
     jsonArr = [jsonSeg]
-         
-    # save the plain text content as a .json.mdd file
-    with open(contentOutputFileName, "w", encoding="utf-8") as file:
-        json.dump(jsonArr, file, indent=4, ensure_ascii=False)
 
     metadata = {
         "speaker": "",
         "title": Path(fileName).name,
         "sourceId": sourceId,
-        "filename": os.path.basename(contentOutputFileName),
+        "filename": fakeName + ".json.mdd",
         "description": Path(fileName).name,
         "hitTrackingId": repoName
     }
+    return metadata, jsonArr, sections
+
+def read_markdown(repoSourceDir, repoName, extractor, writeSections, fileName):
+    """Converts one file for the packed layout, in a worker process or the main one, returning what to store"""
+    sourceId = makeSourceId(repoSourceDir, repoName, fileName)
+    return (sourceId,) + markdown_document(fileName, sourceId, output_name(fileName, sourceId), repoName, extractor, writeSections)
+
+def get_markdown(fileName, counter_id, repoSourceDir, repoName, markdownDestinationDir, logger, extractor, writeSections=False, overwrite=False,
+                 layout="flat"):
+    """Reads Markdown content from a file and writes out as plain text, and as plain text sections if writeSections is set.
+    Existing output is kept unless overwrite is set"""
+
+    sourceId = makeSourceId(repoSourceDir, repoName, fileName)
+    fakeName = output_name(fileName, sourceId, layout)
+    contentOutputFileName = os.path.join(markdownDestinationDir, fakeName + ".json.mdd")
+    metaOutputFilename = os.path.join(markdownDestinationDir, fakeName + ".json")
+    sectionsOutputFileName = sections_file_name(contentOutputFileName)
+
+    # if markdown file already exists, skip it
+    if not overwrite and os.path.exists(contentOutputFileName) and (not writeSections or os.path.exists(sectionsOutputFileName)):
+        logger.debug("Skipping file %d, %s", counter_id, fileName)
+        return False    
+    os.makedirs(os.path.dirname(contentOutputFileName), exist_ok=True)
+
+    metadata, jsonArr, sections = markdown_document(fileName, sourceId, fakeName, repoName, extractor, writeSections)
+
+    # save the sections for structural chunking
+    if writeSections:
+        with open(sectionsOutputFileName, "w", encoding="utf-8") as file:
+            json.dump(sections, file, indent=4, ensure_ascii=False)
+         
+    # save the plain text content as a .json.mdd file
+    with open(contentOutputFileName, "w", encoding="utf-8") as file:
+        json.dump(jsonArr, file, indent=4, ensure_ascii=False)
 
     # save the metadata as a .json file
     with open(metaOutputFilename, "w", encoding="utf-8") as file:
@@ -85,21 +130,81 @@ def get_markdown(fileName, counter_id, repoSourceDir, repoName, markdownDestinat
     logger.debug("Markdown download completed: %d, %s", counter_id, fileName)
     return True
 
-def process_queue(q, repoSourceDir, repoName, markdownDestinationDir, logger):
+def process_queue(q, repoSourceDir, repoName, markdownDestinationDir, logger, extractor, writeSections, overwrite, layout):
     """Processes the queue"""
     while not q.empty():
         file = q.get()
 
         counter.increment()
-        get_markdown(file, counter.value, repoSourceDir, repoName, markdownDestinationDir, logger)
+        get_markdown(file, counter.value, repoSourceDir, repoName, markdownDestinationDir, logger, extractor, writeSections, overwrite, layout)
         q.task_done()
 
-def download_markdown(repoSourceDir, repoName, markdownDestinationDir): 
+def convert_markdown(repoSourceDir, repoName, markdownDestinationDir, extractor, writeSections, overwrite, layout, numberedFile):
+    """Converts one (counter_id, fileName) in a worker process"""
+    counter_id, fileName = numberedFile
+    logger = logging.getLogger(__name__)
+    return get_markdown(fileName, counter_id, repoSourceDir, repoName, markdownDestinationDir, logger, extractor, writeSections, overwrite,
+                        layout)
+
+def output_file_names(markdownDestinationDir, outputName):
+    """The files get_markdown writes for a file with the given output name"""
+    contentOutputFileName = os.path.join(markdownDestinationDir, outputName + ".json.mdd")
+    return [os.path.join(markdownDestinationDir, outputName + ".json"), contentOutputFileName, sections_file_name(contentOutputFileName)]
+
+def changed_markdown_files(manifest, documents, markdown_files, repoSourceDir, repoName, markdownDestinationDir, writeSections,
+                           layout, logger):
+    """
+    Compares the checkout with the manifest. Files that have gone from the repo become tombstones, and their
+    output files are deleted, and taken out of the documents manifest if there is one, so later stages drop
+    them. Returns the files that are new, edited or missing their output, and the blob SHA of each.
+    """
+    known = manifest.files(repoName)
+    blobShas = {file: file_blob_sha(file) for file in markdown_files}
+    sourceIds = {makeSourceId(repoSourceDir, repoName, file): file for file in markdown_files}
+    outputNames = {sourceId: output_name(file, sourceId, layout) for sourceId, file in sourceIds.items()}
+
+    # Removed files go first, so a file that takes over a removed file's output name writes after the delete.
+    # Packed documents have no files of their own
+    for sourceId, (blobSha, outputName) in known.items():
+        if outputNames.get(sourceId) != outputName and layout != "packed":
+            for name in output_file_names(markdownDestinationDir, outputName):
+                if os.path.exists(name):
+                    os.remove(name)
+        if sourceId not in sourceIds:
+            manifest.remove(sourceId)
+            if documents is not None:
+                documents.remove(sourceId)
+            logger.debug("Removed file %s", sourceId)
+
+    changed = []
+    for sourceId, file in sourceIds.items():
+        entry = known.get(sourceId)
+        if layout == "packed":
+            stored = documents.has(sourceId, writeSections)
+        else:
+            outputs = output_file_names(markdownDestinationDir, outputNames[sourceId])
+            if not writeSections:
+                outputs = outputs[:2]
+            stored = all(os.path.exists(name) for name in outputs)
+        if entry is None or entry[0] != blobShas[file] or entry[1] != outputNames[sourceId] or not stored:
+            changed.append(file)
+
+    logger.info("Markdown files changed: %d of %d, removed: %d", len(changed), len(markdown_files),
+                len(set(known) - set(sourceIds)))
+    return changed, blobShas
+
+def download_markdown(repoSourceDir, repoName, markdownDestinationDir, config : ApiConfiguration = None): 
     """Main function to download Markdown files"""
 
     logging.basicConfig(level=logging.WARNING)
     logger = logging.getLogger(__name__)
 
+    if config is None:
+        config = ApiConfiguration()
+    extractor = get_html_extractor(config.htmlExtractor)
+    writeSections = config.chunkingMode == "sections"
+    layout = config.outputLayout
+
     MAX_RESULTS = 100
     PROCESSING_THREADS = 1
 
@@ -120,28 +225,98 @@ def download_markdown(repoSourceDir, repoName, markdownDestinationDir):
 
     directory_path = Path(repoSourceDir)
 
-    # Use rglob() to recursively search for all files
+    # Use rglob() to recursively search for all files, in sorted order so runs are repeatable
     searchPath = directory_path.rglob("*.md")
-    markdown_files = list(searchPath)
+    markdown_files = sorted(str(file) for file in searchPath)
 
-    # Build a queue of Markdown filenames
+    # In the flat layout output files are named after the file name alone, so where names clash the first path
+    # in sorted order is converted, however the work is split up. Sharded and packed documents do not clash
+    outputNames = {}
     for file in markdown_files:
-        q.put(str(file))
-
-    logger.info("Total markdown files to be downloaded: %s", q.qsize())
+        name = output_name(file, makeSourceId(repoSourceDir, repoName, file), layout)
+        if layout == "packed":
+            name = file
+        if name in outputNames:
+            logger.debug("Skipping file %s, its output name is taken by %s", file, outputNames[name])
+        else:
+            outputNames[name] = file
+    markdown_files = list(outputNames.values())
+
+    # The sharded layout lists every document it writes for the chunkers, and the packed layout stores them
+    documents = None
+    if layout == "sharded":
+        documents = DocumentManifest(markdownDestinationDir)
+    elif layout == "packed":
+        documents = DocumentStore(markdownDestinationDir)
+
+    # In incremental mode, only files whose git blob SHA changed since the last run are converted
+    manifest = None
+    overwrite = False
+    if config.markdownIncremental:
+        manifest = MarkdownManifest(os.path.join(markdownDestinationDir, MARKDOWN_MANIFEST_FILE))
+        markdown_files, blobShas = changed_markdown_files(manifest, documents, markdown_files, repoSourceDir, repoName,
+                                                          markdownDestinationDir, writeSections, layout, logger)
+        overwrite = True
+    elif layout == "packed":
+        # if the document is already stored, skip it
+        markdown_files = [file for file in markdown_files
+                          if not documents.has(makeSourceId(repoSourceDir, repoName, file), writeSections)]
+
+    logger.info("Total markdown files to be downloaded: %s", len(markdown_files))
 
     start_time = time.time()
 
-    # Create multiple threads to process the queue
-    threads = []
-    for i in range(PROCESSING_THREADS):
-        t = threading.Thread(target=process_queue, args=(q, repoSourceDir, repoName, markdownDestinationDir, logger))
-        t.start()
-        threads.append(t)
-
-    # Wait for all threads to finish
-    for t in threads:
-        t.join()
+    processes = config.markdownProcesses
+    if layout == "packed":
+        # Worker processes, if any, only convert; the main process appends every document to the store
+        pool = ProcessPoolExecutor(max_workers=processes) if processes > 1 else nullcontext()
+        with pool:
+            convert = partial(read_markdown, repoSourceDir, repoName, extractor, writeSections)
+            if processes > 1:
+                batch = max(1, min(64, len(markdown_files) // (processes * 4)))
+                converted = pool.map(convert, markdown_files, chunksize=batch)
+            else:
+                converted = map(convert, markdown_files)
+            for sourceId, metadata, segments, sections in converted:
+                documents.put(sourceId, metadata, segments, sections)
+    elif processes > 1:
+        # Conversion is CPU bound, so it scales across processes rather than threads.
+        # Files go to the workers in batches, to spread the cost of sending each task
+        batch = max(1, min(64, len(markdown_files) // (processes * 4)))
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            convert = partial(convert_markdown, repoSourceDir, repoName, markdownDestinationDir, extractor, writeSections, overwrite,
+                              layout)
+            converted = sum(pool.map(convert, enumerate(markdown_files, start=1), chunksize=batch))
+        logger.debug("Converted %d markdown files in %d processes", converted, processes)
+    else:
+        # Build a queue of Markdown filenames
+        for file in markdown_files:
+            q.put(file)
+
+        # Create multiple threads to process the queue
+        threads = []
+        for i in range(PROCESSING_THREADS):
+            t = threading.Thread(target=process_queue, args=(q, repoSourceDir, repoName, markdownDestinationDir, logger, extractor, writeSections,
+                                                                   overwrite, layout))
+            t.start()
+            threads.append(t)
+
+        # Wait for all threads to finish
+        for t in threads:
+            t.join()
+
+    if manifest is not None:
+        with manifest:
+            for file in markdown_files:
+                sourceId = makeSourceId(repoSourceDir, repoName, file)
+                manifest.put(sourceId, repoName, blobShas[file], output_name(file, sourceId, layout))
+
+    if documents is not None:
+        with documents:
+            if layout == "sharded":
+                for file in markdown_files:
+                    sourceId = makeSourceId(repoSourceDir, repoName, file)
+                    documents.put(sourceId, output_name(file, sourceId, layout) + ".json")
 
     finish_time = time.time()
     logger.debug("Total time taken: %s", finish_time - start_time)
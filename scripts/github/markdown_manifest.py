@@ -0,0 +1,86 @@
+""" The git blob SHA each Markdown file was last converted from, kept between runs, so a rerun converts only the files that changed."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard library imports
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+
+# Kept beside the converted files; not a .json file, so the chunkers do not take it for metadata
+MARKDOWN_MANIFEST_FILE = "markdown_manifest.sqlite"
+
+def git_blob_sha(content : bytes):
+    """The SHA git gives a file's content, as git hash-object and git ls-files -s report it."""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def file_blob_sha(path : str):
+    with open(path, "rb") as f:
+        return git_blob_sha(f.read())
+
+
+class MarkdownManifest:
+    """
+    Maps the sourceId of each Markdown file converted from a repo to the blob SHA it was converted
+    from and the name its output files start with, persisted in a SQLite file.
+
+    A file removed from the repo is kept as a tombstone, with no SHA and the time it was removed,
+    so it is known to have gone rather than never to have been seen. Safe to share between threads.
+    """
+
+    def __init__(self, path : str) -> None:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files (sourceId TEXT PRIMARY KEY, repoName TEXT NOT NULL, blobSha TEXT, "
+            "outputName TEXT NOT NULL, removed REAL)")
+
+    path: str
+
+    def files(self, repoName : str):
+        """Returns {sourceId: (blobSha, outputName)} for the files of repoName that have not been removed."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT sourceId, blobSha, outputName FROM files WHERE repoName = ? AND removed IS NULL", (repoName,)).fetchall()
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def tombstones(self, repoName : str):
+        """Returns {sourceId: time removed} for the files of repoName that have been removed."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT sourceId, removed FROM files WHERE repoName = ? AND removed IS NOT NULL", (repoName,)).fetchall()
+        return dict(rows)
+
+    def put(self, sourceId : str, repoName : str, blobSha : str, outputName : str):
+        """Records that sourceId was converted from blobSha, bringing it back if it had been removed."""
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (sourceId, repoName, blobSha, outputName, removed) VALUES (?, ?, ?, ?, NULL)",
+                (sourceId, repoName, blobSha, outputName))
+
+    def remove(self, sourceId : str):
+        """Turns sourceId into a tombstone."""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE files SET blobSha = NULL, removed = ? WHERE sourceId = ?", (time.time(), sourceId))
+
+    def close(self):
+        """Closes the underlying database."""
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -3,6 +3,7 @@ import os
 
 # Local Modules
 from common.ApiConfiguration import ApiConfiguration
+from common.chunk_store import chunk_file_name
 from common.Urls import gitHubUrls, countUrlHits
 from common.common_functions import ensure_directory_exists
 from github.download_markdown import download_markdown
@@ -17,12 +18,12 @@ ensure_directory_exists(MARKDOWN_DESTINATION_DIR)
 config = ApiConfiguration()
 
 for item in gitHubUrls:
-   download_markdown (item[2], item[1], MARKDOWN_DESTINATION_DIR)
+   download_markdown (item[2], item[1], MARKDOWN_DESTINATION_DIR, config)
 
 enrich_text_chunks(config,MARKDOWN_DESTINATION_DIR) 
 enrich_text_summaries(config, MARKDOWN_DESTINATION_DIR)
 enrich_text_embeddings(config, MARKDOWN_DESTINATION_DIR)
-enrich_lite(MARKDOWN_DESTINATION_DIR)
+enrich_lite(MARKDOWN_DESTINATION_DIR, config)
 
 output_dir = os.path.join(MARKDOWN_DESTINATION_DIR, "output") 
-countUrlHits (output_dir, gitHubUrls, "master_text.json", "hit_test_results.json")
\ No newline at end of file
+countUrlHits (output_dir, gitHubUrls, chunk_file_name("master_text", config), "hit_test_results.json")
\ No newline at end of file
@@ -0,0 +1,31 @@
+""" Fixtures shared by the tests."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import sys
+
+# Third-Party Packages
+import pytest
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from benchmark.mock_openai_server import start_mock_server
+
+
+@pytest.fixture
+def server(request):
+    """
+    Fixture to run a local mock of the Azure OpenAI endpoints for the duration of a test.
+    The server answers at once unless a test parametrizes it indirectly with a latency in seconds.
+
+    Returns:
+        MockOpenAiServer: The running server
+    """
+    server = start_mock_server(getattr(request, "param", 0.0))
+    yield server
+    server.shutdown()
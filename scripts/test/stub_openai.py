@@ -0,0 +1,86 @@
+""" AzureOpenAI client stand-ins shared by the tests."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Third-Party Packages
+from openai import BadRequestError
+
+
+class StubEmbeddingItem:
+    def __init__(self, index, embedding) -> None:
+        self.index = index
+        self.embedding = embedding
+
+
+class StubEmbeddingResponse:
+    def __init__(self, data) -> None:
+        self.data = data
+
+
+class StubHttpResponse:
+    """Minimal httpx.Response stand-in needed to construct an openai error."""
+
+    def __init__(self) -> None:
+        self.status_code = 400
+        self.headers = {}
+        self.request = None
+
+
+class StubEmbeddings:
+    """
+    Local stand-in for AzureOpenAI.embeddings that records every call. A batch of more than one
+    text containing failOn raises error, or a BadRequestError if no error is given.
+    """
+
+    def __init__(self, failOn=None, error=None) -> None:
+        self.calls = []
+        self.failOn = failOn
+        self.error = error
+
+    def create(self, input, model, timeout):
+        self.calls.append(list(input))
+
+        if self.failOn and len(input) > 1 and any(self.failOn in text for text in input):
+            raise self.error or BadRequestError("bad input", response=StubHttpResponse(), body=None)
+
+        # Return the vectors in reverse order to check they are scattered back by index
+        data = [StubEmbeddingItem(i, [float(len(text)), float(i)]) for i, text in enumerate(input)]
+        data.reverse()
+        return StubEmbeddingResponse(data)
+
+
+class StubMessage:
+    def __init__(self, content) -> None:
+        self.content = content
+
+
+class StubChoice:
+    def __init__(self, content) -> None:
+        self.message = StubMessage(content)
+        self.finish_reason = "stop"
+
+
+class StubChatResponse:
+    def __init__(self, content) -> None:
+        self.choices = [StubChoice(content)]
+
+
+class StubCompletions:
+    """Local stand-in for AzureOpenAI.chat.completions that records every call."""
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def create(self, model, messages, **kwargs):
+        self.calls.append(messages)
+        return StubChatResponse(f"Summary {len(self.calls)} of: {messages[1]['content']}")
+
+
+class StubChat:
+    def __init__(self) -> None:
+        self.completions = StubCompletions()
+
+
+class StubClient:
+    def __init__(self, failOn=None, error=None) -> None:
+        self.embeddings = StubEmbeddings(failOn, error)
+        self.chat = StubChat()
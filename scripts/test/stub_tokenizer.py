@@ -0,0 +1,12 @@
+""" Tokenizer stand-in shared by the tests."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+
+class StubTokenizer:
+    """Tokenizer stand-in that counts one token per word, so tests do not need to download tiktoken encodings."""
+
+    def encode(self, text, **kwargs):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
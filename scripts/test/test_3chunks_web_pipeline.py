@@ -26,7 +26,7 @@ AVERAGE_CHARACTERS_PER_TOKEN = 4
 AVERAGE_TOKENS_PER_WORD = 1.33
 
 # Mock configuration for the chunking process
-Config = namedtuple('Config', ['chunkDurationMins', 'discardIfBelow', 'maxTokens'])
+Config = namedtuple('Config', ['chunkDurationMins', 'discardIfBelow', 'maxTokens', 'chunkFileFormat', 'chunkingProcesses', 'chunkingMode'], defaults=['json', 0, 'segments'])
 mock_config = Config(chunkDurationMins=1, discardIfBelow=10, maxTokens=15)  # Adjust maxTokens to ensure chunking
 
 # Mock metadata for chunks, used in the tests
@@ -90,7 +90,7 @@ def create_tokenizer_mock():
 @patch('scripts.web.download_html.requests.Session')
 @patch('builtins.open', new_callable=mock_open)
 @patch('json.dump')
-def test_download_html(mock_json_dump, mock_file, mock_session):
+def test_download_html(mock_json_dump, mock_file, mock_session, tmp_path):
     """
     Test the download_html function for downloading and processing HTML content.
 
@@ -98,23 +98,26 @@ def test_download_html(mock_json_dump, mock_file, mock_session):
         mock_json_dump: Mock for the json.dump function.
         mock_file: Mock for the open function.
         mock_session: Mock for the requests.Session class.
+        tmp_path: Folder for the crawl state database, which is not written through the mocked open.
     """
     # Mock HTML content
     mock_html = "<html><body><p>This is a test paragraph.</p></body></html>"
     mock_response = mock_session.return_value.get.return_value
     mock_response.content = mock_html.encode('utf-8')
     mock_response.text = mock_html
+    mock_response.status_code = 200
+    mock_response.headers = {}
 
     # Mock BeautifulSoup
     with patch('scripts.web.download_html.BeautifulSoup') as mock_bs:
         mock_bs.return_value.get_text.return_value = "This is a test paragraph."
 
         # Run the download_html function
-        download_html('http://example.com', False, '/tmp/html', 1)
+        download_html('http://example.com', False, str(tmp_path / 'html'), 1)
 
     # Adjusted expected file path for content
-    expected_content_file_path = os.path.normpath('/tmp/html/example.com.json.mdd')
-    expected_metadata_file_path = os.path.normpath('/tmp/html/example.com.json')
+    expected_content_file_path = os.path.normpath(str(tmp_path / 'html' / 'example.com.json.mdd'))
+    expected_metadata_file_path = os.path.normpath(str(tmp_path / 'html' / 'example.com.json'))
 
     # Normalize the actual file paths called with
     actual_content_file_path = os.path.normpath(mock_file.call_args_list[0][0][0])
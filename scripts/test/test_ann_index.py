@@ -0,0 +1,102 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import sys
+
+# Third-Party Packages
+import numpy as np
+import pytest
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.retrieval import EmbeddingIndex
+from common.ann_index import IvfIndex, ann_index_path, build_ann_index_file, load_ann_index_file
+from common.chunk_store import ChunkWriter
+
+
+def clustered_matrix(count: int, dimensions: int, topics: int, seed: int):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(topics, dimensions))
+    return centres[rng.integers(0, topics, size=count)] + 0.5 * rng.normal(size=(count, dimensions)), rng
+
+
+def recall(found, expected):
+    return np.mean([len({r for r, s in a} & {r for r, s in b}) / len(b) for a, b in zip(found, expected)])
+
+
+def test_ivf_recall_against_exact_search() -> None:
+    matrix, rng = clustered_matrix(3000, 32, 30, 11)
+    queries = matrix[rng.choice(3000, 50, replace=False)] + 0.2 * rng.normal(size=(50, 32))
+    expected = EmbeddingIndex(matrix).search_batch(queries, 10)
+    index = IvfIndex.build(matrix, lists=40, probe=8)
+
+    assert len(index) == 3000
+    assert sorted(index.rows.tolist()) == list(range(3000))
+
+    # Probing every list is exhaustive, so it is exact
+    exhaustive = index.search_batch(queries, 10, probe=40)
+    assert recall(exhaustive, expected) == 1.0
+    assert np.allclose([s for r, s in exhaustive[0]], [s for r, s in expected[0]], atol=1e-5)
+
+    assert recall(index.search_batch(queries, 10), expected) > 0.9
+    assert index.search(queries[0], 10) == index.search_batch(queries, 10)[0]
+
+
+def test_ivf_save_and_load(tmp_path) -> None:
+    matrix, rng = clustered_matrix(500, 16, 5, 3)
+    index = IvfIndex.build(matrix, lists=10, probe=3)
+    path = os.path.join(str(tmp_path), "index.ivf.npz")
+    index.save(path)
+
+    loaded = IvfIndex.load(path)
+    assert loaded.probe == 3
+    query = rng.normal(size=16)
+    assert loaded.search(query, 5) == index.search(query, 5)
+
+
+def test_build_ann_index_file_skips_chunks_without_embeddings(tmp_path) -> None:
+    matrix, rng = clustered_matrix(200, 8, 4, 5)
+    chunk_file = os.path.join(str(tmp_path), "master_enriched.jsonl")
+    with ChunkWriter(chunk_file) as writer:
+        writer.write({"sourceId": "https://example.com/empty", "text": ""})
+        for i, row in enumerate(matrix):
+            writer.write({"sourceId": f"https://example.com/{i}", "ada_v2": row.tolist()})
+
+    build_ann_index_file(chunk_file, lists=4, probe=4)
+
+    assert ann_index_path(chunk_file) == os.path.join(str(tmp_path), "master_enriched.ivf.npz")
+    index = IvfIndex.load(ann_index_path(chunk_file))
+    assert len(index) == 200
+    assert index.search(matrix[17], 1)[0][0] == 17
+
+
+def test_ann_index_file_checks_its_chunks(tmp_path) -> None:
+    matrix, rng = clustered_matrix(50, 8, 4, 7)
+    chunks = [{"sourceId": f"https://example.com/{i}", "start": "0", "text": f"Chunk {i}", "ada_v2": row.tolist()}
+              for i, row in enumerate(matrix)]
+    chunk_file = os.path.join(str(tmp_path), "master_enriched.jsonl")
+
+    def write(chunks):
+        with ChunkWriter(chunk_file) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+
+    write(chunks)
+    build_ann_index_file(chunk_file, lists=4, probe=4)
+    index = load_ann_index_file(chunk_file)
+    assert index.search(matrix[9], 1)[0][0] == 9
+
+    # Reordered or re-chunked files no longer line up with the index's rows
+    write(chunks[1:] + chunks[:1])
+    with pytest.raises(ValueError):
+        load_ann_index_file(chunk_file)
+
+    chunks[3]["text"] = "Chunk 3, chunked again"
+    write(chunks)
+    with pytest.raises(ValueError):
+        load_ann_index_file(chunk_file)
@@ -0,0 +1,69 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import json
+import sys
+from unittest.mock import patch
+
+# Third-Party Packages
+import pytest
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.ApiConfiguration import ApiConfiguration
+from text.enrich_text_summaries import enrich_text_summaries
+from text.enrich_text_embeddings import enrich_text_embeddings
+from .stub_tokenizer import StubTokenizer
+
+
+def make_config(server, asyncMode: bool) -> ApiConfiguration:
+    config = ApiConfiguration()
+    config.resourceEndpoint = server.endpoint
+    config.apiKey = "mock"
+    config.embeddingCacheFile = ""
+    config.summaryCacheFile = ""
+    # Rate limiting is tested in test_rate_limiter, keep it out of the way here
+    config.chatRequestsPerMinute = config.chatTokensPerMinute = 0
+    config.embedRequestsPerMinute = config.embedTokensPerMinute = 0
+    config.embeddingBatchSize = 4
+    config.asyncMode = asyncMode
+    config.processingThreads = 4
+    config.maxConcurrentRequests = 16
+    return config
+
+
+def run_stages(server, destinationDir: str, asyncMode: bool) -> bytes:
+    os.makedirs(os.path.join(destinationDir, "output"), exist_ok=True)
+    chunks = [{"sourceId": f"https://example.com/page{i // 3}", "start": str(i % 3),
+               "text": f"Chunk {i} about topic {i % 5} with a few more words"} for i in range(30)]
+    with open(os.path.join(destinationDir, "output", "master_text.json"), "w", encoding="utf-8") as f:
+        json.dump(chunks, f)
+
+    config = make_config(server, asyncMode)
+    enrich_text_summaries(config, destinationDir)
+    with patch('text.enrich_text_embeddings.tiktoken.encoding_for_model', return_value=StubTokenizer()):
+        enrich_text_embeddings(config, destinationDir)
+
+    with open(os.path.join(destinationDir, "output", "master_enriched.json"), "rb") as f:
+        return f.read()
+
+
+# The server takes 10ms a request, so the threads and the event loop have requests in flight together
+@pytest.mark.parametrize("server", [0.01], indirect=True)
+def test_async_output_matches_threaded(tmp_path, server) -> None:
+    threaded = run_stages(server, os.path.join(str(tmp_path), "threaded"), False)
+    threaded_requests = server.requests
+    asynchronous = run_stages(server, os.path.join(str(tmp_path), "async"), True)
+
+    assert asynchronous == threaded
+    assert server.requests == 2 * threaded_requests
+
+    enriched = json.loads(threaded)
+    assert len(enriched) == 30
+    assert all(chunk["summary"].startswith("Summary: Chunk") for chunk in enriched)
+    assert all(len(chunk["ada_v2"]) == 8 for chunk in enriched)
@@ -0,0 +1,56 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import sys
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.common_functions import make_chunk_key, build_chunk_index
+from text.enrich_text_embeddings import find_cached_chunks
+
+
+def make_chunk(sourceId: str, start: str, text: str, enriched: bool = True) -> dict:
+    chunk = {"sourceId": sourceId, "start": start, "text": text}
+    if enriched:
+        chunk["summary"] = "Summary of " + text
+        chunk["ada_v2"] = [float(len(text))]
+    return chunk
+
+
+def test_chunks_sharing_source_id_have_distinct_keys() -> None:
+    first = make_chunk("video1", "00:00:00", "first clip")
+    second = make_chunk("video1", "00:10:00", "second clip")
+
+    assert make_chunk_key(first) != make_chunk_key(second)
+
+
+def test_changed_text_changes_key() -> None:
+    before = make_chunk("page1", "0", "old text")
+    after = make_chunk("page1", "0", "new text")
+
+    assert make_chunk_key(before) != make_chunk_key(after)
+
+
+def test_index_skips_chunks_missing_summary_or_embedding() -> None:
+    cached = [make_chunk("page1", "0", "some text"), make_chunk("page2", "0", "other text", enriched=False)]
+    index = build_chunk_index(cached)
+
+    assert list(index.keys()) == [make_chunk_key(cached[0])]
+
+
+def test_find_cached_chunks_matches_each_chunk_to_its_own_entry() -> None:
+    cached = [make_chunk("video1", "00:00:00", "first clip"), make_chunk("video1", "00:10:00", "second clip")]
+    chunks = [make_chunk("video1", "00:10:00", "second clip", enriched=False),
+              make_chunk("video1", "00:00:00", "first clip", enriched=False),
+              make_chunk("video1", "00:20:00", "third clip", enriched=False)]
+
+    remaining = find_cached_chunks(chunks, build_chunk_index(cached))
+
+    assert chunks[0]["summary"] == "Summary of second clip"
+    assert chunks[1]["summary"] == "Summary of first clip"
+    assert remaining == [chunks[2]]
@@ -0,0 +1,161 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import json
+import sys
+from unittest.mock import patch
+
+# Third-Party Packages
+import pytest
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.ApiConfiguration import ApiConfiguration
+from common.chunk_store import read_chunks, read_chunk_windows, count_chunks, ChunkWriter, ChunkFileIndex, convert_chunk_file
+from common.common_functions import make_chunk_key, build_chunk_index
+from common.Urls import countUrlHits
+from text.enrich_text_summaries import enrich_text_summaries
+from text.enrich_text_embeddings import enrich_text_embeddings
+from text.enrich_lite import enrich_lite
+from .stub_tokenizer import StubTokenizer
+
+
+def make_chunks(count: int):
+    return [{"sourceId": f"https://example.com/page{(count - i) // 3}", "start": str(i % 3),
+             "hitTrackingId": "https://example.com", "text": f"Chunk {i} about café topic {i % 5}"} for i in range(count)]
+
+
+def test_legacy_writer_matches_original_layout(tmp_path) -> None:
+    chunks = make_chunks(10)
+    path = os.path.join(str(tmp_path), "master_text.json")
+
+    with ChunkWriter(path, sortKey=lambda x: x["sourceId"]) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    expected = sorted(chunks, key=lambda x: x["sourceId"])
+    with open(path, "r", encoding="utf-8") as f:
+        assert f.read() == json.dumps(expected, ensure_ascii=False, indent=4)
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_jsonl_round_trip_and_conversion(tmp_path) -> None:
+    chunks = make_chunks(25)
+    jsonl = os.path.join(str(tmp_path), "master_text.jsonl")
+    legacy = os.path.join(str(tmp_path), "master_text.json")
+    back = os.path.join(str(tmp_path), "back.jsonl")
+
+    with ChunkWriter(jsonl) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    assert list(read_chunks(jsonl)) == chunks
+    assert count_chunks(jsonl) == 25
+    assert [len(window) for window in read_chunk_windows(jsonl, 10)] == [10, 10, 5]
+
+    assert convert_chunk_file(jsonl, legacy) == 25
+    assert list(read_chunks(legacy)) == chunks
+    convert_chunk_file(legacy, back)
+    with open(jsonl, "rb") as a, open(back, "rb") as b:
+        assert a.read() == b.read()
+
+
+def test_failed_write_keeps_previous_file(tmp_path) -> None:
+    path = os.path.join(str(tmp_path), "master_enriched.jsonl")
+    with ChunkWriter(path) as writer:
+        writer.write({"sourceId": "old"})
+
+    with pytest.raises(RuntimeError):
+        with ChunkWriter(path) as writer:
+            writer.write({"sourceId": "new"})
+            raise RuntimeError("stage failed")
+
+    assert list(read_chunks(path)) == [{"sourceId": "old"}]
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_file_index_matches_dict_index(tmp_path) -> None:
+    chunks = make_chunks(12)
+    for i, chunk in enumerate(chunks):
+        if i % 4:
+            chunk["summary"] = f"summary {i}"
+            chunk["ada_v2"] = [float(i)]
+    path = os.path.join(str(tmp_path), "master_enriched.jsonl")
+    with ChunkWriter(path) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    expected = build_chunk_index(chunks)
+    index = ChunkFileIndex(path, make_chunk_key)
+    try:
+        assert len(index) == len(expected)
+        for chunk in chunks:
+            assert index.get(make_chunk_key(chunk)) == expected.get(make_chunk_key(chunk))
+    finally:
+        index.close()
+
+
+def run_pipeline(server, destinationDir: str, chunkFileFormat: str, chunks: list):
+    config = ApiConfiguration()
+    config.resourceEndpoint = server.endpoint
+    config.apiKey = "mock"
+    config.embeddingCacheFile = ""
+    config.summaryCacheFile = ""
+    config.chatRequestsPerMinute = config.chatTokensPerMinute = 0
+    config.embedRequestsPerMinute = config.embedTokensPerMinute = 0
+    config.chunkFileFormat = chunkFileFormat
+    config.chunkWindow = 7
+    config.processingThreads = 3
+
+    output_dir = os.path.join(destinationDir, "output")
+    os.makedirs(output_dir)
+    suffix = "." + chunkFileFormat
+    with ChunkWriter(os.path.join(output_dir, "master_text" + suffix)) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    enrich_text_summaries(config, destinationDir)
+    with patch('text.enrich_text_embeddings.tiktoken.encoding_for_model', return_value=StubTokenizer()):
+        enrich_text_embeddings(config, destinationDir)
+    enrich_lite(destinationDir, config)
+    countUrlHits(output_dir, [["Example", "https://example.com"]], "master_text" + suffix, "hits.json")
+
+    with open(os.path.join(output_dir, "hits.json"), "r", encoding="utf-8") as f:
+        hits = json.load(f)
+    return output_dir, suffix, hits
+
+
+def test_jsonl_pipeline_matches_legacy(tmp_path, server) -> None:
+    chunks = make_chunks(30)
+    legacy_dir, legacy_suffix, legacy_hits = run_pipeline(server, os.path.join(str(tmp_path), "json"), "json", chunks)
+    jsonl_dir, jsonl_suffix, jsonl_hits = run_pipeline(server, os.path.join(str(tmp_path), "jsonl"), "jsonl", chunks)
+
+    assert jsonl_hits == legacy_hits == [{"path": "https://example.com", "desc": "Example", "hits": 30}]
+
+    for name in ["master_enriched", "master_enriched_lite"]:
+        legacy = list(read_chunks(os.path.join(legacy_dir, name + legacy_suffix)))
+        streamed = list(read_chunks(os.path.join(jsonl_dir, name + jsonl_suffix)))
+        # JSONL keeps input order rather than sorting the whole corpus
+        assert sorted(streamed, key=lambda x: x["sourceId"]) == legacy
+        assert len(streamed) == 30
+
+    # A second run finds every chunk in the resume index and makes no more calls
+    requests = server.requests
+    run_again = ApiConfiguration()
+    run_again.resourceEndpoint = server.endpoint
+    run_again.apiKey = "mock"
+    run_again.chunkFileFormat = "jsonl"
+    run_again.summaryCacheFile = ""
+    # The resume index lets go of the output file before the new output replaces it, as Windows needs
+    events = []
+    close, replace = ChunkFileIndex.close, os.replace
+    with patch.object(ChunkFileIndex, "close", lambda self: (events.append("close"), close(self))), \
+         patch("common.chunk_store.os.replace", lambda *args: (events.append("replace"), replace(*args))):
+        enrich_text_summaries(run_again, os.path.dirname(jsonl_dir))
+    assert server.requests == requests
+    assert events == ["close", "replace"]
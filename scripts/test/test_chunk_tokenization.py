@@ -0,0 +1,176 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import json
+import random
+import re
+import sys
+from unittest.mock import patch
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+
+class CountingTokenizer:
+    """One token per word, recording every text it is asked to encode."""
+
+    def __init__(self) -> None:
+        self.encoded = []
+
+    def encode(self, text, **kwargs):
+        self.encoded.append(text)
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+# The youtube package needs a key and a tiktoken encoding when imported; neither is used here
+os.environ.setdefault("GOOGLE_DEVELOPER_API_KEY", "unused")
+with patch("tiktoken.encoding_for_model", return_value=CountingTokenizer()), \
+     patch("tiktoken.get_encoding", return_value=CountingTokenizer()):
+    from youtube.enrich_transcript_chunks import parse_json_vtt_transcript
+    from text.enrich_text_chunks import parse_json_mdd_transcript, token_windows, PERCENTAGE_OVERLAP
+
+from common.ApiConfiguration import ApiConfiguration
+
+
+class PieceTokenizer:
+    """Words, punctuation and runs of whitespace as tokens, so decoding gives back exactly the text encoded."""
+
+    pattern = re.compile(r"\w+|[^\w\s]|\s+")
+
+    def encode(self, text, **kwargs):
+        return self.pattern.findall(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def write_segments(path, segments):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(segments, f)
+
+
+def lecture_segments(count, wordsPerSegment):
+    return [{"text": " ".join(f"w{i}x{j}" for j in range(wordsPerSegment)), "start": str(i * 4), "duration": 4}
+            for i in range(count)]
+
+
+def test_transcript_segments_are_encoded_once(tmp_path) -> None:
+    path = str(tmp_path / "lecture.json.vtt")
+    segments = lecture_segments(1000, 10)
+    write_segments(path, segments)
+    tokenizer = CountingTokenizer()
+
+    with patch("youtube.enrich_transcript_chunks.tokenizer", tokenizer):
+        chunks = parse_json_vtt_transcript(path, {"speaker": "", "title": "Lecture", "description": ""}, [], 10, 4000)
+
+    assert tokenizer.encoded == ["Lecture. "] + [segment["text"] for segment in segments]
+
+    # 150 segments make 10 minutes, and the 100 left over fit in the last chunk
+    assert len(chunks) == 6
+    assert chunks[0]["text"].startswith("Lecture. w0x0 ")
+    assert chunks[1]["text"].startswith("w150x0 ")
+    assert chunks[-1]["text"].endswith("w999x9 ")
+
+
+def test_transcript_tail_joins_previous_chunk(tmp_path) -> None:
+    path = str(tmp_path / "lecture.json.vtt")
+    segments = lecture_segments(160, 2)
+    write_segments(path, segments)
+    tokenizer = CountingTokenizer()
+
+    with patch("youtube.enrich_transcript_chunks.tokenizer", tokenizer):
+        chunks = parse_json_vtt_transcript(path, {"speaker": "", "title": "Lecture", "description": ""}, [], 10, 1000)
+
+    assert len(tokenizer.encoded) == 1 + len(segments)
+    assert len(chunks) == 1
+    assert chunks[0]["text"].endswith("w159x0 w159x1 ")
+
+
+def test_document_segments_are_encoded_once(tmp_path) -> None:
+    path = str(tmp_path / "page.json.mdd")
+    segments = [{"text": " ".join(f"w{i}x{j}" for j in range(100)), "start": str(700 + i)} for i in range(30)]
+    write_segments(path, segments)
+    config = ApiConfiguration()
+    config.maxTokens = 1000
+    config.discardIfBelow = 10
+    tokenizer = CountingTokenizer()
+
+    chunks = []
+    parse_json_mdd_transcript(config, path, {"title": "Page", "description": ""}, tokenizer, chunks)
+
+    assert tokenizer.encoded == ["Page. "] + [segment["text"] for segment in segments]
+    # Nine segments to a chunk, and the three left over are too many to join the last one
+    assert len(chunks) == 4
+    assert chunks[-1]["text"].startswith("w27x0 ")
+
+
+def test_document_over_the_limit_is_not_encoded_again(tmp_path) -> None:
+    path = str(tmp_path / "page.json.mdd")
+    segments = [{"text": " ".join(f"w{i}x{j}" for j in range(100)), "start": "0"} for i in range(8)]
+    write_segments(path, segments)
+    config = ApiConfiguration()
+    config.maxTokens = 1000
+    config.discardIfBelow = 10
+    tokenizer = CountingTokenizer()
+
+    chunks = []
+    parse_json_mdd_transcript(config, path, {"title": "Page", "description": ""}, tokenizer, chunks)
+
+    # The sixth segment takes the text past 600 tokens, and the text held so far is windowed from its running token ids
+    assert tokenizer.encoded == ["Page. "] + [segment["text"] for segment in segments[:6]]
+    assert len(chunks) == 2
+    assert chunks[0]["text"].startswith("Page. w0x0 ")
+    assert chunks[-1]["text"].endswith("w5x99")
+
+
+def test_token_windows_cover_with_exact_overlap() -> None:
+    rng = random.Random(18)
+    for _ in range(2000):
+        tokenCount = rng.randrange(1, 5000)
+        windowTokens = rng.randrange(2, 700)
+        overlapTokens = rng.randrange(0, windowTokens)
+        windows = token_windows(tokenCount, windowTokens, overlapTokens)
+
+        assert windows[0][0] == 0
+        assert windows[-1][1] == tokenCount
+        assert all(end - begin == windowTokens for begin, end in windows[:-1])
+        assert 0 < windows[-1][1] - windows[-1][0] <= windowTokens
+        for (begin, end), (nextBegin, nextEnd) in zip(windows, windows[1:]):
+            assert end - nextBegin == overlapTokens
+            assert nextEnd > end
+        # No window is needed beyond the one that reaches the end
+        assert len(windows) == 1 or windows[-2][1] < tokenCount
+
+
+def test_long_document_is_chunked_in_exact_token_windows(tmp_path) -> None:
+    rng = random.Random(7)
+    words = ["gradient", "descent,", "converges", "(slowly)", "to", "a", "minimum.", "\n\n", "The", "loss"]
+    body = " ".join(rng.choice(words) for _ in range(5000))
+    path = str(tmp_path / "page.json.mdd")
+    write_segments(path, [{"text": body, "start": "0"}])
+    config = ApiConfiguration()
+    config.discardIfBelow = 0
+    tokenizer = PieceTokenizer()
+
+    chunks = []
+    parse_json_mdd_transcript(config, path, {"title": "Page", "description": ""}, tokenizer, chunks)
+
+    windowTokens = min(config.chunkDurationMins * 60, config.maxTokens)
+    overlapTokens = int(windowTokens * PERCENTAGE_OVERLAP)
+    tokens = [tokenizer.encode(chunk["text"]) for chunk in chunks]
+    assert len(chunks) > 1
+    assert all(len(chunkTokens) == windowTokens for chunkTokens in tokens[:-1])
+    assert 0 < len(tokens[-1]) <= windowTokens
+
+    # Each chunk begins with the last overlapTokens of the one before, and dropping them gives back the page
+    for previous, chunkTokens in zip(tokens, tokens[1:]):
+        assert chunkTokens[:overlapTokens] == previous[-overlapTokens:]
+    joined = chunks[0]["text"] + "".join(tokenizer.decode(chunkTokens[overlapTokens:]) for chunkTokens in tokens[1:])
+    assert joined == "Page. " + body
+    assert [int(chunk["start"]) for chunk in chunks] == [i * (windowTokens - overlapTokens) for i in range(len(chunks))]
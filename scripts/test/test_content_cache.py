@@ -0,0 +1,155 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import sys
+import logging
+
+# Third-Party Packages
+import pytest
+
+logger = logging.getLogger(__name__)
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.ApiConfiguration import ApiConfiguration
+from common.content_cache import ContentCache, make_cache_key
+from common.common_functions import get_embedding, get_embeddings
+from text.enrich_text_summaries import chatgpt_summary
+from .stub_openai import StubClient
+
+
+@pytest.fixture
+def config(tmp_path) -> ApiConfiguration:
+    """
+    Fixture to create an instance of ApiConfiguration with an embedding cache in a temporary directory.
+
+    Returns:
+        ApiConfiguration: An instance of the ApiConfiguration class
+    """
+    config = ApiConfiguration()
+    config.embeddingCacheFile = os.path.join(str(tmp_path), "cache", "embeddings.sqlite")
+    config.summaryCacheFile = os.path.join(str(tmp_path), "cache", "summaries.sqlite")
+    # The stub clients have no raw responses to read rate limit headers from
+    config.chatRequestsPerMinute = config.chatTokensPerMinute = 0
+    config.embedRequestsPerMinute = config.embedTokensPerMinute = 0
+    return config
+
+
+def test_cache_round_trip_and_stats(tmp_path) -> None:
+    cache = ContentCache(os.path.join(str(tmp_path), "cache.sqlite"), 10)
+    key = make_cache_key("some text", "model")
+
+    assert cache.get(key) is None
+    cache.put(key, b"value")
+    assert cache.get(key) == b"value"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+    cache.close()
+
+
+def test_cache_persists_between_opens(tmp_path) -> None:
+    path = os.path.join(str(tmp_path), "cache.sqlite")
+    cache = ContentCache(path, 10)
+    cache.put("key", b"value")
+    cache.close()
+
+    cache = ContentCache(path, 10)
+    assert cache.get("key") == b"value"
+    cache.close()
+
+
+def test_cache_evicts_least_recently_used(tmp_path) -> None:
+    cache = ContentCache(os.path.join(str(tmp_path), "cache.sqlite"), 3)
+    for key in ["a", "b", "c"]:
+        cache.put(key, key.encode())
+
+    # Touch "a" so "b" becomes the oldest
+    cache.get("a")
+    cache.put("d", b"d")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 3
+    cache.close()
+
+
+def test_cache_replacing_a_key_does_not_evict(tmp_path) -> None:
+    cache = ContentCache(os.path.join(str(tmp_path), "cache.sqlite"), 2)
+    cache.put("a", b"a")
+    cache.put("b", b"b")
+    cache.put("a", b"new")
+
+    assert cache.get("a") == b"new"
+    assert cache.get("b") == b"b"
+    assert cache.stats()["evictions"] == 0
+    assert cache.stats()["entries"] == 2
+    cache.close()
+
+
+def test_key_depends_on_every_part() -> None:
+    assert make_cache_key("text", "model1") != make_cache_key("text", "model2")
+    assert make_cache_key("ab", "c") != make_cache_key("a", "bc")
+
+
+def test_get_embedding_uses_cache(config: ApiConfiguration) -> None:
+    client = StubClient()
+
+    first = get_embedding("some  chunk\ntext", client, config)
+    second = get_embedding("some chunk text", client, config)
+
+    # Whitespace differences normalise to the same key, so only one call is made
+    assert len(client.embeddings.calls) == 1
+    assert first == second
+
+
+def test_get_embeddings_only_sends_misses(config: ApiConfiguration) -> None:
+    client = StubClient()
+    get_embeddings(["one", "two"], client, config)
+
+    embeddings = get_embeddings(["one", "three", "two", "four"], client, config)
+
+    assert client.embeddings.calls == [["one", "two"], ["three", "four"]]
+    assert embeddings[0] == [3.0, 0.0]
+    assert embeddings[1] == [5.0, 0.0]
+    assert embeddings[2] == [3.0, 1.0]
+    assert embeddings[3] == [4.0, 1.0]
+
+
+def test_get_embeddings_all_cached_makes_no_call(config: ApiConfiguration) -> None:
+    client = StubClient()
+    get_embeddings(["one", "two"], client, config)
+    get_embeddings(["two", "one"], client, config)
+
+    assert len(client.embeddings.calls) == 1
+
+
+def test_summary_cache_reuses_summary(config: ApiConfiguration) -> None:
+    client = StubClient()
+
+    first = chatgpt_summary(client, config, "Some page text", logger)
+    second = chatgpt_summary(client, config, "Some page text", logger)
+
+    assert len(client.chat.completions.calls) == 1
+    assert first == second
+
+
+def test_summary_cache_keys_on_word_count_and_deployment(config: ApiConfiguration) -> None:
+    client = StubClient()
+
+    chatgpt_summary(client, config, "Some text", logger)
+    config.summaryWordCount = 100
+    chatgpt_summary(client, config, "Some text", logger)
+    config.azureDeploymentName = "OtherDeployment"
+    chatgpt_summary(client, config, "Some text", logger)
+    chatgpt_summary(client, config, "Other text", logger)
+
+    assert len(client.chat.completions.calls) == 4
@@ -0,0 +1,169 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import json
+import logging
+import sys
+from unittest.mock import patch
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.ApiConfiguration import ApiConfiguration
+from common.document_layout import DocumentManifest, DocumentStore, DOCUMENT_MANIFEST_FILE, document_files, sharded_name
+from common.html_text import get_html_extractor
+from github.download_markdown import download_markdown
+from text.enrich_text_chunks import enrich_text_chunks
+from web.download_html import get_html
+from web.page_store import PageStore
+from .stub_tokenizer import StubTokenizer
+
+
+def write_repo(repoDir, names=("README.md", "setup.md")):
+    for part in range(3):
+        folder = os.path.join(repoDir, f"part{part}")
+        os.makedirs(folder)
+        for name in names:
+            name = name.format(part=part)
+            with open(os.path.join(folder, name), "w", encoding="utf-8") as f:
+                f.write(f"# {name} of part {part}\n\n" + " ".join(f"p{part}w{i}" for i in range(40)) + "\n")
+
+
+def test_sharded_name() -> None:
+    name = sharded_name("repo/part0/README.md")
+    first, second, digest = name.split("/")
+    assert len(digest) == 40 and digest.startswith(first + second)
+    assert sharded_name("repo/part1/README.md") != name
+
+
+@patch('text.enrich_text_chunks.tiktoken.encoding_for_model', return_value=StubTokenizer())
+def test_sharded_markdown_keeps_every_file(mock_encoding, tmp_path) -> None:
+    repoDir = str(tmp_path / "repo")
+    markdownDir = str(tmp_path / "markdown")
+    write_repo(repoDir)
+    config = ApiConfiguration()
+    config.outputLayout = "sharded"
+    config.markdownIncremental = True
+    config.discardIfBelow = 1
+
+    download_markdown(repoDir, "repo", markdownDir, config)
+
+    # Every README.md is kept, each under its own hash, and nothing is written at the top level but the manifests
+    sourceIds = [f"repo/part{part}/{name}" for part in range(3) for name in ("README.md", "setup.md")]
+    with DocumentManifest(markdownDir) as manifest:
+        paths = manifest.paths()
+    assert list(paths) == sorted(sourceIds)
+    for sourceId, path in paths.items():
+        assert path == os.path.join(markdownDir, sharded_name(sourceId) + ".json")
+        with open(path, encoding="utf-8") as f:
+            assert json.load(f)["sourceId"] == sourceId
+    assert not [name for name in os.listdir(markdownDir) if name.endswith(".json")]
+
+    enrich_text_chunks(config, markdownDir)
+    with open(os.path.join(markdownDir, "output", "master_text.json"), "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    assert {chunk["sourceId"] for chunk in chunks} == set(sourceIds)
+
+    # A removed file leaves the manifest, and so the chunks
+    os.remove(os.path.join(repoDir, "part1", "README.md"))
+    download_markdown(repoDir, "repo", markdownDir, config)
+    assert len(document_files(markdownDir)) == 5
+    assert not os.path.exists(paths["repo/part1/README.md"])
+
+
+def test_sharded_html(tmp_path) -> None:
+    htmlDir = str(tmp_path / "web")
+    logger = logging.getLogger(__name__)
+    extractor = get_html_extractor("html.parser")
+    page = b"<html><body><p>" + b" word" * 200 + b"</p></body></html>"
+
+    with PageStore(1 << 20) as pageStore, DocumentManifest(htmlDir) as documents:
+        for url in ("https://example.com/docs/index.html", "https://example.com/blog/index.html"):
+            pageStore.put(url, page)
+            assert get_html(url, 1, "https://example.com", htmlDir, logger, 10, None, pageStore, None, extractor, documents)
+
+    files = document_files(htmlDir)
+    assert len(files) == 2
+    for file in files:
+        with open(file, encoding="utf-8") as f:
+            metadata = json.load(f)
+        assert metadata["filename"] == sharded_name(metadata["sourceId"]) + ".json.mdd"
+        assert os.path.exists(os.path.join(htmlDir, metadata["filename"]))
+    assert os.path.exists(os.path.join(htmlDir, DOCUMENT_MANIFEST_FILE))
+
+
+def test_document_store(tmp_path) -> None:
+    directory = str(tmp_path / "packed")
+    with DocumentStore(directory, packMaxBytes=200) as store:
+        for i in range(10):
+            store.put(f"doc{i}", {"sourceId": f"doc{i}"}, [{"text": f"text {i} " * 5, "start": "0"}],
+                      [{"path": ["Heading"], "text": f"section {i}"}] if i % 2 else None)
+        store.put("doc3", {"sourceId": "doc3", "title": "again"}, [{"text": "replaced", "start": "0"}])
+        store.remove("doc4")
+
+    # Pack files are started as each fills, and a reopened store reads everything back
+    assert len([name for name in os.listdir(directory) if name.endswith(".pack")]) > 1
+    with DocumentStore(directory) as store:
+        metadata = store.metadata()
+        assert [meta["sourceId"] for meta in metadata] == [f"doc{i}" for i in range(10) if i != 4]
+        assert metadata[3]["title"] == "again"
+        assert store.segments("doc3") == [{"text": "replaced", "start": "0"}]
+        assert store.sections("doc3") is None and not store.has("doc3", sections=True)
+        assert store.segments("doc7")[0]["text"] == "text 7 " * 5
+        assert store.sections("doc7") == [{"path": ["Heading"], "text": "section 7"}]
+        assert store.has("doc7", sections=True) and not store.has("doc4")
+
+
+def chunk_texts(config, directory):
+    enrich_text_chunks(config, directory)
+    with open(os.path.join(directory, "output", "master_text.json"), "r", encoding="utf-8") as f:
+        return sorted((chunk["sourceId"], chunk["text"], chunk.get("sectionPath")) for chunk in json.load(f))
+
+
+@patch('text.enrich_text_chunks.tiktoken.encoding_for_model', return_value=StubTokenizer())
+def test_packed_markdown_chunks_like_flat(mock_encoding, tmp_path) -> None:
+    repoDir = str(tmp_path / "repo")
+    # Names that do not clash, so the flat layout keeps every file too
+    write_repo(repoDir, names=("intro{part}.md", "setup{part}.md"))
+    config = ApiConfiguration()
+    config.chunkingMode = "sections"
+    config.discardIfBelow = 1
+
+    download_markdown(repoDir, "repo", str(tmp_path / "flat"), config)
+    config.outputLayout = "packed"
+    config.markdownProcesses = 2
+    download_markdown(repoDir, "repo", str(tmp_path / "packed"), config)
+
+    # Nothing but the store, its pack file and the chunker's output folder is written
+    assert sorted(os.listdir(tmp_path / "packed")) == ["segments-00000.pack", "store.sqlite"]
+    assert chunk_texts(config, str(tmp_path / "packed")) == chunk_texts(config, str(tmp_path / "flat"))
+
+    # An incremental run on the packed layout drops a removed file from the store
+    config.markdownIncremental = True
+    download_markdown(repoDir, "repo", str(tmp_path / "packed"), config)
+    os.remove(os.path.join(repoDir, "part2", "setup2.md"))
+    download_markdown(repoDir, "repo", str(tmp_path / "packed"), config)
+    with DocumentStore(str(tmp_path / "packed")) as store:
+        assert [meta["sourceId"] for meta in store.metadata()] == [
+            "repo/part0/intro0.md", "repo/part0/setup0.md", "repo/part1/intro1.md", "repo/part1/setup1.md", "repo/part2/intro2.md"]
+
+
+def test_packed_html(tmp_path) -> None:
+    htmlDir = str(tmp_path / "web")
+    logger = logging.getLogger(__name__)
+    extractor = get_html_extractor("html.parser")
+    page = b"<html><body><p>" + b" word" * 200 + b"</p></body></html>"
+    url = "https://example.com/docs/index.html"
+
+    with PageStore(1 << 20) as pageStore, DocumentStore(htmlDir) as documents:
+        pageStore.put(url, page)
+        assert get_html(url, 1, "https://example.com", htmlDir, logger, 10, None, pageStore, None, extractor, documents)
+        # Once stored, the page is not downloaded again
+        assert not get_html(url, 2, "https://example.com", htmlDir, logger, 10, None, pageStore, None, extractor, documents)
+
+        assert documents.metadata()[0]["sourceId"] == "example.com/docs/index.html"
+        assert documents.segments("example.com/docs/index.html")[0]["text"].split() == ["word"] * 200
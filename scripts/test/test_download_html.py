@@ -0,0 +1,230 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import sys
+from unittest.mock import patch
+
+# Third-Party Packages
+import pytest
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.ApiConfiguration import ApiConfiguration
+from web.download_html import download_html, makePathOnly
+from web.page_store import PageStore
+from web.crawl_frontier import CrawlFrontier, normalize_url
+from web.crawl_state import CrawlState, CRAWL_STATE_FILE
+from benchmark.mock_web_site import start_mock_web_site, page_path
+
+
+def crawl_config(threads: int, connectionsPerHost: int, requestsPerHost: int, pageMemoryBytes: int = 1000000) -> ApiConfiguration:
+    config = ApiConfiguration()
+    config.crawlThreads = threads
+    config.crawlConnectionsPerHost = connectionsPerHost
+    config.crawlRequestsPerHost = requestsPerHost
+    config.crawlPageMemoryBytes = pageMemoryBytes
+    return config
+
+
+def downloaded_pages(directory: str):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".json.mdd"))
+
+
+def expected_pages(site, pages, fanout: int):
+    base = site.url[:-len("/site/")]
+    names = []
+    for page in (range(pages) if isinstance(pages, int) else pages):
+        sourceId = makePathOnly(base + page_path(page, fanout))
+        names.append(sourceId.replace("//", "_").replace("/", "_") + ".json.mdd")
+    return sorted(names)
+
+
+@pytest.mark.parametrize("pageMemoryBytes", [1000000, 0])
+def test_parallel_crawl_downloads_every_page_once_within_host_limits(tmp_path, pageMemoryBytes) -> None:
+    site = start_mock_web_site(pages=13, fanout=3, latency=0.02)
+    try:
+        with patch("web.download_html.MAX_PAGE_DEPTH", 2):
+            download_html(site.url, True, str(tmp_path), 10, crawl_config(8, 2, 2, pageMemoryBytes))
+
+        assert downloaded_pages(str(tmp_path)) == expected_pages(site, 13, 3)
+        # Pages fetched during link discovery are not fetched again for their text
+        assert site.requests == 13
+        assert site.maxInFlight <= 2
+        assert len(site.connections) <= 2
+    finally:
+        site.shutdown()
+        site.server_close()
+
+
+def test_crawl_without_recursion_and_rerun_skips_existing_pages(tmp_path) -> None:
+    site = start_mock_web_site(pages=13, fanout=3, latency=0)
+    config = crawl_config(4, 4, 4)
+    config.crawlRevalidate = False
+    try:
+        download_html(site.url, False, str(tmp_path), 10, config)
+        assert len(downloaded_pages(str(tmp_path))) == 1
+        assert site.requests == 1
+
+        download_html(site.url, False, str(tmp_path), 10, config)
+        assert site.requests == 1
+    finally:
+        site.shutdown()
+        site.server_close()
+
+
+def test_rerun_with_revalidation_skips_pages_without_validators(tmp_path) -> None:
+    site = start_mock_web_site(pages=13, fanout=3, latency=0, etags=False)
+    config = crawl_config(4, 4, 4)
+    try:
+        download_html(site.url, False, str(tmp_path), 10, config)
+        assert len(downloaded_pages(str(tmp_path))) == 1
+        assert site.requests == 1
+
+        # With no ETag or Last-Modified to ask with, the page on disk is kept rather than downloaded again
+        download_html(site.url, False, str(tmp_path), 10, config)
+        assert site.requests == 1
+    finally:
+        site.shutdown()
+        site.server_close()
+
+
+def test_page_store_spills_past_its_memory_limit() -> None:
+    with PageStore(memoryLimit=10) as store:
+        store.put("https://example.com/a", b"0123456789")
+        store.put("https://example.com/b", b"spilled to a file")
+        spillDir = store.spillDir.name
+        assert len(os.listdir(spillDir)) == 1
+
+        assert store.take("https://example.com/b") == b"spilled to a file"
+        assert os.listdir(spillDir) == []
+        assert store.take("https://example.com/a") == b"0123456789"
+        assert store.take("https://example.com/a") is None
+        assert store.memoryUsed == 0
+
+        store.put("https://example.com/c", b"another page past the limit")
+        assert len(store) == 1
+
+    assert not os.path.exists(spillDir)
+
+
+def test_normalize_url() -> None:
+    assert normalize_url("HTTPS://Example.COM:443/Docs/Page?b=2#intro") == "https://example.com/Docs/Page?b=2"
+    assert normalize_url("http://example.com") == "http://example.com/"
+    assert normalize_url("http://example.com:8080/a") == "http://example.com:8080/a"
+    assert normalize_url("http://example.com:badport/a") == "http://example.com:badport/a"
+
+
+def test_frontier_visits_each_page_once_breadth_first() -> None:
+    frontier = CrawlFrontier("https://example.com/docs", maxDepth=2, maxLinksPerPage=3)
+    assert frontier.expanding()
+
+    level = frontier.next_level([["https://example.com/docs/a", "https://EXAMPLE.com/docs/a#top",
+                                  "https://example.com/docs/b", "https://example.com:443/docs",
+                                  "https://example.com/docs/c"]])
+    # /docs/a twice and /docs itself use up the three links, so /docs/c is over the limit
+    assert level == ["https://example.com/docs/a", "https://example.com/docs/b"]
+
+    level = frontier.next_level([["https://example.com/docs/b", "https://example.com/docs/a/x"],
+                                 ["https://example.com/docs/a/x", "https://example.com/docs/b/y"]])
+    assert level == ["https://example.com/docs/a/x", "https://example.com/docs/b/y"]
+    assert not frontier.expanding()
+    assert frontier.pages == ["https://example.com/docs", "https://example.com/docs/a", "https://example.com/docs/b",
+                              "https://example.com/docs/a/x", "https://example.com/docs/b/y"]
+
+
+def test_crawl_honours_depth_and_links_per_page(tmp_path) -> None:
+    site = start_mock_web_site(pages=40, fanout=3, latency=0)
+    try:
+        with patch("web.download_html.MAX_PAGE_DEPTH", 2), patch("web.download_html.MAX_LINKS_PERPAGE", 2):
+            download_html(site.url, True, str(tmp_path), 10, crawl_config(4, 4, 4))
+
+        # The first two children of the root and of each of them
+        assert downloaded_pages(str(tmp_path)) == expected_pages(site, [0, 1, 2, 4, 5, 7, 8], 3)
+        assert site.requests == 7
+    finally:
+        site.shutdown()
+        site.server_close()
+
+
+def read_page_text(directory: str, name: str) -> str:
+    with open(os.path.join(directory, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_recrawl_revalidates_and_rewrites_only_changed_pages(tmp_path) -> None:
+    site = start_mock_web_site(pages=13, fanout=3, latency=0)
+    directory = str(tmp_path)
+    names = expected_pages(site, 13, 3)
+    try:
+        with patch("web.download_html.MAX_PAGE_DEPTH", 2):
+            download_html(site.url, True, directory, 10, crawl_config(4, 4, 4))
+            assert site.requests == 13 and site.notModified == 0
+            before = {name: read_page_text(directory, name) for name in names}
+
+            # Nothing changed: every page, including those crawled for their links, answers 304
+            download_html(site.url, True, directory, 10, crawl_config(4, 4, 4))
+            assert site.requests == 26 and site.notModified == 13
+            assert {name: read_page_text(directory, name) for name in names} == before
+
+            # One page crawled for its links and one leaf page change
+            site.versions[1] = 1
+            site.versions[7] = 1
+            download_html(site.url, True, directory, 10, crawl_config(4, 4, 4))
+            assert site.requests == 39 and site.notModified == 24
+
+        after = {name: read_page_text(directory, name) for name in names}
+        changed = sorted(name for name in names if after[name] != before[name])
+        assert changed == expected_pages(site, [1, 7], 3)
+        assert "version 1" in after[changed[0]]
+    finally:
+        site.shutdown()
+        site.server_close()
+
+
+def test_recrawl_keeps_pages_that_fail_revalidation(tmp_path) -> None:
+    site = start_mock_web_site(pages=13, fanout=3, latency=0)
+    directory = str(tmp_path)
+    names = expected_pages(site, 13, 3)
+    try:
+        with patch("web.download_html.MAX_PAGE_DEPTH", 2):
+            download_html(site.url, True, directory, 10, crawl_config(4, 4, 4))
+            before = {name: read_page_text(directory, name) for name in names}
+
+            # The site answers every conditional request with a 503 error page, which must not replace the pages
+            site.failRevalidation = True
+            download_html(site.url, True, directory, 10, crawl_config(4, 4, 4))
+            assert {name: read_page_text(directory, name) for name in names} == before
+
+            # The stored validators were kept, so once the site is back every page answers 304
+            site.failRevalidation = False
+            requests = site.requests
+            download_html(site.url, True, directory, 10, crawl_config(4, 4, 4))
+            assert site.requests - requests == 13 and site.notModified == 13
+            assert {name: read_page_text(directory, name) for name in names} == before
+    finally:
+        site.shutdown()
+        site.server_close()
+
+
+def test_crawl_state_round_trip(tmp_path) -> None:
+    class Response:
+        def __init__(self, headers, status_code=200):
+            self.headers = headers
+            self.status_code = status_code
+
+    path = os.path.join(str(tmp_path), CRAWL_STATE_FILE)
+    with CrawlState(path) as state:
+        state.put("https://example.com/a", Response({"ETag": '"abc"'}), ["https://example.com/a/b"])
+        state.put("https://example.com/c", Response({"Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"}))
+        state.put("https://example.com/d", Response({}))
+        state.put("https://example.com/a", Response({"ETag": '"error"'}, 503))
+
+    with CrawlState(path) as state:
+        assert state.get("https://example.com/a") == {"etag": '"abc"', "lastModified": None, "links": ["https://example.com/a/b"]}
+        assert state.get("https://example.com/c") == {"etag": None, "lastModified": "Wed, 21 Oct 2015 07:28:00 GMT", "links": None}
+        assert state.get("https://example.com/d") is None
@@ -0,0 +1,96 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import json
+import sys
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.ApiConfiguration import ApiConfiguration
+from github.download_markdown import download_markdown
+from github.markdown_manifest import MarkdownManifest, MARKDOWN_MANIFEST_FILE, git_blob_sha
+
+
+def write_repo(repoDir):
+    for i in range(30):
+        folder = os.path.join(repoDir, f"part{i % 4}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"doc{i:02d}.md"), "w", encoding="utf-8") as f:
+            f.write(f"# Document {i}\n\nSome *text* for document {i}.\n\n## More\n\n- a list item\n")
+    # Every part has a README.md, and only one can have README.md.json.mdd
+    for part in range(4):
+        with open(os.path.join(repoDir, f"part{part}", "README.md"), "w", encoding="utf-8") as f:
+            f.write(f"# Part {part}\n")
+
+
+def convert(repoDir, destination, processes):
+    os.makedirs(destination)
+    config = ApiConfiguration()
+    config.markdownProcesses = processes
+    config.chunkingMode = "sections"
+    download_markdown(repoDir, "repo", destination, config)
+    contents = {}
+    for name in sorted(os.listdir(destination)):
+        with open(os.path.join(destination, name), "rb") as f:
+            contents[name] = f.read()
+    return contents
+
+
+def test_process_pool_output_matches_serial(tmp_path) -> None:
+    repoDir = str(tmp_path / "repo")
+    write_repo(repoDir)
+
+    serial = convert(repoDir, str(tmp_path / "serial"), 0)
+    parallel = convert(repoDir, str(tmp_path / "parallel"), 3)
+
+    assert parallel == serial
+    assert len(serial) == (30 + 1) * 3
+
+    # Of the README.md files, the first in sorted path order is converted
+    assert json.loads(serial["README.md.json"])["sourceId"] == "repo/part0/README.md"
+    assert json.loads(serial["README.md.json.mdd"])[0]["text"] == "Part 0"
+
+
+def test_incremental_converts_only_changed_blobs(tmp_path) -> None:
+    repoDir = str(tmp_path / "repo")
+    destination = str(tmp_path / "markdown")
+    write_repo(repoDir)
+    config = ApiConfiguration()
+    config.markdownIncremental = True
+
+    download_markdown(repoDir, "repo", destination, config)
+    with MarkdownManifest(os.path.join(destination, MARKDOWN_MANIFEST_FILE)) as manifest:
+        files = manifest.files("repo")
+    assert len(files) == 31
+    assert files["repo/part1/doc01.md"][0] == git_blob_sha(
+        b"# Document 1\n\nSome *text* for document 1.\n\n## More\n\n- a list item\n")
+
+    # Edit one file and delete another; everything else is left alone
+    times = {name: os.path.getmtime(os.path.join(destination, name)) for name in os.listdir(destination)
+             if name.endswith(".json")}
+    with open(os.path.join(repoDir, "part1", "doc05.md"), "w", encoding="utf-8") as f:
+        f.write("# Document 5\n\nEdited.\n")
+    os.remove(os.path.join(repoDir, "part2", "doc06.md"))
+    os.remove(os.path.join(repoDir, "part0", "README.md"))
+
+    download_markdown(repoDir, "repo", destination, config)
+
+    with open(os.path.join(destination, "doc05.md.json.mdd"), encoding="utf-8") as f:
+        assert json.load(f)[0]["text"] == "Document 5 Edited."
+    assert not os.path.exists(os.path.join(destination, "doc06.md.json"))
+    assert not os.path.exists(os.path.join(destination, "doc06.md.json.mdd"))
+    # The next README.md in sorted order takes over the removed one's output name
+    with open(os.path.join(destination, "README.md.json"), encoding="utf-8") as f:
+        assert json.load(f)["sourceId"] == "repo/part1/README.md"
+    changed = [name for name, mtime in times.items()
+               if os.path.exists(os.path.join(destination, name)) and os.path.getmtime(os.path.join(destination, name)) != mtime]
+    assert sorted(changed) == ["README.md.json", "doc05.md.json"]
+
+    with MarkdownManifest(os.path.join(destination, MARKDOWN_MANIFEST_FILE)) as manifest:
+        assert set(manifest.tombstones("repo")) == {"repo/part2/doc06.md", "repo/part0/README.md"}
+        assert "repo/part1/README.md" in manifest.files("repo")
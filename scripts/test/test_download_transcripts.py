@@ -0,0 +1,91 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import json
+import sys
+import time
+from unittest.mock import patch
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# The youtube package needs a key and a tiktoken encoding when imported; neither is used here
+os.environ.setdefault("GOOGLE_DEVELOPER_API_KEY", "unused")
+with patch("tiktoken.encoding_for_model"), patch("tiktoken.get_encoding"):
+    from youtube.download_transcripts import download_transcripts_for_playlists
+
+from common.ApiConfiguration import ApiConfiguration
+from benchmark.mock_youtube import MockTranscriptApi, MockYouTube, mock_playlists, video_id
+
+
+def run_download(directory, playlists, api, threads, requestsPerMinute=0):
+    config = ApiConfiguration()
+    config.transcriptThreads = threads
+    config.transcriptRetryMaxSeconds = 0.05
+    config.transcriptRequestsPerMinute = requestsPerMinute
+    with patch("youtube.download_transcripts.YouTubeTranscriptApi", api), \
+         patch("youtube.download_transcripts.googleapiclient.discovery.build", return_value=MockYouTube(playlists, 0.01)):
+        start = time.perf_counter()
+        download_transcripts_for_playlists(list(playlists), directory, config)
+        return time.perf_counter() - start
+
+
+def test_playlists_download_concurrently_with_retries(tmp_path) -> None:
+    directory = str(tmp_path)
+    playlists = mock_playlists(3, 12, shared=2)
+    throttled = [video_id(0, 1), video_id(2, 5)]
+    missing = [video_id(1, 3)]
+    api = MockTranscriptApi(0.05, throttled=throttled, throttleCount=2, missing=missing)
+
+    elapsed = run_download(directory, playlists, api, 6)
+
+    # Every distinct video is asked for once, bar the retries of the throttled ones
+    assert len(api.calls) == 36
+    assert all(api.calls[video] == 3 for video in throttled)
+    assert api.calls[video_id(1, 3)] == 1
+    assert sum(api.calls.values()) == 36 + 4
+
+    assert 1 < api.maxInFlight <= 6
+    assert elapsed < 36 * 0.05 / 2
+
+    # A transcript and metadata for each video that has one; shared videos belong to their first playlist
+    transcripts = [name for name in os.listdir(directory) if name.endswith(".json.vtt")]
+    assert len(transcripts) == 35
+    with open(os.path.join(directory, video_id(0, 11) + ".json"), encoding="utf-8") as f:
+        assert json.load(f)["hitTrackingId"] == "PL0"
+    with open(os.path.join(directory, video_id(0, 1) + ".json.vtt"), encoding="utf-8") as f:
+        assert json.load(f)[0]["text"] == f"Segment 0 of {video_id(0, 1)}"
+
+
+def test_transcripts_already_downloaded_are_skipped(tmp_path) -> None:
+    directory = str(tmp_path)
+    playlists = mock_playlists(2, 5)
+    run_download(directory, playlists, MockTranscriptApi(0), 4)
+
+    api = MockTranscriptApi(0)
+    run_download(directory, playlists, api, 4)
+    assert api.calls == {}
+
+
+def test_failures_past_the_last_attempt_are_given_up(tmp_path) -> None:
+    directory = str(tmp_path)
+    playlists = mock_playlists(1, 4)
+    api = MockTranscriptApi(0, throttled=[video_id(0, 2)], throttleCount=10)
+
+    run_download(directory, playlists, api, 2)
+
+    assert api.calls[video_id(0, 2)] == ApiConfiguration().transcriptAttempts
+    assert not os.path.exists(os.path.join(directory, video_id(0, 2) + ".json.vtt"))
+    assert len(os.listdir(directory)) == 3 * 2
+
+
+def test_threads_share_the_request_limit(tmp_path) -> None:
+    # 60 a minute allows a burst of 10, then one a second
+    api = MockTranscriptApi(0)
+    elapsed = run_download(str(tmp_path), mock_playlists(2, 6), api, 8, requestsPerMinute=60)
+
+    assert len(api.calls) == 12
+    assert 1.5 < elapsed < 4
@@ -0,0 +1,147 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import json
+import sys
+import logging
+from unittest.mock import patch
+
+# Third-Party Packages
+import pytest
+from tenacity import stop_after_attempt
+
+# Set up logging to display information about the execution of the script
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.ApiConfiguration import ApiConfiguration
+from common.common_functions import get_embeddings
+from text.enrich_text_embeddings import make_embedding_batches, enrich_text_embeddings, get_text_embeddings
+from .stub_tokenizer import StubTokenizer
+from .stub_openai import StubClient
+
+
+@pytest.fixture
+def config() -> ApiConfiguration:
+    """
+    Fixture to create an instance of ApiConfiguration.
+
+    Returns:
+        ApiConfiguration: An instance of the ApiConfiguration class, with the embedding cache turned off
+    """
+    config = ApiConfiguration()
+    config.embeddingCacheFile = ""
+    # The stub clients have no raw responses to read rate limit headers from
+    config.chatRequestsPerMinute = config.chatTokensPerMinute = 0
+    config.embedRequestsPerMinute = config.embedTokensPerMinute = 0
+    return config
+
+
+def make_chunks(count: int, words: int = 10):
+    return [{"sourceId": f"source{i:04d}", "text": " ".join(["word"] * words) + f" {i}"} for i in range(count)]
+
+
+def test_batches_bounded_by_item_count() -> None:
+    chunks = make_chunks(10)
+    batches = make_embedding_batches(chunks, StubTokenizer(), 4, 10000)
+
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert [chunk for batch in batches for chunk in batch] == chunks
+
+
+def test_batches_bounded_by_token_count() -> None:
+    chunks = make_chunks(10, words=9)    # 10 tokens per chunk
+    batches = make_embedding_batches(chunks, StubTokenizer(), 100, 35)
+
+    assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+
+
+def test_oversize_chunk_gets_own_batch() -> None:
+    chunks = make_chunks(3, words=9)
+    chunks[1]["text"] = " ".join(["big"] * 100)
+    batches = make_embedding_batches(chunks, StubTokenizer(), 100, 50)
+
+    assert [len(batch) for batch in batches] == [1, 1, 1]
+
+
+def test_get_embeddings_scatters_by_index(config: ApiConfiguration) -> None:
+    client = StubClient()
+    texts = ["a", "bb", "ccc\nc"]
+    embeddings = get_embeddings(texts, client, config)
+
+    assert len(client.embeddings.calls) == 1
+    assert client.embeddings.calls[0] == ["a", "bb", "ccc c"]
+    assert embeddings == [[1.0, 0.0], [2.0, 1.0], [5.0, 2.0]]
+
+
+def run_embeddings(config: ApiConfiguration, output_dir: str, chunks, client: StubClient):
+    os.makedirs(os.path.join(output_dir, "output"), exist_ok=True)
+    with open(os.path.join(output_dir, "output", "master_enriched.json"), "w", encoding="utf-8") as f:
+        json.dump(chunks, f)
+
+    with patch('text.enrich_text_embeddings.AzureOpenAI', return_value=client), \
+         patch('text.enrich_text_embeddings.tiktoken.encoding_for_model', return_value=StubTokenizer()):
+        enrich_text_embeddings(config, output_dir)
+
+    with open(os.path.join(output_dir, "output", "master_enriched.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_enrich_text_embeddings_batches_calls(tmp_path, config: ApiConfiguration) -> None:
+    config.embeddingBatchSize = 16
+    chunks = make_chunks(100)
+    client = StubClient()
+
+    enriched = run_embeddings(config, str(tmp_path), chunks, client)
+
+    assert len(client.embeddings.calls) == 7
+    assert len(enriched) == 100
+    for chunk in enriched:
+        assert chunk["ada_v2"] == [float(len(chunk["text"])), chunk["ada_v2"][1]]
+
+
+def test_enrich_text_embeddings_skips_cached(tmp_path, config: ApiConfiguration) -> None:
+    chunks = make_chunks(20)
+    for chunk in chunks[:15]:
+        chunk["summary"] = "summary"
+        chunk["ada_v2"] = [0.0, 0.0]
+    client = StubClient()
+
+    enriched = run_embeddings(config, str(tmp_path), chunks, client)
+
+    assert len(client.embeddings.calls) == 1
+    assert len(client.embeddings.calls[0]) == 5
+    assert [chunk["sourceId"] for chunk in enriched] == [chunk["sourceId"] for chunk in chunks]
+
+
+def test_enrich_text_embeddings_bad_batch_falls_back(tmp_path, config: ApiConfiguration) -> None:
+    config.embeddingBatchSize = 4
+    chunks = make_chunks(8)
+    client = StubClient(failOn=" 2")
+
+    enriched = run_embeddings(config, str(tmp_path), chunks, client)
+
+    # One failed batch of 4, then 4 single calls, plus the good batch
+    assert len(client.embeddings.calls) == 6
+    assert len(enriched) == 8
+
+
+def test_enrich_text_embeddings_failed_batch_falls_back(tmp_path, config: ApiConfiguration) -> None:
+    config.embeddingBatchSize = 4
+    chunks = make_chunks(8)
+    client = StubClient(failOn=" 2", error=TimeoutError("timed out"))
+
+    # Retries are cut to one attempt, so the batch fails at once as if they had all run out
+    with patch.object(get_text_embeddings.retry, "stop", stop_after_attempt(1)):
+        enriched = run_embeddings(config, str(tmp_path), chunks, client)
+
+    # No chunk of the failed batch is lost: each is embedded on its own
+    assert len(client.embeddings.calls) == 6
+    assert len(enriched) == 8
@@ -0,0 +1,80 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import sys
+
+# Third-Party Packages
+import pytest
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.html_text import get_html_extractor, available_html_extractors, extract_with_legacy, HTML_EXTRACTORS
+from github.download_markdown import md_to_plain_text
+
+PAGE = """<html><head><title>Attention</title><style>body { color: red; }</style>
+<script>var tracking = "script text";</script></head>
+<body>
+<nav><a href="/">Home</a> <a href="/blog">Blog</a></nav>
+<main>
+  <h1>Attention is all you need</h1>
+  <p>Transformers replace recurrence
+     with <b>self-attention</b>.</p>
+  <nav>In-page menu</nav>
+</main>
+<aside>Related posts</aside>
+<footer>Copyright 2024</footer>
+</body></html>"""
+
+# Extractors that keep only the main content, for every parser installed here
+MAIN_CONTENT_EXTRACTORS = [name for name in available_html_extractors() if name != "legacy"]
+
+# Every main content extractor, skipped where its parser is not installed
+ALL_MAIN_CONTENT_EXTRACTORS = [
+    pytest.param(name, marks=pytest.mark.skipif(not installed, reason=f"the {name} parser is not installed"))
+    for name, (extractor, installed) in HTML_EXTRACTORS.items() if name != "legacy"]
+
+
+@pytest.mark.parametrize("name", ALL_MAIN_CONTENT_EXTRACTORS)
+def test_extractor_keeps_main_content_only(name) -> None:
+    extractor = get_html_extractor(name)
+    assert extractor(PAGE) == "Attention is all you need Transformers replace recurrence with self-attention."
+    assert extractor(PAGE.encode("utf-8")) == extractor(PAGE)
+
+
+@pytest.mark.parametrize("name", ALL_MAIN_CONTENT_EXTRACTORS)
+def test_extractor_falls_back_to_article_then_body(name) -> None:
+    extractor = get_html_extractor(name)
+
+    single = "<body><nav>Menu</nav><article><p>The article</p></article><p>Sidebar</p></body>"
+    assert extractor(single) == "The article"
+
+    several = "<body><nav>Menu</nav><article>First</article><article>Second</article><footer>End</footer></body>"
+    assert extractor(several) == "First Second"
+
+    assert extractor("") == ""
+
+
+def test_legacy_extractor_takes_the_whole_page() -> None:
+    text = extract_with_legacy(PAGE)
+    assert "Home" in text and "Copyright 2024" in text and "Related posts" in text
+    assert "\n" not in text
+
+
+def test_get_html_extractor_names() -> None:
+    assert get_html_extractor("auto") is get_html_extractor(MAIN_CONTENT_EXTRACTORS[0])
+    # No fast parser ships in requirements.txt, so the default stays the legacy extractor
+    assert get_html_extractor() is extract_with_legacy
+    assert get_html_extractor("legacy") is extract_with_legacy
+    with pytest.raises(ValueError):
+        get_html_extractor("regex")
+
+
+def test_markdown_to_plain_text() -> None:
+    markdown_text = "# Title\n\nSome *emphasis*\nover two lines.\n\n```\ncode block\n```\n"
+    assert md_to_plain_text(markdown_text, get_html_extractor("html.parser")) == "Title Some emphasis over two lines. code block"
+    assert md_to_plain_text(markdown_text).startswith("Title")
@@ -0,0 +1,116 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import json
+import sys
+from unittest.mock import patch
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.ApiConfiguration import ApiConfiguration
+from common.markdown_sections import split_markdown_sections
+from github.download_markdown import download_markdown
+from text.enrich_text_chunks import enrich_text_chunks
+from .stub_tokenizer import StubTokenizer
+
+
+LESSON = """Before any heading.
+
+# Lesson 1: [Prompts](prompts.md)
+
+What prompts are.
+
+## Setup
+
+```bash
+# Not a heading, a shell comment
+pip install openai
+```
+
+### Keys *and* secrets
+
+Keep keys out of source control.
+
+## Writing prompts
+
+Be specific.
+
+Examples
+--------
+
+An example prompt.
+"""
+
+
+def test_split_at_headings_outside_code() -> None:
+    sections = split_markdown_sections(LESSON)
+
+    assert [path for path, md in sections] == [
+        [],
+        ["Lesson 1: Prompts"],
+        ["Lesson 1: Prompts", "Setup"],
+        ["Lesson 1: Prompts", "Setup", "Keys and secrets"],
+        ["Lesson 1: Prompts", "Writing prompts"],
+        ["Lesson 1: Prompts", "Examples"]]
+    assert "# Not a heading" in sections[2][1]
+    # A setext heading underlined with - is second level, so Examples follows Writing prompts rather than going under it
+    assert sections[5][1].startswith("Examples\n--------")
+
+
+def write_lesson(repoDir, name, sections):
+    lines = [f"# {name}", ""]
+    for i, words in enumerate(sections):
+        lines += [f"## Part {i}", "", " ".join(f"{name}{i}w{j}" for j in range(words)), ""]
+    with open(os.path.join(repoDir, name + ".md"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+@patch('text.enrich_text_chunks.tiktoken.encoding_for_model', return_value=StubTokenizer())
+def test_sections_are_packed_whole_up_to_the_budget(mock_encoding, tmp_path) -> None:
+    repoDir = str(tmp_path / "repo")
+    markdownDir = str(tmp_path / "markdown")
+    os.makedirs(repoDir)
+    os.makedirs(markdownDir)
+    write_lesson(repoDir, "short", [20, 20, 20])
+    write_lesson(repoDir, "long", [30, 40, 50, 250, 10])
+
+    config = ApiConfiguration()
+    config.chunkingMode = "sections"
+    config.maxTokens = 100
+    config.discardIfBelow = 1
+    download_markdown(repoDir, "repo", markdownDir, config)
+    assert os.path.exists(os.path.join(markdownDir, "long.md.json.sections"))
+
+    enrich_text_chunks(config, markdownDir)
+    with open(os.path.join(markdownDir, "output", "master_text.json"), "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+
+    assert all(len(chunk["text"].split()) <= 100 for chunk in chunks)
+    long = [chunk for chunk in chunks if chunk["sourceId"] == "repo/long.md"]
+    short = [chunk for chunk in chunks if chunk["sourceId"] == "repo/short.md"]
+
+    # The whole of short fits in one chunk, under its title
+    assert len(short) == 1
+    assert short[0]["sectionPath"] == ["short"]
+    assert short[0]["text"].startswith("short.md. short Part 0 short0w0")
+
+    # Parts 0 and 1 fit together, part 2 does not fit with them, part 3 is split in windows and part 4 stands alone
+    starts = [chunk["text"].split()[:3] for chunk in long]
+    assert starts[0] == ["long.md.", "long", "Part"]
+    assert starts[1] == ["Part", "2", "long2w0"]
+    assert starts[2] == ["Part", "3", "long3w0"]
+    assert starts[-1] == ["Part", "4", "long4w0"]
+    assert long[0]["sectionPath"] == ["long"]
+    assert all(chunk["sectionPath"] == ["long", "Part 3"] for chunk in long[2:-1])
+    assert len(long) == 2 + 3 + 1
+
+    # The text mode still chunks the flattened page, ignoring the sections
+    config.chunkingMode = "segments"
+    enrich_text_chunks(config, markdownDir)
+    with open(os.path.join(markdownDir, "output", "master_text.json"), "r", encoding="utf-8") as f:
+        assert all("sectionPath" not in chunk for chunk in json.load(f))
@@ -0,0 +1,73 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import json
+import random
+import sys
+from unittest.mock import patch
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.ApiConfiguration import ApiConfiguration
+from text.enrich_text_chunks import enrich_text_chunks, chunk_document
+from .stub_tokenizer import StubTokenizer
+
+
+def write_document(directory, name, segments):
+    with open(os.path.join(directory, name + ".json.mdd"), "w", encoding="utf-8") as f:
+        json.dump(segments, f)
+    metadata = {"speaker": "", "title": name, "sourceId": f"https://example.com/{name}",
+                "filename": name + ".json.mdd", "description": name, "hitTrackingId": "https://example.com"}
+    with open(os.path.join(directory, name + ".json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f)
+
+
+def write_corpus(directory, count):
+    """Web pages of every length, plus multi-segment documents that append to the previous document's last chunk."""
+    rng = random.Random(5)
+    for i in range(count):
+        words = " ".join(f"word{rng.randrange(1000)}" for _ in range(rng.choice([50, 300, 900, 2500])))
+        if i % 7 == 3:
+            segments = [{"text": words[:len(words) // 2], "start": "60"}, {"text": words[len(words) // 2:], "start": "120"}]
+        else:
+            segments = [{"text": words, "start": "0"}]
+        write_document(directory, f"doc{i:03d}", segments)
+
+
+def run_chunker(directory, processes):
+    config = ApiConfiguration()
+    config.chunkingProcesses = processes
+    config.discardIfBelow = 10
+    enrich_text_chunks(config, directory)
+    with open(os.path.join(directory, "output", "master_text.json"), "rb") as f:
+        return f.read()
+
+
+@patch('text.enrich_text_chunks.tiktoken.encoding_for_model', return_value=StubTokenizer())
+def test_process_pool_output_matches_serial(mock_encoding, tmp_path) -> None:
+    directory = str(tmp_path)
+    write_corpus(directory, 40)
+
+    serial = run_chunker(directory, 0)
+    parallel = run_chunker(directory, 3)
+
+    assert parallel == serial
+    assert len(json.loads(serial)) > 40
+
+
+def test_document_reaching_into_previous_chunk_is_rerun(tmp_path) -> None:
+    directory = str(tmp_path)
+    write_document(directory, "alone", [{"text": "A page of its own " * 30, "start": "0"}])
+    write_document(directory, "continues", [{"text": "first part " * 20, "start": "60"}, {"text": "second part " * 20, "start": "120"}])
+    config = ApiConfiguration()
+    config.discardIfBelow = 10
+
+    with patch("text.enrich_text_chunks.worker_tokenizer", StubTokenizer()):
+        chunks = chunk_document(config, directory, os.path.join(directory, "alone.json"))
+        assert [chunk["sourceId"] for chunk in chunks] == ["https://example.com/alone"]
+        assert chunk_document(config, directory, os.path.join(directory, "continues.json")) is None
@@ -0,0 +1,159 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import sys
+import time
+import logging
+from unittest.mock import patch
+
+# Third-Party Packages
+import pytest
+import httpx
+from openai import AzureOpenAI, RateLimitError
+from tenacity import wait_fixed
+
+logger = logging.getLogger(__name__)
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.ApiConfiguration import ApiConfiguration
+from common import common_functions
+from common.rate_limiter import RateLimiter, wait_unless_rate_limited, create_with_limit
+from text.enrich_text_summaries import chatgpt_summary
+from .stub_tokenizer import StubTokenizer
+
+
+class StubClock:
+    """Clock the test moves by hand, so bucket arithmetic can be checked exactly."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubRetryState:
+    def __init__(self, error) -> None:
+        self.error = error
+
+    @property
+    def outcome(self):
+        return self
+
+    def exception(self):
+        return self.error
+
+
+def test_burst_is_free_then_callers_wait() -> None:
+    clock = StubClock()
+    # 60 requests per minute is one per second, with a burst of ten
+    limiter = RateLimiter(60, 0, clock)
+
+    waits = [limiter.reserve(0) for _ in range(12)]
+
+    assert waits[:10] == [0.0] * 10
+    assert waits[10] == pytest.approx(1.0)
+    assert waits[11] == pytest.approx(2.0)
+
+
+def test_tokens_refill_over_time() -> None:
+    clock = StubClock()
+    # 600 tokens per minute is ten per second, with a burst of 100
+    limiter = RateLimiter(0, 600, clock)
+
+    assert limiter.reserve(100) == 0.0
+    assert limiter.reserve(50) == pytest.approx(5.0)
+
+    clock.now += 5.0
+    assert limiter.reserve(0) == 0.0
+    assert limiter.reserve(30) == pytest.approx(3.0)
+
+
+def test_headers_pull_buckets_down_and_pause() -> None:
+    clock = StubClock()
+    limiter = RateLimiter(600, 60000, clock)
+
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "1",
+                                 "x-ratelimit-remaining-tokens": "500"})
+    assert limiter.reserve(100) == 0.0
+    assert limiter.reserve(100) > 0.0
+
+    limiter = RateLimiter(600, 60000, clock)
+    limiter.update_from_headers({"retry-after": "7"})
+    assert limiter.reserve(1) == pytest.approx(7.0)
+    clock.now += 7.0
+    assert limiter.reserve(1) == 0.0
+
+    limiter.update_from_headers({"retry-after-ms": "250", "retry-after": "7"})
+    assert limiter.reserve(1) == pytest.approx(0.25)
+
+
+class RateLimitedResource:
+    """Stands in for client.chat.completions, answering every create with a 429 carrying headers."""
+
+    def __init__(self, headers : dict) -> None:
+        self.headers = headers
+
+    @property
+    def with_raw_response(self):
+        return self
+
+    def create(self, **kwargs):
+        response = httpx.Response(429, headers=self.headers, request=httpx.Request("POST", "http://localhost"))
+        raise RateLimitError("limited", response=response, body=None)
+
+
+def rate_limit_error(limiter, headers):
+    with pytest.raises(RateLimitError) as error:
+        create_with_limit(limiter, RateLimitedResource(headers), 1)
+    return error.value
+
+
+def test_rate_limited_retries_do_not_back_off() -> None:
+    wait = wait_unless_rate_limited(wait_fixed(10))
+    limiter = RateLimiter(600, 60000)
+
+    assert wait(StubRetryState(rate_limit_error(limiter, {"retry-after-ms": "1"}))) == 0
+    assert wait(StubRetryState(ValueError("other"))) == 10
+
+
+def test_rate_limited_retries_back_off_without_a_pause() -> None:
+    wait = wait_unless_rate_limited(wait_fixed(10))
+
+    # With every limit 0 there is no limiter, so nothing holds the next attempt back
+    limiter = common_functions.open_rate_limiter("Unlimited", 0, 0)
+    assert limiter is None
+    assert wait(StubRetryState(rate_limit_error(limiter, {"retry-after": "7"}))) == 10
+
+    # A 429 with no retry-after does not pause the limiter either
+    assert wait(StubRetryState(rate_limit_error(RateLimiter(600, 60000), {}))) == 10
+
+
+def test_summary_waits_for_retry_after(server) -> None:
+    server.throttleNext = 1
+    server.retryAfterMs = 300
+    server.rateLimitHeaders = {"x-ratelimit-remaining-requests": "99", "x-ratelimit-remaining-tokens": "99999"}
+
+    config = ApiConfiguration()
+    config.resourceEndpoint = server.endpoint
+    config.apiKey = "mock"
+    config.summaryCacheFile = ""
+    config.azureDeploymentName = "RateLimitTest"
+    client = AzureOpenAI(azure_endpoint=config.resourceEndpoint, api_key=config.apiKey,
+                         api_version=config.apiVersion, max_retries=0)
+
+    with patch.object(common_functions, "tokenizer", StubTokenizer()):
+        start = time.perf_counter()
+        summary = chatgpt_summary(client, config, "A chunk of text about rate limits", logger)
+        elapsed = time.perf_counter() - start
+
+    assert summary.startswith("Summary: A chunk")
+    assert server.requests == 2
+    # The retry waited for retry-after, not for tenacity's ten second back off
+    assert 0.3 <= elapsed < 5.0
@@ -0,0 +1,53 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import sys
+
+# Third-Party Packages
+import numpy as np
+from numpy.linalg import norm
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.retrieval import EmbeddingIndex
+
+
+def brute_force(matrix, query, k):
+    """The per-chunk cosine loop run_tests used before, kept as the reference answer."""
+    scores = [np.dot(row, query) / (norm(row) * norm(query)) for row in matrix]
+    order = sorted(range(len(scores)), key=lambda i: -scores[i])
+    return [(i, scores[i]) for i in order[:k]]
+
+
+def test_search_matches_brute_force() -> None:
+    rng = np.random.default_rng(7)
+    matrix = rng.normal(size=(500, 32))
+    queries = rng.normal(size=(20, 32))
+    index = EmbeddingIndex(matrix)
+
+    for query, hits in zip(queries, index.search_batch(queries, 10)):
+        expected = brute_force(matrix, query, 10)
+        assert [row for row, score in hits] == [row for row, score in expected]
+        assert np.allclose([score for row, score in hits], [score for row, score in expected], atol=1e-5)
+
+    single = index.search(queries[3], 10)
+    batched = index.search_batch(queries, 10)[3]
+    assert [row for row, score in single] == [row for row, score in batched]
+    assert np.allclose([score for row, score in single], [score for row, score in batched], atol=1e-5)
+
+
+def test_search_with_k_beyond_corpus_and_zero_vectors() -> None:
+    matrix = [[1.0, 0.0], [0.0, 0.0], [0.0, 2.0], [-1.0, 0.0]]
+    index = EmbeddingIndex(matrix)
+
+    hits = index.search([3.0, 0.0], 10)
+    assert [row for row, score in hits] == [0, 1, 2, 3]
+    assert np.allclose([score for row, score in hits], [1.0, 0.0, 0.0, -1.0])
+
+    assert index.search([0.0, 1.0], 0) == []
+    assert len(index) == 4
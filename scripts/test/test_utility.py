@@ -19,12 +19,14 @@ from tenacity import (
     retry_if_not_exception_type,
 )
 from rich.progress import Progress
-import numpy as np
-from numpy.linalg import norm
 
 # Local Modules
 from common.ApiConfiguration import ApiConfiguration
 from common.common_functions import get_embedding
+from common.common_functions import create_chat_completion
+from common.rate_limiter import wait_unless_rate_limited
+from common.vector_store import load_embedding_file
+from common.retrieval import EmbeddingIndex
 
 kOpenAiPersonaPrompt = "You are an AI assistant helping an application developer understand generative AI. You explain complex concepts in simple language, using Python examples if it helps. You limit replies to 50 words or less. If you don't know the answer, say 'I don't know'. If the question is not related to building AI applications, Python, or Large Language Models (LLMs), say 'That doesn't seem to be about AI'."
 kInitialQuestionPrompt = "You are an AI assistant helping an application developer understand generative AI. You will be presented with a question. Answer the question in a few sentences, using language a suitable for a technical graduate student will understand. Limit your reply to 50 words or less. If you don't know the answer, say 'I don't know'. If the question is not related to building AI applications, Python, or Large Language Models (LLMs), say 'That doesn't seem to be about AI'.\n"
@@ -52,7 +54,7 @@ class test_result:
     followUpOnTopic: str  # Corrected typo here
 
 @retry(
-    wait=wait_random_exponential(min=5, max=15),
+    wait=wait_unless_rate_limited(wait_random_exponential(min=5, max=15)),
     stop=stop_after_attempt(5),
     retry=retry_if_not_exception_type(openai.BadRequestError),
 )
@@ -70,7 +72,8 @@ def get_enriched_question(client: AzureOpenAI, config: ApiConfiguration, text: s
         },
     ]
 
-    response = client.chat.completions.create(
+    response = create_chat_completion(
+        client, config,
         model=config.azureDeploymentName,
         messages=messages,
         temperature=0.7,
@@ -95,7 +98,7 @@ def get_enriched_question(client: AzureOpenAI, config: ApiConfiguration, text: s
 
 
 @retry(
-    wait=wait_random_exponential(min=5, max=15),
+    wait=wait_unless_rate_limited(wait_random_exponential(min=5, max=15)),
     stop=stop_after_attempt(5),
     retry=retry_if_not_exception_type(openai.BadRequestError),
 )
@@ -107,7 +110,7 @@ def get_text_embedding(client: AzureOpenAI, config: ApiConfiguration, text: str,
 
 
 @retry(
-    wait=wait_random_exponential(min=5, max=15),
+    wait=wait_unless_rate_limited(wait_random_exponential(min=5, max=15)),
     stop=stop_after_attempt(5),
     retry=retry_if_not_exception_type(openai.BadRequestError),
 )
@@ -125,7 +128,8 @@ def get_followup_question(client: AzureOpenAI, config: ApiConfiguration, text: s
         },
     ]
 
-    response = client.chat.completions.create(
+    response = create_chat_completion(
+        client, config,
         model=config.azureDeploymentName,
         messages=messages,
         temperature=0.7,
@@ -149,7 +153,7 @@ def get_followup_question(client: AzureOpenAI, config: ApiConfiguration, text: s
     return text
 
 @retry(
-    wait=wait_random_exponential(min=5, max=15),
+    wait=wait_unless_rate_limited(wait_random_exponential(min=5, max=15)),
     stop=stop_after_attempt(5),
     retry=retry_if_not_exception_type(openai.BadRequestError),
 )
@@ -167,7 +171,8 @@ def assess_followup_question(client: AzureOpenAI, config: ApiConfiguration, text
         },
     ]
 
-    response = client.chat.completions.create(
+    response = create_chat_completion(
+        client, config,
         model=config.azureDeploymentName,
         messages=messages,
         temperature=0.7,
@@ -190,10 +195,6 @@ def assess_followup_question(client: AzureOpenAI, config: ApiConfiguration, text
 
     return text
 
-def cosine_similarity(a, b): 
-   result = np.dot(a, b) / (norm(a) * norm(b))
-   return result
-
 def run_tests(config, testDestinationDir, sourceDir, questions): 
    """Run tests with given questions"""
 
@@ -203,7 +204,8 @@ def run_tests(config, testDestinationDir, sourceDir, questions):
    client = AzureOpenAI(
       azure_endpoint = config.resourceEndpoint, 
       api_key=config.apiKey,  
-      api_version=config.apiVersion
+      api_version=config.apiVersion,
+      max_retries=0  # tenacity retries instead, so every 429 reaches the rate limiter
    )      
    
    if not testDestinationDir:
@@ -212,11 +214,26 @@ def run_tests(config, testDestinationDir, sourceDir, questions):
 
    results = []
 
-   # load the existing chunks from a json file
+   # load the existing chunks from a json file, with their embeddings from the .npy file beside it if there is one
    cache_file = os.path.join(sourceDir, "embeddings_lite.json")
+   current, vectors = [], None
    if os.path.isfile(cache_file):
-      with open(cache_file, "r", encoding="utf-8") as f:
-         current = json.load(f)       
+      current, vectors = load_embedding_file(cache_file)
+
+   if vectors is None:
+      logger.error("Embeddings file not found: %s", cache_file)
+      exit(1)
+
+   if len(vectors) == 0:
+      logger.error("No embeddings in %s", cache_file)
+      exit(1)
+
+   # normalise the embeddings once, indexed by their row in the vector matrix
+   index = EmbeddingIndex(vectors)
+   summaries = [None] * len(index)
+   for chunk in current:
+      if "vectorRow" in chunk:
+         summaries[chunk["vectorRow"]] = chunk.get("summary")
 
    logger.info("Starting test run, total questions to be processed: %s", len(questions))
 
@@ -229,21 +246,17 @@ def run_tests(config, testDestinationDir, sourceDir, questions):
       # Convert the text of the enriched question to a vector embedding
       embedding = get_text_embedding(client, config, result.enriched_question, logger)
    
-      # Iterate through the chunks we have stored 
-      for chunk in current:
-         
-         # calculate the similarity between the chunk and the question
-         ada = chunk.get("ada_v2")
-         similarity = cosine_similarity(ada, embedding)
+      # Find the stored chunk closest to the question
+      for row, similarity in index.search(embedding, 1):
 
          # If we pass a reasonableness threshold, count it as a hit
          if similarity > 0.8:
             result.hit = True
          
-         # If it is the best hit so far, record the match
+         # If it is a better hit than none at all, record the match
          if similarity > result.hitRelevance:
             result.hitRelevance = similarity 
-            result.hitSummary = chunk.get("summary")
+            result.hitSummary = summaries[row]
 
       # Ask GPT for a follow-up question on the best match
       # Once we have a follow-up, ask GPT if the follow-up looks like it is about AI            
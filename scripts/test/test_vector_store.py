@@ -0,0 +1,95 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import json
+import sys
+
+# Third-Party Packages
+import pytest
+import numpy as np
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# Import necessary modules from the project
+from common.ApiConfiguration import ApiConfiguration
+from common.chunk_store import ChunkWriter, read_chunks
+from common.vector_store import VectorWriter, load_vectors, load_embedding_file, split_vector_file, vector_file_path
+from text.enrich_lite import enrich_lite
+
+
+def make_chunks(count: int, dimensions: int = 6):
+    return [{"sourceId": f"https://example.com/page{i}", "start": "0", "text": f"Chunk {i}",
+             "summary": f"Summary {i}", "ada_v2": [i + d / 10 for d in range(dimensions)]} for i in range(count)]
+
+
+def test_vector_file_round_trip(tmp_path) -> None:
+    path = os.path.join(str(tmp_path), "vectors.npy")
+    vectors = [[float(i), float(i) / 3, -1.0] for i in range(5)]
+
+    with VectorWriter(path) as writer:
+        rows = [writer.add(vector) for vector in vectors]
+
+    assert rows == [0, 1, 2, 3, 4]
+    matrix = load_vectors(path)
+    assert isinstance(matrix, np.memmap)
+    assert matrix.dtype == np.float32
+    assert np.array_equal(matrix, np.array(vectors, dtype=np.float32))
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_vector_file_rejects_mixed_dimensions(tmp_path) -> None:
+    path = os.path.join(str(tmp_path), "vectors.npy")
+
+    with pytest.raises(ValueError):
+        with VectorWriter(path) as writer:
+            writer.add([1.0, 2.0])
+            writer.add([1.0, 2.0, 3.0])
+
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + ".tmp")
+
+
+@pytest.mark.parametrize("chunkFileFormat", ["json", "jsonl"])
+def test_enrich_lite_writes_vector_sidecar(tmp_path, chunkFileFormat) -> None:
+    chunks = make_chunks(7)
+    suffix = "." + chunkFileFormat
+    output_dir = os.path.join(str(tmp_path), "output")
+    with ChunkWriter(os.path.join(output_dir, "master_enriched" + suffix)) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    config = ApiConfiguration()
+    config.chunkFileFormat = chunkFileFormat
+    config.liteVectorFormat = "npy"
+    config.chunkWindow = 3
+    enrich_lite(str(tmp_path), config)
+
+    lite_file = os.path.join(output_dir, "master_enriched_lite" + suffix)
+    lite = list(read_chunks(lite_file))
+    assert all("ada_v2" not in chunk and "text" not in chunk for chunk in lite)
+    assert [chunk["summary"] for chunk in lite] == [chunk["summary"] for chunk in chunks]
+
+    loaded, matrix = load_embedding_file(lite_file)
+    assert matrix.shape == (7, 6)
+    for chunk, original in zip(loaded, chunks):
+        assert np.array_equal(matrix[chunk["vectorRow"]], np.array(original["ada_v2"], dtype=np.float32))
+
+
+def test_split_file_loads_like_legacy_file(tmp_path) -> None:
+    legacy = os.path.join(str(tmp_path), "embeddings_lite.json")
+    split = os.path.join(str(tmp_path), "embeddings_lite_split.json")
+    with open(legacy, "w", encoding="utf-8") as f:
+        json.dump([{"url": f"https://example.com/{i}", "summary": chunk["summary"], "ada_v2": chunk["ada_v2"]}
+                   for i, chunk in enumerate(make_chunks(4))], f)
+
+    assert split_vector_file(legacy, split) == 4
+    assert os.path.isfile(vector_file_path(split))
+
+    legacy_chunks, legacy_matrix = load_embedding_file(legacy)
+    split_chunks, split_matrix = load_embedding_file(split)
+    assert split_chunks == legacy_chunks
+    assert np.array_equal(np.asarray(split_matrix), legacy_matrix)
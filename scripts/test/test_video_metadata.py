@@ -0,0 +1,75 @@
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import json
+import sys
+from unittest.mock import patch
+
+# Add the project root and scripts directory to the Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+scripts_dir = os.path.join(project_root, 'scripts')
+sys.path.extend([project_root, scripts_dir])
+
+# The youtube package needs a key and a tiktoken encoding when imported; neither is used here
+os.environ.setdefault("GOOGLE_DEVELOPER_API_KEY", "unused")
+with patch("tiktoken.encoding_for_model"), patch("tiktoken.get_encoding"):
+    from youtube.download_transcripts import gen_metadata
+    from youtube.enrich_video_metadata import enrich_video_metadata, parse_duration
+
+from common.ApiConfiguration import ApiConfiguration
+from benchmark.mock_youtube import MockYouTube, mock_playlists, video_id
+
+
+def make_config(tmp_path, maxAgeDays=7):
+    config = ApiConfiguration()
+    config.videoMetadataCacheFile = str(tmp_path / "cache" / "videos.sqlite")
+    config.videoMetadataMaxAgeDays = maxAgeDays
+    config.youTubeApiRequestsPerMinute = 0
+    return config
+
+
+def read_metadata(directory, videoId):
+    with open(os.path.join(directory, videoId + ".json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_parse_duration() -> None:
+    assert parse_duration("PT1H2M3S") == 3723
+    assert parse_duration("PT45S") == 45
+    assert parse_duration("P1DT1M") == 86460
+    assert parse_duration("P0D") == 0
+    assert parse_duration("1:00") is None
+
+
+def test_metadata_is_fetched_in_batches_and_cached(tmp_path) -> None:
+    directory = str(tmp_path / "youtube")
+    playlists = mock_playlists(2, 60)
+    for items in playlists.values():
+        for item in items:
+            gen_metadata(item, directory)
+    deleted = video_id(1, 7)
+    youtube = MockYouTube(playlists, deleted=[deleted])
+
+    enrich_video_metadata(make_config(tmp_path), directory, youtube)
+
+    assert [len(ids) for ids in youtube.videoRequests] == [50, 50, 20]
+    metadata = read_metadata(directory, video_id(0, 0))
+    assert metadata["durationSeconds"] == 3600 + 7 * 60 + 5
+    assert metadata["viewCount"] == 100 and metadata["likeCount"] == 7 and metadata["commentCount"] == 2
+    assert metadata["title"] == f"Video {video_id(0, 0)}"
+    assert "durationSeconds" not in read_metadata(directory, deleted)
+
+    # A rerun finds every video YouTube knows in the cache, and only asks again for the deleted one
+    youtube.videoRequests.clear()
+    enrich_video_metadata(make_config(tmp_path), directory, youtube)
+    assert youtube.videoRequests == [[deleted]]
+
+    # Once the cache is out of date every video is fetched again, and statistics that changed are written
+    youtube.videoRequests.clear()
+    youtube.views[video_id(0, 3)] = 250
+    before = os.path.getmtime(os.path.join(directory, video_id(0, 4) + ".json"))
+    enrich_video_metadata(make_config(tmp_path, maxAgeDays=0), directory, youtube)
+    assert [len(ids) for ids in youtube.videoRequests] == [50, 50, 20]
+    assert read_metadata(directory, video_id(0, 3))["viewCount"] == 250
+    assert os.path.getmtime(os.path.join(directory, video_id(0, 4) + ".json")) == before
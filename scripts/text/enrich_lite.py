@@ -2,9 +2,14 @@
 # Copyright (c) 2024 Braid Technologies Ltd
 
 # Standard Library Imports
-import json
 import os
 import logging
+from contextlib import nullcontext
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from common.chunk_store import chunk_file_name, read_chunk_windows, ChunkWriter
+from common.vector_store import VectorWriter, vector_file_path, split_vector
 
 def remove_text(segments):
     """This function removes the text from each dictionary in the list."""
@@ -13,8 +18,11 @@ def remove_text(segments):
         for seg in segments
     ]
 
-def enrich_lite(destinationDir): 
+def enrich_lite(destinationDir, config : ApiConfiguration = None): 
     """Remove text from enriched transcript and save as a new JSON file."""
+
+    if config is None:
+        config = ApiConfiguration()
     
     logging.basicConfig(level=logging.WARNING)
     logger = logging.getLogger(__name__)
@@ -23,19 +31,20 @@ def enrich_lite(destinationDir):
         logger.error("Output folder not provided")
         exit(1)
 
-    # Load source list from JSON file
-    input_file = os.path.join(destinationDir, "output", "master_enriched.json")
-    with open(input_file, "r", encoding="utf-8") as f:
-        segments = json.load(f)
-
-    total_segments = len(segments)
-
-    # Create a lambda function to remove the text from each dictionary in the list
-    lite = remove_text(segments)
-
-    # Save the embeddings to a JSON file
-    output_file = os.path.join(destinationDir, "output", "master_enriched_lite.json")
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(lite, f)
-
-    logger.debug("Total segments processed: %s", total_segments)
\ No newline at end of file
+    input_file = os.path.join(destinationDir, "output", chunk_file_name("master_enriched", config))
+    output_file = os.path.join(destinationDir, "output", chunk_file_name("master_enriched_lite", config))
+
+    # Stream the segments through a window at a time, saving them without their text
+    splitVectors = config.liteVectorFormat == "npy"
+    vectorWriter = VectorWriter(vector_file_path(output_file)) if splitVectors else nullcontext()
+    total_segments = 0
+    with ChunkWriter(output_file, indent=None, ensureAscii=True) as writer, vectorWriter:
+        for segments in read_chunk_windows(input_file, config.chunkWindow):
+            for seg in remove_text(segments):
+                # Move the embedding out to the float32 matrix, keeping its row number
+                if splitVectors:
+                    split_vector(seg, vectorWriter)
+                writer.write(seg)
+            total_segments += len(segments)
+
+    logger.debug("Total segments processed: %s", total_segments)
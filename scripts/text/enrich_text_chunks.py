@@ -8,8 +8,9 @@
 import os
 import json
 import logging
-from pathlib import Path
-import math
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 
 # Third-Party Packages
 import tiktoken
@@ -17,14 +18,24 @@ from rich.progress import Progress
 
 # Local Modules
 from common.common_functions import ensure_directory_exists
+from common.chunk_store import chunk_file_name, ChunkWriter
+from common.markdown_sections import sections_file_name
+from common.document_layout import document_files, open_document_store
 
 PERCENTAGE_OVERLAP = 0.05
 AVERAGE_CHARACTERS_PER_TOKEN = 4
 AVERAGE_WORDS_PER_MINUTE = 100
-AVERAGE_TOKENS_PER_WORD=1.33
+
+# https://stackoverflow.com/questions/75804599/openai-api-how-do-i-count-tokens-before-i-send-an-api-request
+ENCODING_MODEL = "gpt-3.5-turbo"
 
 total_files = 0
 
+# The tokenizer of a chunking worker process, and the DocumentStore it reads from in the packed layout,
+# opened once by init_chunking_worker
+worker_tokenizer = None
+worker_store = None
+
 class MddSegment:
     def __init__(self, chunk: dict) -> None:
         self.text = chunk.get("text")
@@ -84,8 +95,44 @@ def add_new_chunk(metadata, text, chunk_begin_tokens, chunks, minimumSegmentToke
     chunks.append(metadata.copy())
 
 
+def token_windows(tokenCount, windowTokens, overlapTokens):
+    """
+    Returns (begin, end) token ranges that cover tokenCount tokens in windows of exactly windowTokens,
+    the last possibly shorter, each starting overlapTokens before the previous one ends.
+    """
+    step = max(1, windowTokens - overlapTokens)
+    windows = []
+    begin = 0
+    while True:
+        end = min(begin + windowTokens, tokenCount)
+        windows.append((begin, end))
+        if end >= tokenCount:
+            return windows
+        begin += step
+
+
+def add_token_window_chunks(metadata, tokens, windowTokens, chunk_begin_tokens, tokenizer, chunks, minimumSegmentTokenCount):
+    """
+    Splits a text already encoded as tokens into chunks of exactly windowTokens tokens, overlapping by
+    PERCENTAGE_OVERLAP of a window, decoding each window once. Each chunk starts at its first token's offset.
+    """
+    overlapTokens = int(windowTokens * PERCENTAGE_OVERLAP)
+    for begin, end in token_windows(len(tokens), windowTokens, overlapTokens):
+        add_new_chunk(metadata, tokenizer.decode(tokens[begin:end]), chunk_begin_tokens + begin, chunks, minimumSegmentTokenCount)
+
+
 def parse_json_mdd_transcript(config, mdd, metadata, tokenizer, chunks):
     """parse the json mdd file and return the transcript"""
+
+    # open the mdd file
+    with open(mdd, "r", encoding="utf-8") as json_file:
+        json_mdd = json.load(json_file)
+
+    chunk_mdd_segments(config, json_mdd, metadata, tokenizer, chunks)
+
+
+def chunk_mdd_segments(config, json_mdd, metadata, tokenizer, chunks):
+    """chunk the segments of a document, as read from its .json.mdd file or the document store"""
     text = ""
     current_tokens = None
     seg_begin_tokens = None
@@ -99,96 +146,166 @@ def parse_json_mdd_transcript(config, mdd, metadata, tokenizer, chunks):
         metadata["title"] = clean_text(metadata.get("title"))
         text += metadata.get("title") + ". "
 
-    current_token_length = len(tokenizer.encode(text))
+    # The token ids of text are kept running as segments are added, so each piece of text is encoded once.
+    # previous_chunk_tokens is the count for the last chunk this document added, or None if it has not added one
+    text_ids = tokenizer.encode(text, disallowed_special=())
+    current_token_length = len(text_ids)
+    previous_chunk_tokens = None
+
+    if len(json_mdd) == 1:
+        last_chunk = True
+
+    for chunk in json_mdd:
+        seg = MddSegment(chunk)
+        current_tokens = int(seg.start)
+        current_text = seg.text            
+
+        if seg_begin_tokens is None:
+            seg_begin_tokens = current_tokens
+            # calculate the finish time from the chunk_begin_time
+            seg_finish_tokens = seg_begin_tokens + config.chunkDurationMins * 60
+
+        # Get the number of tokens in the text.
+        # Need to calc to allow for tokens for 
+        # summary request in next pipeline step
+        segment_ids = tokenizer.encode(current_text, disallowed_special=())
+        segment_tokens = len(segment_ids)
+        total_tokens = segment_tokens + current_token_length
+
+        # Deal with case of a chunk that is already over the limit - in which case we add it
+        # in windows of exactly as many tokens as a chunk may hold, then return.
+        # Single segment web and GitHub documents longer than a chunk all come here
+        if total_tokens >= seg_finish_tokens:
+           windowTokens = min(seg_finish_tokens, config.maxTokens)
+           add_token_window_chunks(metadata, text_ids + segment_ids, windowTokens, seg_begin_tokens, tokenizer, chunks, config.discardIfBelow)
+           return
+    
+        if current_tokens < seg_finish_tokens and total_tokens < config.maxTokens:
+            # add the text to the transcript
+            text += current_text + " "
+            text_ids += segment_ids
+            current_token_length = total_tokens
+        else:
+            if not first_chunk:
+                # append PERCENTAGE_OVERLAP text to the previous chunk
+                # to smooth context transition
+                append_text_to_previous_chunk(text, chunks)
+                previous_chunk_tokens = None
+            first_chunk = False
+            chunkCount = len(chunks)
+            add_new_chunk(metadata, text, seg_begin_tokens, chunks, config.discardIfBelow)
+            if len(chunks) > chunkCount:
+                previous_chunk_tokens = current_token_length
+
+            text = current_text + " "
+            text_ids = list(segment_ids)
+
+            # reset the chunk_begin_time
+            seg_begin_tokens = None
+            seg_finish_tokens = None
+
+            current_token_length = segment_tokens
+
+    # Deal with case where there is only one chunk
+    if first_chunk and last_chunk:
+       add_new_chunk(metadata, text, seg_begin_tokens, chunks, config.discardIfBelow)
+    else:
+        # Append the last text chunk to the last chunk in chunks dictionary
+        if seg_begin_tokens and text != "":
+           # Short text is not added as a chunk, so the last chunk may not be one counted here
+           if previous_chunk_tokens is None:
+              previous_chunk_tokens = len(tokenizer.encode(chunks[-1]["text"]))
+           current_chunk_tokens = current_token_length
 
-    # open the mdd file
-    with open(mdd, "r", encoding="utf-8") as json_file:
-        json_mdd = json.load(json_file)
+           if previous_chunk_tokens + current_chunk_tokens < config.maxTokens:
+               chunks[-1]["text"] += text
+           else:
+              if not first_chunk:
+                 # append PERCENTAGE_OVERLAP text to the previous chunk
+                 # to smooth context transition
+                 append_text_to_previous_chunk(text, chunks)
+                 first_chunk = False
+                 add_new_chunk(metadata, text, seg_begin_tokens, chunks, config.discardIfBelow)
+
+
+def add_section_chunk(metadata, texts, paths, chunk_begin_tokens, chunks, minimumSegmentTokenCount):
+    """add a chunk of whole sections, under the headings its sections all share"""
+    if texts:
+        metadata["sectionPath"] = os.path.commonprefix(paths)
+        add_new_chunk(metadata, "".join(texts), chunk_begin_tokens, chunks, minimumSegmentTokenCount)
+
+
+def parse_markdown_sections(config, sectionsFile, metadata, tokenizer, chunks):
+    """Chunks a Markdown document at its headings, from the sections file download_markdown wrote."""
+
+    with open(sectionsFile, "r", encoding="utf-8") as json_file:
+        sections = json.load(json_file)
+
+    chunk_markdown_sections(config, sections, metadata, tokenizer, chunks)
 
-        if len(json_mdd) == 1:
-            last_chunk = True
-
-        for chunk in json_mdd:
-            seg = MddSegment(chunk)
-            current_tokens = int(seg.start)
-            current_text = seg.text            
-
-            if seg_begin_tokens is None:
-                seg_begin_tokens = current_tokens
-                # calculate the finish time from the chunk_begin_time
-                seg_finish_tokens = seg_begin_tokens + config.chunkDurationMins * 60
-
-            # Get the number of tokens in the text.
-            # Need to calc to allow for tokens for 
-            # summary request in next pipeline step
-            total_tokens = len(tokenizer.encode(current_text, disallowed_special=())) + current_token_length
-
-            # Deal with case of a chunk that is already over the limit - in which case we add it
-            # in chunks # then return.
-            if total_tokens >= seg_finish_tokens:
-               
-               currentWordCount = 0
-               words = current_text.split(" ")
-               word_count = len(words)
-                  
-               while currentWordCount < word_count:
-                  maxWords = math.floor (seg_finish_tokens / AVERAGE_TOKENS_PER_WORD)
-                  thisTextWordCount = min(maxWords, word_count - currentWordCount);
-                  thisText = " ".join(words[currentWordCount : thisTextWordCount])
-                  add_new_chunk(metadata, thisText, seg_begin_tokens, chunks, config.discardIfBelow)
-
-                  #if we are not at the end, we overlap chunks by moving back a bit
-                  if currentWordCount + thisTextWordCount < word_count:
-                     currentWordCount += int (thisTextWordCount * (1- PERCENTAGE_OVERLAP))
-                  else:
-                     currentWordCount += thisTextWordCount
-
-               return
-        
-            if current_tokens < seg_finish_tokens and total_tokens < config.maxTokens:
-                # add the text to the transcript
-                text += current_text + " "
-                current_token_length = total_tokens
-            else:
-                if not first_chunk:
-                    # append PERCENTAGE_OVERLAP text to the previous chunk
-                    # to smooth context transition
-                    append_text_to_previous_chunk(text, chunks)
-                first_chunk = False
-                add_new_chunk(metadata, text, seg_begin_tokens, chunks, config.discardIfBelow)
-
-                text = current_text + " "
-
-                # reset the chunk_begin_time
-                seg_begin_tokens = None
-                seg_finish_tokens = None
-
-                current_token_length = len(tokenizer.encode(text))
-
-        # Deal with case where there is only one chunk
-        if first_chunk and last_chunk:
-           add_new_chunk(metadata, text, seg_begin_tokens, chunks, config.discardIfBelow)
+
+def chunk_markdown_sections(config, sections, metadata, tokenizer, chunks):
+    """
+    Chunks a Markdown document at its headings, from its sections as download_markdown wrote them.
+    Whole sections are packed into a chunk in order until the next would take it over the token
+    budget, so chunks do not start or end part way through a section. A section over the budget
+    on its own is split into token windows. Each chunk's sectionPath lists the headings it is under.
+    """
+    budget = min(config.chunkDurationMins * 60, config.maxTokens)
+
+    # add the title to the first section
+    prefix = ""
+    if "title" in metadata and metadata["title"]:
+        metadata["title"] = clean_text(metadata.get("title"))
+        prefix = metadata.get("title") + ". "
+
+    texts = []
+    paths = []
+    chunk_tokens = 0
+    chunk_begin_tokens = 0
+    document_tokens = 0
+
+    for section in sections:
+        text = prefix + section["text"] + " "
+        prefix = ""
+        tokens = tokenizer.encode(text, disallowed_special=())
+
+        if chunk_tokens + len(tokens) > budget:
+            add_section_chunk(metadata, texts, paths, chunk_begin_tokens, chunks, config.discardIfBelow)
+            texts = []
+            paths = []
+            chunk_tokens = 0
+            chunk_begin_tokens = document_tokens
+
+        if len(tokens) > budget:
+            metadata["sectionPath"] = section["path"]
+            add_token_window_chunks(metadata, tokens, budget, document_tokens, tokenizer, chunks, config.discardIfBelow)
+            chunk_begin_tokens = document_tokens + len(tokens)
         else:
-            # Append the last text chunk to the last chunk in chunks dictionary
-            if seg_begin_tokens and text != "":
-               previous_chunk_tokens = len(tokenizer.encode(chunks[-1]["text"]))
-               current_chunk_tokens = len(tokenizer.encode(text))
+            texts.append(text)
+            paths.append(section["path"])
+            chunk_tokens += len(tokens)
 
-               if previous_chunk_tokens + current_chunk_tokens < config.maxTokens:
-                   chunks[-1]["text"] += text
-               else:
-                  if not first_chunk:
-                     # append PERCENTAGE_OVERLAP text to the previous chunk
-                     # to smooth context transition
-                     append_text_to_previous_chunk(text, chunks)
-                     first_chunk = False
-                     add_new_chunk(metadata, text, seg_begin_tokens, chunks, config.discardIfBelow)
+        document_tokens += len(tokens)
 
+    add_section_chunk(metadata, texts, paths, chunk_begin_tokens, chunks, config.discardIfBelow)
 
-def get_transcript(config, metadata, markdownDestinationDir, logger, tokenizer, chunks):
-    """get the transcript from the .mdd file"""
+
+def get_transcript(config, metadata, markdownDestinationDir, logger, tokenizer, chunks, store=None):
+    """get the transcript from the .mdd file, or from store if the folder was downloaded in the packed layout"""
 
     global total_files
+
+    if store is not None:
+        logger.debug("Processing document: %s", metadata["sourceId"])
+        total_files += 1
+        sections = store.sections(metadata["sourceId"]) if config.chunkingMode == "sections" else None
+        if sections is not None:
+            chunk_markdown_sections(config, sections, metadata, tokenizer, chunks)
+        else:
+            chunk_mdd_segments(config, store.segments(metadata["sourceId"]), metadata, tokenizer, chunks)
+        return
+
     mdd = os.path.join(markdownDestinationDir, metadata["filename"])
 
     # check that the .mdd file exists
@@ -199,7 +316,59 @@ def get_transcript(config, metadata, markdownDestinationDir, logger, tokenizer,
         logger.debug("Processing file: %s", mdd)
         total_files += 1
 
-    parse_json_mdd_transcript(config, mdd, metadata, tokenizer, chunks)
+    # Markdown downloaded for structural chunking has its sections beside it; other documents are chunked as text
+    sections = sections_file_name(mdd)
+    if config.chunkingMode == "sections" and os.path.exists(sections):
+        parse_markdown_sections(config, sections, metadata, tokenizer, chunks)
+    else:
+        parse_json_mdd_transcript(config, mdd, metadata, tokenizer, chunks)
+
+
+class PreviousChunk(dict):
+    """
+    Stands in for the last chunk of the previous document when a worker chunks a document on its own.
+    The chunker can append to that chunk, so reading it marks the document to be chunked again in order.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(text="")
+        self.read = False
+
+    def __getitem__(self, key):
+        self.read = True
+        return super().__getitem__(key)
+
+
+def init_chunking_worker(markdownDestinationDir=None):
+    """Builds the tokenizer, and opens the document store if there is one, once in each worker process."""
+    global worker_tokenizer, worker_store
+    worker_tokenizer = tiktoken.encoding_for_model(ENCODING_MODEL)
+    if markdownDestinationDir is not None:
+        worker_store = open_document_store(markdownDestinationDir)
+
+
+def load_metadata(document):
+    """A document is the path of its .json metadata file, or in the packed layout its metadata, already read"""
+    if isinstance(document, dict):
+        return document
+    with open(document, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def chunk_document(config, markdownDestinationDir, document):
+    """
+    Chunks one document in a worker process. Returns its chunks, or None if it reached into
+    the previous document's last chunk, in which case it must be chunked in order instead.
+    """
+    logger = logging.getLogger(__name__)
+    meta = load_metadata(document)
+
+    previous = PreviousChunk()
+    chunks = [previous]
+    get_transcript(config, meta, markdownDestinationDir, logger, worker_tokenizer, chunks, worker_store)
+    if previous.read:
+        return None
+    return chunks[1:]
 
 
 def enrich_text_chunks(config, markdownDestinationDir):
@@ -211,8 +380,6 @@ def enrich_text_chunks(config, markdownDestinationDir):
         logger.error("Markdown folder not provided")
         exit(1)
 
-    # https://stackoverflow.com/questions/75804599/openai-api-how-do-i-count-tokens-before-i-send-an-api-request
-    ENCODING_MODEL = "gpt-3.5-turbo"
     tokenizer = tiktoken.encoding_for_model(ENCODING_MODEL)
 
     cwd = os.getcwd()
@@ -220,37 +387,52 @@ def enrich_text_chunks(config, markdownDestinationDir):
     logger.debug("Markdown folder: %s", markdownDestinationDir)
     logger.debug("Segment length %d minutes", config.chunkDurationMins)
 
-    folder = os.path.join(markdownDestinationDir, "*.json")
-    logger.debug("Search spec: %s", str(folder))
-
-    directory_path = Path(markdownDestinationDir)
-
-    # Use rglob() to recursively search for all files
-    searchPath = directory_path.glob("*.json")
-    jsonFiles = list(searchPath)
+    # In the packed layout every document's metadata comes from the store in one query. Otherwise it is every
+    # .json file in the folder, or the documents listed in its manifest if downloaded in the sharded layout
+    store = open_document_store(markdownDestinationDir)
+    jsonFiles = store.metadata() if store is not None else document_files(markdownDestinationDir)
 
     global total_files
     total_files = len(jsonFiles)  # Initialize total_files with the count of jsonFiles
 
-    with Progress() as progress:
-        task1 = progress.add_task("[green]Enriching Buckets...", total=total_files)
+    output_file = os.path.join(markdownDestinationDir, "output", chunk_file_name("master_text", config))
 
-        for file in jsonFiles:
-            # load the json file
-            meta = json.load(open(file, encoding="utf-8"))
+    # Ensure the output subdirectory exists
+    ensure_directory_exists(os.path.dirname(output_file))
 
-            get_transcript(config, meta, markdownDestinationDir, logger, tokenizer, chunks)
-            progress.update(task1, advance=1)
+    # With chunkingProcesses > 1, workers chunk documents in parallel and results are merged in file order.
+    # The workers are all started by map, before the progress display starts its thread
+    processes = config.chunkingProcesses
+    pool = ProcessPoolExecutor(max_workers=processes, initializer=init_chunking_worker,
+                               initargs=(markdownDestinationDir,)) if processes > 1 else nullcontext()
 
-    logger.debug("Total files: %s", total_files)
-    logger.debug("Total chunks: %s", len(chunks))
+    with pool, (store if store is not None else nullcontext()):
+        if processes > 1:
+            batch = max(1, min(64, len(jsonFiles) // (processes * 4)))
+            documents = pool.map(partial(chunk_document, config, markdownDestinationDir), jsonFiles, chunksize=batch)
+        else:
+            documents = [None] * len(jsonFiles)
 
-    # save chunks to a json file
-    output_subdir = "output"
-    output_file = os.path.join(markdownDestinationDir, output_subdir, "master_text.json")
+        with ChunkWriter(output_file) as writer, Progress() as progress:
+            task1 = progress.add_task("[green]Enriching Buckets...", total=total_files)
 
-    # Ensure the output subdirectory exists
-    ensure_directory_exists(os.path.dirname(output_file))
+            for file, documentChunks in zip(jsonFiles, documents):
+                if documentChunks is not None:
+                    chunks.extend(documentChunks)
+                else:
+                    # Chunk here, in order: no worker pool, or the document continues the previous one's last chunk
+                    meta = load_metadata(file)
 
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, ensure_ascii=False, indent=4)
+                    get_transcript(config, meta, markdownDestinationDir, logger, tokenizer, chunks, store)
+                progress.update(task1, advance=1)
+
+                # write out finished chunks as we go; the last one stays, as the next file may still append to it
+                for chunk in chunks[:-1]:
+                    writer.write(chunk)
+                del chunks[:-1]
+
+            for chunk in chunks:
+                writer.write(chunk)
+
+    logger.debug("Total files: %s", total_files)
+    logger.debug("Total chunks: %s", writer.count)
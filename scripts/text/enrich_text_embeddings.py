@@ -5,13 +5,13 @@
 import logging
 import re
 import os
-import json
 import threading
 import queue
 
 # Third-Party Packages
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from openai import BadRequestError
+import tiktoken
 from tenacity import (
     retry,
     wait_random_exponential,
@@ -23,7 +23,16 @@ from rich.progress import Progress
 # Local Modules
 from common.common_functions import ensure_directory_exists
 from common.common_functions import get_embedding
+from common.common_functions import get_embeddings
+from common.common_functions import get_embedding_async, get_embeddings_async, make_async_client
+from common.common_functions import make_chunk_key, chunk_index
+from common.common_functions import open_embedding_cache
 from common.ApiConfiguration import ApiConfiguration
+from common.async_runner import run_async
+from common.chunk_store import chunk_file_name, count_chunks, read_chunk_windows, ChunkWriter
+from common.ann_index import build_ann_index_file
+from common.rate_limiter import wait_unless_rate_limited
+from text.enrich_text_chunks import ENCODING_MODEL
 
 def normalize_text(s, sep_token=" \n "):
     """Normalize text by removing extra spaces and newlines."""
@@ -38,7 +47,7 @@ def normalize_text(s, sep_token=" \n "):
 
 
 @retry(
-    wait=wait_random_exponential(min=10, max=45),
+    wait=wait_unless_rate_limited(wait_random_exponential(min=10, max=45)),
     stop=stop_after_attempt(5),
     retry=retry_if_not_exception_type(BadRequestError),
 )
@@ -51,41 +60,194 @@ def get_text_embedding(client : AzureOpenAI, config : ApiConfiguration, text: st
     return embedding
 
 
-def process_queue(client : AzureOpenAI, config : ApiConfiguration, progress, task, q, logger, output_chunks, current_chunks):
-    """Process the queue."""
+@retry(
+    wait=wait_unless_rate_limited(wait_random_exponential(min=10, max=45)),
+    stop=stop_after_attempt(5),
+    retry=retry_if_not_exception_type(BadRequestError),
+)
+def get_text_embeddings(client : AzureOpenAI, config : ApiConfiguration, texts: list):
+    """Get the embeddings for a batch of texts in one API call."""
+    embeddings = get_embeddings(texts,
+                                client,
+                                config)
+    
+    return embeddings
+
+
+def make_embedding_batches(chunks, tokenizer, maxItems, maxTokens):
+    """
+    Pack chunks into batches for the embeddings API.
+
+    A batch is closed when adding the next chunk would take it over maxItems
+    chunks or maxTokens total tokens. A single chunk larger than maxTokens
+    still gets a batch of its own.
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+
+    for chunk in chunks:
+        tokens = len(tokenizer.encode(chunk["text"], disallowed_special=()))
+
+        if batch and (len(batch) >= maxItems or batch_tokens + tokens > maxTokens):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+
+        batch.append(chunk)
+        batch_tokens += tokens
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def embed_single_chunk(client : AzureOpenAI, config : ApiConfiguration, chunk, logger):
+    """Embed one chunk on its own."""
+    try:
+        embedding = get_text_embedding(client, config, chunk["text"])
+        chunk["ada_v2"] = embedding.copy()
+    except BadRequestError as request_error:
+        logger.warning("Error processing chunk %s: %s", chunk.get('sourceId'), request_error)
+    except Exception as e:
+        logger.warning("Unknown error processing chunk %s: %s", chunk.get('sourceId'), str(e))
+
+
+def process_queue(client : AzureOpenAI, config : ApiConfiguration, progress, task, q, logger):
+    """Process the queue of batches, storing each embedding on its chunk."""
     while not q.empty():
-        chunk = q.get()
-        found = False
-
-        for i in current_chunks:
-            if i.get('sourceId') == chunk.get('sourceId'):
-              current_summary = i.get("summary")
-              current_ada = i.get("ada_v2")
-              if current_summary and current_ada: 
-                 chunk["summary"] = current_summary
-                 chunk["ada_v2"] = current_ada                
-                 found = True  
-                 output_chunks.append(chunk.copy())                 
-                 break
-
-        if not found:
-            if "ada_v2" in chunk:
-                output_chunks.append(chunk.copy())
-            else:
-                # Get embedding using OpenAI API
-                try:
-                    embedding = get_text_embedding(client, config, chunk["text"])
-                    chunk["ada_v2"] = embedding.copy()
-                    output_chunks.append(chunk.copy())
-                except BadRequestError as request_error:
-                    logger.warning("Error processing chunk %s: %s", chunk.get('sourceId'), request_error)
-                except Exception as e:
-                    logger.warning("Unknown error processing chunk %s: %s", chunk.get('sourceId'), str(e))
-
-        progress.update(task, advance=1)
+        batch = q.get()
+
+        # Get embeddings for the whole batch using OpenAI API
+        try:
+            embeddings = get_text_embeddings(client, config, [chunk["text"] for chunk in batch])
+            for chunk, embedding in zip(batch, embeddings):
+                chunk["ada_v2"] = embedding.copy()
+        except BadRequestError as request_error:
+            # One bad chunk fails the whole batch, so retry them one by one
+            logger.warning("Error processing batch of %d chunks, retrying singly: %s", len(batch), request_error)
+            for chunk in batch:
+                embed_single_chunk(client, config, chunk, logger)
+        except Exception as e:
+            # Chunks without embeddings are not written, so rather than lose the batch, try each chunk on its own
+            logger.warning("Unknown error processing batch of %d chunks, retrying singly: %s", len(batch), str(e))
+            for chunk in batch:
+                embed_single_chunk(client, config, chunk, logger)
+
+        progress.update(task, advance=len(batch))
         q.task_done()
 
 
+@retry(
+    wait=wait_unless_rate_limited(wait_random_exponential(min=10, max=45)),
+    stop=stop_after_attempt(5),
+    retry=retry_if_not_exception_type(BadRequestError),
+)
+async def get_text_embedding_async(client : AsyncAzureOpenAI, config : ApiConfiguration, text: str):
+    """Get the embedding for a text with the async client."""
+    embedding = await get_embedding_async(text,
+                                          client,
+                                          config)
+    
+    return embedding
+
+
+@retry(
+    wait=wait_unless_rate_limited(wait_random_exponential(min=10, max=45)),
+    stop=stop_after_attempt(5),
+    retry=retry_if_not_exception_type(BadRequestError),
+)
+async def get_text_embeddings_async(client : AsyncAzureOpenAI, config : ApiConfiguration, texts: list):
+    """Get the embeddings for a batch of texts in one API call with the async client."""
+    embeddings = await get_embeddings_async(texts,
+                                            client,
+                                            config)
+    
+    return embeddings
+
+
+async def embed_single_chunk_async(client : AsyncAzureOpenAI, config : ApiConfiguration, chunk, logger):
+    """Async version of embed_single_chunk."""
+    try:
+        embedding = await get_text_embedding_async(client, config, chunk["text"])
+        chunk["ada_v2"] = embedding.copy()
+    except BadRequestError as request_error:
+        logger.warning("Error processing chunk %s: %s", chunk.get('sourceId'), request_error)
+    except Exception as e:
+        logger.warning("Unknown error processing chunk %s: %s", chunk.get('sourceId'), str(e))
+
+
+async def process_batch_async(client : AsyncAzureOpenAI, config : ApiConfiguration, progress, task, batch, logger):
+    """Async version of one pass of process_queue, storing each embedding on its chunk."""
+    try:
+        embeddings = await get_text_embeddings_async(client, config, [chunk["text"] for chunk in batch])
+        for chunk, embedding in zip(batch, embeddings):
+            chunk["ada_v2"] = embedding.copy()
+    except BadRequestError as request_error:
+        # One bad chunk fails the whole batch, so retry them one by one
+        logger.warning("Error processing batch of %d chunks, retrying singly: %s", len(batch), request_error)
+        for chunk in batch:
+            await embed_single_chunk_async(client, config, chunk, logger)
+    except Exception as e:
+        # Chunks without embeddings are not written, so rather than lose the batch, try each chunk on its own
+        logger.warning("Unknown error processing batch of %d chunks, retrying singly: %s", len(batch), str(e))
+        for chunk in batch:
+            await embed_single_chunk_async(client, config, chunk, logger)
+
+    progress.update(task, advance=len(batch))
+
+
+def find_cached_chunks(chunks, cache_index):
+    """Fill in chunks that already have a summary and embedding, return the ones still needing an embedding."""
+    remaining = []
+
+    for chunk in chunks:
+        cached = cache_index.get(make_chunk_key(chunk))
+
+        if cached:
+            chunk["summary"] = cached.get("summary")
+            chunk["ada_v2"] = cached.get("ada_v2")
+        elif "ada_v2" not in chunk:
+            remaining.append(chunk)
+
+    return remaining
+
+
+def embed_window(client : AzureOpenAI, config : ApiConfiguration, progress, task, chunks, cache_index, tokenizer, logger):
+    """Embed one window of chunks in place, with threads or with the async client."""
+
+    # Only chunks without an embedding need an API call
+    remaining = find_cached_chunks(chunks, cache_index)
+
+    batches = make_embedding_batches(remaining, tokenizer, config.embeddingBatchSize, config.embeddingBatchTokens)
+    logger.info("Chunks needing embeddings: %s in %s batches", len(remaining), len(batches))
+
+    progress.update(task, advance=len(chunks) - len(remaining))
+
+    if config.asyncMode:
+        # Keep up to maxConcurrentRequests batches in flight from one event loop
+        run_async(lambda: make_async_client(config),
+                  lambda async_client, batch: process_batch_async(async_client, config, progress, task, batch, logger),
+                  batches, config.maxConcurrentRequests)
+    else:
+        # Prepare a queue with the batches to be processed
+        q = queue.Queue()
+        for batch in batches:
+            q.put(batch)
+
+        # Create multiple threads to process the queue
+        threads = []
+        for i in range(config.processingThreads):
+            t = threading.Thread(target=process_queue, args=(client, config, progress, task, q, logger))
+            t.start()
+            threads.append(t)
+
+        # Wait for all threads to finish
+        for t in threads:
+            t.join()
+
+
 def enrich_text_embeddings(config : ApiConfiguration, destinationDir : str):
 
     logging.basicConfig(level=logging.WARNING)
@@ -96,7 +258,8 @@ def enrich_text_embeddings(config : ApiConfiguration, destinationDir : str):
     client = AzureOpenAI(
        azure_endpoint = config.resourceEndpoint, 
        api_key=config.apiKey,  
-       api_version=config.apiVersion
+       api_version=config.apiVersion,
+       max_retries=0  # tenacity retries instead, so every 429 reaches the rate limiter
     )   
 
     if not destinationDir:
@@ -104,54 +267,42 @@ def enrich_text_embeddings(config : ApiConfiguration, destinationDir : str):
         exit(1)
 
     total_chunks = 0
-    output_chunks = []
-    current = []
 
     logger.debug("Starting OpenAI Embeddings")
 
-    # Load chunks from the input JSON file
-    input_file = os.path.join(destinationDir, "output", "master_enriched.json")
-    with open(input_file, "r", encoding="utf-8") as f:
-        chunks = json.load(f)
+    # The input is also the cache: chunks already embedded keep their vectors
+    input_file = os.path.join(destinationDir, "output", chunk_file_name("master_enriched", config))
+    output_file = input_file
 
-    total_chunks = len(chunks)
-    logger.info("Total chunks to be processed: %s", total_chunks)
+    # Ensure the output subdirectory exists
+    ensure_directory_exists(os.path.dirname(output_file))
 
-    # Prepare a queue with chunks to be processed
-    q = queue.Queue()
-    for chunk in chunks:
-        q.put(chunk)
+    total_chunks = count_chunks(input_file)
+    logger.info("Total chunks to be processed: %s", total_chunks)
 
-    # Load existing chunks from cache
-    cache_file = os.path.join(destinationDir, "output", "master_enriched.json")
-    if os.path.isfile(cache_file):
-        with open(cache_file, "r", encoding="utf-8") as f:
-            current = json.load(f)
+    # Batches are sized with the chunking tokenizer
+    tokenizer = tiktoken.encoding_for_model(ENCODING_MODEL)
 
-    with Progress() as progress:
+    # Index existing chunks once; the new output replaces them only once it is complete, after the index is closed
+    # Chunks that failed to embed are dropped; a legacy JSON file is sorted by sourceId as before
+    with ChunkWriter(output_file, sortKey=lambda x: x["sourceId"]) as writer, chunk_index(output_file) as cache_index, Progress() as progress:
         task1 = progress.add_task("[green]Enriching Embeddings...", total=total_chunks)
-        # Create multiple threads to process the queue
-        threads = []
-        for i in range(config.processingThreads):
-            t = threading.Thread(target=process_queue, args=(client, config, progress, task1, q, logger, output_chunks, current))
-            t.start()
-            threads.append(t)
 
-        # Wait for all threads to finish
-        for t in threads:
-            t.join()
-
-    # Sort the output chunks by sourceId
-    output_chunks.sort(key=lambda x: x["sourceId"])
+        # Only one window of chunks is held in memory at a time
+        for chunks in read_chunk_windows(input_file, config.chunkWindow):
+            embed_window(client, config, progress, task1, chunks, cache_index, tokenizer, logger)
 
-    logger.debug("Total chunks processed: %s", len(output_chunks))
+            for chunk in chunks:
+                if "ada_v2" in chunk:
+                    writer.write(chunk)
 
-    # Save enriched chunks to a JSON file
-    output_subdir = "output"
-    output_file = os.path.join(destinationDir, output_subdir, "master_enriched.json")
+    logger.debug("Total chunks processed: %s", writer.count)
 
-    # Ensure the output subdirectory exists
-    ensure_directory_exists(os.path.dirname(output_file))
+    # Report how much of the work the embedding cache saved, as a warning since every logger is set to WARNING above
+    cache = open_embedding_cache(config)
+    if cache:
+        logger.warning("Embedding cache: %s", cache.stats())
 
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(output_chunks, f, ensure_ascii=False, indent=4)
+    # Optionally index the new embeddings for approximate nearest neighbour search
+    if config.buildAnnIndex:
+        build_ann_index_file(output_file, config.annLists, config.annProbe)
@@ -2,7 +2,6 @@
 # Copyright (c) 2024 Braid Technologies Ltd
 
 # Standard Library Imports
-import json
 import os
 import threading
 import queue
@@ -10,7 +9,7 @@ import logging
 from logging import Logger
 
 # Third-Party Packages
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from openai import BadRequestError
 from tenacity import (
     retry,
@@ -22,7 +21,14 @@ from rich.progress import Progress
 
 # Local Modules
 from common.common_functions import ensure_directory_exists
+from common.common_functions import make_chunk_key, chunk_index
+from common.common_functions import open_summary_cache, make_summary_key
+from common.common_functions import make_async_client
 from common.ApiConfiguration import ApiConfiguration
+from common.async_runner import run_async
+from common.chunk_store import chunk_file_name, count_chunks, read_chunk_windows, ChunkWriter
+from common.common_functions import create_chat_completion, create_chat_completion_async
+from common.rate_limiter import wait_unless_rate_limited
 
 class Counter:
     """thread safe counter"""
@@ -41,28 +47,33 @@ class Counter:
 
 counter = Counter()
 
-@retry(
-    wait=wait_random_exponential(min=10, max=45),
-    stop=stop_after_attempt(5),
-    retry=retry_if_not_exception_type(BadRequestError)
-)
-def chatgpt_summary(client : AzureOpenAI, config : ApiConfiguration, text : str, logger : Logger):
-    """generate a summary using chatgpt"""
+SUMMARY_TEMPERATURE = 0.7
+
+def make_summary_messages(config : ApiConfiguration, text : str):
+    """build the system prompt and the messages for a summary request"""
+
+    systemPrompt = ("You're an AI Assistant for summarising useful blogs, write an authoritative " 
+                    + str(config.summaryWordCount) + 
+                    "  word summary. Avoid starting sentences with 'This document' or 'The document'.")
 
     messages = [
         {
             "role": "system",
-            "content": "You're an AI Assistant for summarising useful blogs, write an authoritative " 
-                       + str(config.summaryWordCount) + 
-                       "  word summary. Avoid starting sentences with 'This document' or 'The document'.",
+            "content": systemPrompt,
         },
         {"role": "user", "content": text},
     ]
 
-    response = client.chat.completions.create(
+    return systemPrompt, messages
+
+
+def make_summary_request(config : ApiConfiguration, messages):
+    """arguments for chat.completions.create, shared by the sync and async clients"""
+
+    return dict(
         model=config.azureDeploymentName,
         messages=messages,
-        temperature=0.7,
+        temperature=SUMMARY_TEMPERATURE,
         max_tokens=config.maxTokens,
         top_p=0.0,
         frequency_penalty=0,
@@ -71,6 +82,10 @@ def chatgpt_summary(client : AzureOpenAI, config : ApiConfiguration, text : str,
         timeout=config.openAiRequestTimeout        
     )
 
+
+def read_summary_response(response, logger : Logger):
+    """get the summary text from a chat response, stopping if the model did not finish"""
+
     # print(response)
     text = response.choices[0].message.content
     finish_reason = response.choices[0].finish_reason
@@ -85,24 +100,73 @@ def chatgpt_summary(client : AzureOpenAI, config : ApiConfiguration, text : str,
     return text
 
 
-def process_queue_for_summaries(client : AzureOpenAI, config : ApiConfiguration, progress, task, q, total_chunks, output_chunks, current_chunks, logger):
-    """process the queue"""
+@retry(
+    wait=wait_unless_rate_limited(wait_random_exponential(min=10, max=45)),
+    stop=stop_after_attempt(5),
+    retry=retry_if_not_exception_type(BadRequestError)
+)
+def chatgpt_summary(client : AzureOpenAI, config : ApiConfiguration, text : str, logger : Logger):
+    """generate a summary using chatgpt"""
+
+    systemPrompt, messages = make_summary_messages(config, text)
+
+    # Reuse a summary made earlier for the same text, prompt and model
+    cache = open_summary_cache(config)
+    if cache:
+        key = make_summary_key(text, systemPrompt, SUMMARY_TEMPERATURE, config)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached.decode("utf-8")
+
+    response = create_chat_completion(client, config, **make_summary_request(config, messages))
+    summary = read_summary_response(response, logger)
+
+    if cache and summary:
+        cache.put(key, summary.encode("utf-8"))
+
+    return summary
+
+
+@retry(
+    wait=wait_unless_rate_limited(wait_random_exponential(min=10, max=45)),
+    stop=stop_after_attempt(5),
+    retry=retry_if_not_exception_type(BadRequestError)
+)
+async def chatgpt_summary_async(client : AsyncAzureOpenAI, config : ApiConfiguration, text : str, logger : Logger):
+    """generate a summary using chatgpt with the async client"""
+
+    systemPrompt, messages = make_summary_messages(config, text)
+
+    # Reuse a summary made earlier for the same text, prompt and model
+    cache = open_summary_cache(config)
+    if cache:
+        key = make_summary_key(text, systemPrompt, SUMMARY_TEMPERATURE, config)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached.decode("utf-8")
+
+    response = await create_chat_completion_async(client, config, **make_summary_request(config, messages))
+    summary = read_summary_response(response, logger)
+
+    if cache and summary:
+        cache.put(key, summary.encode("utf-8"))
+
+    return summary
+
+
+def process_queue_for_summaries(client : AzureOpenAI, config : ApiConfiguration, progress, task, q, total_chunks, cache_index, logger):
+    """process the queue, storing each summary on its chunk"""
     
     while not q.empty():
 
         chunk = q.get()
         found = False
 
-        for i in current_chunks: 
-           if i.get('sourceId') == chunk.get('sourceId'):
-              current_summary = i.get("summary")
-              current_ada = i.get("ada_v2")
-              if current_summary and current_ada: 
-                 chunk["summary"] = current_summary
-                 chunk["ada_v2"] = current_ada                
-                 found = True  
-                 output_chunks.append(chunk.copy())                 
-                 break
+        cached = cache_index.get(make_chunk_key(chunk))
+        if cached: 
+           chunk["summary"] = cached.get("summary")
+           chunk["ada_v2"] = cached.get("ada_v2")
+           found = True  
 
         if not found:
            text = chunk.get("text")
@@ -111,7 +175,6 @@ def process_queue_for_summaries(client : AzureOpenAI, config : ApiConfiguration,
               summary = chatgpt_summary(client, config, text, logger)
               # add the summary to the chunk dictionary
               chunk["summary"] = summary
-              output_chunks.append(chunk.copy())
            except BadRequestError as request_error:
               logger.warning("Error: %s", request_error)
            except Exception as e:
@@ -125,12 +188,58 @@ def process_queue_for_summaries(client : AzureOpenAI, config : ApiConfiguration,
         q.task_done()
 
 
+async def process_chunk_for_summaries_async(client : AsyncAzureOpenAI, config : ApiConfiguration, progress, task, chunk, cache_index, logger):
+    """async version of one pass of process_queue_for_summaries"""
+
+    cached = cache_index.get(make_chunk_key(chunk))
+    if cached: 
+       chunk["summary"] = cached.get("summary")
+       chunk["ada_v2"] = cached.get("ada_v2")
+    else:
+       try:
+          chunk["summary"] = await chatgpt_summary_async(client, config, chunk.get("text"), logger)
+       except BadRequestError as request_error:
+          logger.warning("Error: %s", request_error)
+       except Exception as e:
+          logger.warning("Error: %s", e)
+
+    counter.increment()
+    progress.update(task, advance=1)
+
+
+def summarise_window(client : AzureOpenAI, config : ApiConfiguration, progress, task, chunks, total_chunks, cache_index, logger):
+   """summarise one window of chunks in place, with threads or with the async client"""
+
+   if config.asyncMode:
+      # keep up to maxConcurrentRequests summaries in flight from one event loop
+      run_async(lambda: make_async_client(config),
+                lambda async_client, chunk: process_chunk_for_summaries_async(async_client, config, progress, task, chunk, cache_index, logger),
+                chunks, config.maxConcurrentRequests)
+   else:
+      # add chunk list to a queue
+      q = queue.Queue()
+      for chunk in chunks:
+         q.put(chunk)
+
+      # create multiple threads to process the queue
+      threads = []
+      for i in range(config.processingThreads):
+         t = threading.Thread(target=process_queue_for_summaries, args=(client, config, progress, task, q, total_chunks, cache_index, logger))
+         t.start()
+         threads.append(t)
+
+      # wait for all threads to finish
+      for t in threads:
+         t.join()
+
+
 def enrich_text_summaries(config, destinationDir): 
 
    client = AzureOpenAI(
       azure_endpoint = config.resourceEndpoint, 
       api_key=config.apiKey,  
-      api_version=config.apiVersion
+      api_version=config.apiVersion,
+      max_retries=0  # tenacity retries instead, so every 429 reaches the rate limiter
    )   
 
    logging.basicConfig(level=logging.WARNING)
@@ -142,65 +251,36 @@ def enrich_text_summaries(config, destinationDir):
     logger.error("Destination folder not provided")
     exit(1)
 
-   chunks = []
-   output_chunks = []
-   current = []
    total_chunks = 0
 
    logger.debug("Starting OpenAI summarization")
 
-   # load the chunks from a json file
-   input_file = os.path.join(destinationDir, "output", "master_text.json")
-   with open(input_file, "r", encoding="utf-8") as f:
-      chunks = json.load(f)
+   input_file = os.path.join(destinationDir, "output", chunk_file_name("master_text", config))
+   output_file = os.path.join(destinationDir, "output", chunk_file_name("master_enriched", config))
 
-   total_chunks = len(chunks)
-
-   logger.debug("Total chunks to be processed: %s", len(chunks))
-
-   # add chunk list to a queue
-   q = queue.Queue()
-   for chunk in chunks:
-      q.put(chunk)
-
-   # load the existing chunks from a json file
-   output_subdir = "output"
-   cache_file = os.path.join(destinationDir, "output", "master_enriched.json")
    # Ensure the output subdirectory exists
-   ensure_directory_exists(os.path.dirname(cache_file))
+   ensure_directory_exists(os.path.dirname(output_file))
 
-   if os.path.isfile(cache_file):
-      with open(cache_file, "r", encoding="utf-8") as f:
-         current = json.load(f)   
-   
-   with open(cache_file, "w", encoding="utf-8") as f:
-      json.dump(chunks, f, ensure_ascii=False, indent=4)
+   total_chunks = count_chunks(input_file)
 
-   with Progress() as progress:
-      task1 = progress.add_task("[purple]Enriching Summaries...", total=total_chunks)
+   logger.debug("Total chunks to be processed: %s", total_chunks)
 
-      # create multiple threads to process the queue
-      threads = []
-      for i in range(config.processingThreads):
-         t = threading.Thread(target=process_queue_for_summaries, args=(client, config, progress, task1, q, total_chunks, output_chunks, current, logger))
-         t.start()
-         threads.append(t)
-
-      # wait for all threads to finish
-      for t in threads:
-         t.join()
+   # index the existing chunks once so each lookup is O(1); the new output replaces them only once it is complete, after the index is closed
+   # chunks that failed are dropped; a legacy JSON file is sorted by sourceId as before
+   with ChunkWriter(output_file, sortKey=lambda x: (x["sourceId"])) as writer, chunk_index(output_file) as cache_index, Progress() as progress:
+      task1 = progress.add_task("[purple]Enriching Summaries...", total=total_chunks)
 
-   # sort the output chunks by sourceId 
-   output_chunks.sort(key=lambda x: (x["sourceId"]))
+      # only one window of chunks is held in memory at a time
+      for chunks in read_chunk_windows(input_file, config.chunkWindow):
+         summarise_window(client, config, progress, task1, chunks, total_chunks, cache_index, logger)
 
-   logger.debug("Total chunks processed: %s", len(output_chunks))
+         for chunk in chunks:
+            if "summary" in chunk:
+               writer.write(chunk)
 
-   #print(f"markdownDestinationDir = {markdownDestinationDir}")         #added for debugging 
-   output_subdir = "output"
-   output_file = os.path.join(destinationDir, "output", "master_enriched.json")
+   logger.debug("Total chunks processed: %s", writer.count)
 
-   # Ensure the output subdirectory exists
-   ensure_directory_exists(os.path.dirname(output_file))
-   # save chunks to a json file
-   with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(output_chunks, f, ensure_ascii=False, indent=4)
\ No newline at end of file
+   # Report how much of the work the summary cache saved, as a warning since every logger is set to WARNING above
+   cache = open_summary_cache(config)
+   if cache:
+      logger.warning("Summary cache: %s", cache.stats())
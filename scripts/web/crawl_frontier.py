@@ -0,0 +1,72 @@
+""" Breadth-first crawl frontier: the pages of a crawl one depth level at a time, with links told apart by their normalised URL."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def normalize_url(url : str):
+    """
+    Returns the form of url used to tell pages apart: lower case scheme and host, no default
+    port, no fragment, and "/" for an empty path. The path and query are kept as they are.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = parts.netloc.lower()
+    try:
+        if parts.port is not None and parts.port == DEFAULT_PORTS.get(scheme):
+            host = parts.hostname
+    except ValueError:
+        pass    # An unparseable port; keep the netloc as it is
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+class CrawlFrontier:
+    """
+    Holds the pages of a crawl, found breadth first. Each page is visited once, at the depth it
+    is first found; whether a link has been seen is a set lookup on its normalised URL rather
+    than a scan of every page found so far.
+
+    Pages keep the URL they were first found by, so the files written for them are named as before.
+    Only the first maxLinksPerPage distinct links of a page are followed, and pages at maxDepth
+    are kept but not expanded.
+    """
+
+    def __init__(self, startUrl : str, maxDepth : int, maxLinksPerPage : int) -> None:
+        self.maxDepth = maxDepth
+        self.maxLinksPerPage = maxLinksPerPage
+        self.seen = {normalize_url(startUrl)}
+        self.pages = [startUrl]
+        self.level = [startUrl]
+        self.depth = 0
+
+    def expanding(self):
+        """True while the current level has pages whose links should be followed."""
+        return bool(self.level) and self.depth < self.maxDepth
+
+    def page_links(self, links):
+        """Returns (normalised, original) pairs for the first maxLinksPerPage distinct links of a page."""
+        kept = {}
+        for link in links:
+            if len(kept) >= self.maxLinksPerPage:
+                break
+            kept.setdefault(normalize_url(link), link)
+        return kept.items()
+
+    def next_level(self, pageLinks):
+        """
+        Takes the links found on each page of the current level, in level order, and makes the
+        pages not seen before the next level. Returns the new level.
+        """
+        nextLevel = []
+        for links in pageLinks:
+            for key, link in self.page_links(links):
+                if key not in self.seen:
+                    self.seen.add(key)
+                    nextLevel.append(link)
+
+        self.depth += 1
+        self.level = nextLevel
+        self.pages.extend(nextLevel)
+        return nextLevel
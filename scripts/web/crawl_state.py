@@ -0,0 +1,109 @@
+""" Per-URL HTTP validators (ETag / Last-Modified) kept between crawls, so a re-crawl can ask servers for changed pages only."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard library imports
+import os
+import json
+import sqlite3
+import threading
+
+# Kept beside the downloaded pages; not a .json file, so the chunkers do not take it for page metadata
+CRAWL_STATE_FILE = "crawl_state.sqlite"
+
+def conditional_headers(state):
+    """Returns If-None-Match / If-Modified-Since headers from a stored state, or {} if there is nothing to revalidate with."""
+    headers = {}
+    if state and state["etag"]:
+        headers["If-None-Match"] = state["etag"]
+    if state and state["lastModified"]:
+        headers["If-Modified-Since"] = state["lastModified"]
+    return headers
+
+
+class CrawlState:
+    """
+    Maps each crawled URL to the ETag and Last-Modified headers it was last downloaded with,
+    persisted in a SQLite file. For pages crawled for their links, the links are stored too,
+    so a 304 during link discovery can still expand the page.
+
+    Also counts this crawl's 304, 200 and failed answers to conditional requests, and remembers
+    which URLs answered 304, so text extraction can keep their files without asking again.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path : str) -> None:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.notModified = 0
+        self.modified = 0
+        self.failed = 0
+        self.unchanged = set()
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, etag TEXT, lastModified TEXT, links TEXT)")
+
+    path: str
+    notModified: int
+    modified: int
+    failed: int
+
+    def get(self, url : str):
+        """Returns {"etag", "lastModified", "links"} stored for url, or None. links is None unless the page was crawled for its links."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, lastModified, links FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "lastModified": row[1], "links": json.loads(row[2]) if row[2] is not None else None}
+
+    def put(self, url : str, response, links : list = None):
+        """Stores the validators of a 200 response for url, and the page's links if it was crawled for them. Other responses are ignored."""
+        if response.status_code != 200:
+            return
+        etag = response.headers.get("ETag")
+        lastModified = response.headers.get("Last-Modified")
+        with self.lock:
+            if etag is None and lastModified is None:
+                self.connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+                return
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, lastModified, links) VALUES (?, ?, ?, ?)",
+                (url, etag, lastModified, json.dumps(links) if links is not None else None))
+
+    def count_revalidation(self, url : str, statusCode : int):
+        """Counts the status of the answer to a conditional request for url, remembering the URL if it was a 304."""
+        with self.lock:
+            if statusCode == 304:
+                self.notModified += 1
+                self.unchanged.add(url)
+            elif statusCode == 200:
+                self.modified += 1
+            else:
+                self.failed += 1
+
+    def was_unchanged(self, url : str):
+        """True if url already answered 304 in this crawl."""
+        with self.lock:
+            return url in self.unchanged
+
+    def stats(self):
+        with self.lock:
+            return {"notModified": self.notModified, "modified": self.modified, "failed": self.failed}
+
+    def close(self):
+        """Closes the underlying database."""
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -8,6 +8,8 @@ import logging
 import time
 import threading
 import queue
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import urlsplit, urljoin
 
@@ -15,6 +17,15 @@ from urllib.parse import urlsplit, urljoin
 from bs4 import BeautifulSoup
 import requests
 
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from common.html_text import get_html_extractor
+from common.document_layout import DocumentManifest, DocumentStore, sharded_name
+from web.page_fetcher import PageFetcher
+from web.page_store import PageStore
+from web.crawl_frontier import CrawlFrontier
+from web.crawl_state import CrawlState, CRAWL_STATE_FILE, conditional_headers
+
 
 MAX_LINKS_PERPAGE=256 #Max number of links we keep from a single page
 MAX_PAGE_DEPTH=1     #Max depth we search in a website
@@ -57,25 +68,61 @@ def makePathOnly (url):
 def makeFullyQualified (base, rel):
     return urljoin(base,rel)
     
-def get_html(url, counter_id, siteUrl, htmlDesitinationDir, logger, minimumPageTokenCount):
-    """Read in HTML content and write out as plain text """
+def fetch_page(fetcher, url, logger, requestHeaders=None):
+    """ Fetch one page, logging and returning None if it fails so the rest of the crawl carries on """
+    try:
+        return fetcher.get(url, requestHeaders)
+    except requests.RequestException as e:
+        logger.warning("Failed to fetch %s: %s", url, e)
+        return None
+
+def page_fetched(page, url, logger):
+    """ True if page is a 200 or 304 answer. Any other status is logged as a failed fetch, so files already downloaded are kept """
+    if page.status_code in (200, 304):
+        return True
+    logger.warning("Failed to fetch %s: HTTP %s", url, page.status_code)
+    return False
+
+def get_html(url, counter_id, siteUrl, htmlDesitinationDir, logger, minimumPageTokenCount, fetcher, pageStore, crawlState, extractor,
+             documents=None):
+    """Read in HTML content and write out as plain text, in the sharded layout if given its DocumentManifest,
+    or in the packed layout if given its DocumentStore """
+
+    # The body is already here if link discovery fetched the page
+    content = pageStore.take(url)
 
     sourceId = makePathOnly (url)
-    fakeName = sourceId.replace("//", "_").replace("/", "_")
+    packed = isinstance(documents, DocumentStore)
+    fakeName = sourceId.replace("//", "_").replace("/", "_") if documents is None or packed else sharded_name(sourceId)
     contentOutputFileName = os.path.join(htmlDesitinationDir, f"{fakeName}.json.mdd")
     metaOutputFilename = os.path.join(htmlDesitinationDir, f"{fakeName}.json")
 
-    # if markdown file already exists, skip it
-    if os.path.exists(contentOutputFileName):
-        logger.debug("Skipping : %s", url)
-        return False    
-    
-    # In case the web site expect cookies and/or javascript
-    session = requests.Session()     
-    page = session.get(url, headers=headers)
-    soup = BeautifulSoup(page.content, "html.parser") 
-    fullText = soup.get_text()
-    nolineFeeds = fullText.replace("\n", " ")
+    # if markdown file already exists, skip it, or with revalidation keep it unless the page has changed.
+    # A page served without an ETag or Last-Modified cannot be revalidated, so it is skipped too
+    requestHeaders = None
+    downloaded = documents.has(sourceId) if packed else os.path.exists(contentOutputFileName)
+    if downloaded:
+        if crawlState is not None and not crawlState.was_unchanged(url):
+            requestHeaders = conditional_headers(crawlState.get(url))
+        if not requestHeaders:
+            logger.debug("Skipping : %s", url)
+            return False
+
+    if content is None:
+        page = fetch_page(fetcher, url, logger, requestHeaders)
+        if page is None:
+            return False
+        if requestHeaders:
+            crawlState.count_revalidation(url, page.status_code)
+        if not page_fetched(page, url, logger):
+            return False
+        if page.status_code == 304:
+            logger.debug("Unchanged : %s", url)
+            return False
+        if crawlState is not None:
+            crawlState.put(url, page)
+        content = page.content
+    nolineFeeds = extractor(content)
     # dont add very short pages
     if len(nolineFeeds) < minimumPageTokenCount * AVERAGE_CHARACTERS_PER_TOKEN:
        logger.debug("Skipping : %s", url)
@@ -86,48 +133,50 @@ def get_html(url, counter_id, siteUrl, htmlDesitinationDir, logger, minimumPageT
     jsonSeg["start"] = "0"
     jsonArr = [""]
     jsonArr[0] = jsonSeg
-         
-    # save the plain text content as a .json.mdd file
-    with open(contentOutputFileName, "w", encoding="utf-8") as file:
-        json.dump(jsonArr, file, indent=4, ensure_ascii=False)
 
     metadata = {}
     metadata["speaker"] = ""
     metadata["title"] = Path(url).name
     metadata["sourceId"] = sourceId
-    metadata["filename"] = os.path.basename(contentOutputFileName)   
+    metadata["filename"] = f"{fakeName}.json.mdd"
     metadata["description"] = Path(url).name
     metadata["hitTrackingId"] = siteUrl    
 
-    # save the metadata as a .json file
-    json.dump(metadata, open(metaOutputFilename, "w", encoding="utf-8"))
+    if packed:
+        documents.put(sourceId, metadata, jsonArr)
+    else:
+        os.makedirs(os.path.dirname(contentOutputFileName), exist_ok=True)
+
+        # save the plain text content as a .json.mdd file
+        with open(contentOutputFileName, "w", encoding="utf-8") as file:
+            json.dump(jsonArr, file, indent=4, ensure_ascii=False)
+
+        # save the metadata as a .json file
+        with open(metaOutputFilename, "w", encoding="utf-8") as file:
+            json.dump(metadata, file)
+        if documents is not None:
+            documents.put(sourceId, f"{fakeName}.json")
     
     logger.debug("Html download completed: %d, %s", counter_id, url)
 
     return True
 
 
-def process_queue(q, sourceUrl, htmlDestinationDir, logger, minimumPageTokenCount):
+def process_queue(q, sourceUrl, htmlDestinationDir, logger, minimumPageTokenCount, fetcher, pageStore, crawlState, extractor, documents):
     """process the queue"""
-    while not q.empty():
-        file = q.get()
+    while True:
+        try:
+            file = q.get_nowait()
+        except queue.Empty:
+            break
 
         counter.increment()
 
-        get_html(file, counter.value, sourceUrl, htmlDestinationDir, logger, minimumPageTokenCount)
+        get_html(file, counter.value, sourceUrl, htmlDestinationDir, logger, minimumPageTokenCount, fetcher, pageStore, crawlState, extractor,
+                 documents)
         q.task_done()
 
 
-def deduplicate(currentLinks, newLinks): # remove duplicates 
-
-    deduped = []
-
-    for item in newLinks:
-        if not item in currentLinks:
-           deduped.append(item)
-    
-    return deduped
-
 def remove_exits(sourceUrl, links): # remove links that point outside the main site being searched
                                     # we also remove links starting with #as they are just the same page
     """ Remove links that point outside the main site being searched """
@@ -153,24 +202,28 @@ def add_prefix(sourceUrl, links):
     return full
 
 
-def recurse_page_list(startUrl, processedLinks, depth, logger, recurse):
-    """ Recursively crawl through pages starting from startUrl """
+def find_page_links(pageUrl, fetcher, pageStore, crawlState, logger):
+    """ Fetch a page, keeping its body for text extraction, and return the links on it that stay below it in the site """
 
-    # Bail if we hit maximum depth
-    if depth > MAX_PAGE_DEPTH:
-        logger.debug("Depth exceeded: %s", startUrl)
-        return
+    # A page whose links were stored last crawl is revalidated, and if unchanged its stored links are used
+    state = crawlState.get(pageUrl) if crawlState is not None else None
+    requestHeaders = conditional_headers(state) if state and state["links"] is not None else None
 
-    # In case the website expects cookies and/or JavaScript
-    session = requests.Session()
-    page = session.get(startUrl, headers=headers)
-    soup = BeautifulSoup(page.text, "html.parser")
+    page = fetch_page(fetcher, pageUrl, logger, requestHeaders)
+    if page is None:
+        return []
+    if requestHeaders:
+        crawlState.count_revalidation(pageUrl, page.status_code)
+    if not page_fetched(page, pageUrl, logger):
+        return []
+    if page.status_code == 304:
+        logger.debug("Unchanged : %s", pageUrl)
+        return state["links"]
 
-    logger.debug("Processing: %s", startUrl)
-    processedLinks.append(startUrl)
+    pageStore.put(pageUrl, page.content)
+    soup = BeautifulSoup(page.text, "html.parser")
 
-    if not recurse:
-        return
+    logger.debug("Processing: %s", pageUrl)
 
     subLinks = soup.find_all('a')
     subUrls = []
@@ -179,31 +232,52 @@ def recurse_page_list(startUrl, processedLinks, depth, logger, recurse):
         url = str(link.get('href'))
         subUrls.append(url)
 
-    full = add_prefix(startUrl, subUrls)
-    deduped = deduplicate(processedLinks, full)
-    trimmed = remove_exits(startUrl, deduped)
+    full = add_prefix(pageUrl, subUrls)
+    links = remove_exits(pageUrl, full)
+
+    if crawlState is not None:
+        crawlState.put(pageUrl, page, links)
+    return links
+
+
+def crawl_page_list(startUrl, logger, recurse, fetcher, pageStore, crawlState, executor):
+    """ Crawl breadth first from startUrl, fetching the pages of each depth level in parallel. Returns every page found, in the order found """
 
-    for link in trimmed:
-        if link not in processedLinks:
-            recurse_page_list(link, processedLinks, depth + 1, logger, recurse)
+    # Pages at the maximum depth are kept, but their links are not followed so they need not be fetched here
+    frontier = CrawlFrontier(startUrl, MAX_PAGE_DEPTH if recurse else 0, MAX_LINKS_PERPAGE)
+
+    while frontier.expanding():
+        frontier.next_level(executor.map(lambda url: find_page_links(url, fetcher, pageStore, crawlState, logger), frontier.level))
+
+    return frontier.pages
 
          
-def build_page_list(sourceUrl, q, minimumPageTokenCount, logger, recurse):
+def build_page_list(sourceUrl, q, minimumPageTokenCount, logger, recurse, fetcher, pageStore, crawlState, executor):
     """ Build a list of pages starting from sourceUrl """
 
-    links = []
-
-    recurse_page_list(sourceUrl, links, 0, logger, recurse)
+    links = crawl_page_list(sourceUrl, logger, recurse, fetcher, pageStore, crawlState, executor)
 
     for url in links:
         q.put(url)
     
-def download_html (sourceUrl, recurse, htmlDesitinationDir, minimumPageTokenCount): 
+def open_documents(htmlDesitinationDir, layout):
+    """ The DocumentManifest for the sharded layout, the DocumentStore for the packed layout, and nothing for the flat one """
+    if layout == "sharded":
+        return DocumentManifest(htmlDesitinationDir)
+    if layout == "packed":
+        return DocumentStore(htmlDesitinationDir)
+    return nullcontext()
+
+def download_html (sourceUrl, recurse, htmlDesitinationDir, minimumPageTokenCount, config : ApiConfiguration = None): 
    
    logging.basicConfig(level=logging.WARNING)
    logger = logging.getLogger(__name__)
 
-   PROCESSING_THREADS = 1
+   if config is None:
+      config = ApiConfiguration()
+
+   PROCESSING_THREADS = max(1, config.crawlThreads)
+   extractor = get_html_extractor(config.htmlExtractor)
 
    q = queue.Queue()
 
@@ -218,26 +292,39 @@ def download_html (sourceUrl, recurse, htmlDesitinationDir, minimumPageTokenCoun
    logger.debug("Source URL: %s", sourceUrl)
    logger.debug("Html folder: %s", htmlDesitinationDir)
 
-   # Recursively search for all html files  
-   build_page_list (sourceUrl, q, minimumPageTokenCount, logger, recurse)
+   # One pooled session for the whole crawl, shared by every thread, the bodies of pages fetched
+   # during link discovery, so text extraction does not fetch them again, and the validators
+   # of pages downloaded before, so unchanged pages are answered with a 304
+   crawlStatePath = os.path.join(htmlDesitinationDir, CRAWL_STATE_FILE)
+   with PageFetcher(headers, config.crawlConnectionsPerHost, config.crawlRequestsPerHost, config.crawlRequestTimeout) as fetcher, \
+        PageStore(config.crawlPageMemoryBytes) as pageStore, \
+        (CrawlState(crawlStatePath) if config.crawlRevalidate else nullcontext()) as crawlState, \
+        open_documents(htmlDesitinationDir, config.outputLayout) as documents:
+
+      # Search for all html pages, a level at a time
+      with ThreadPoolExecutor(max_workers=PROCESSING_THREADS) as executor:
+         build_page_list (sourceUrl, q, minimumPageTokenCount, logger, recurse, fetcher, pageStore, crawlState, executor)
    
-   logger.info("Total HTML files to be downloaded: %s", q.qsize())
-
-   start_time = time.time()
-
-   # create multiple threads to process the queue
-   threads = []
-   for i in range(PROCESSING_THREADS):
-      t = threading.Thread(
-         target=process_queue,
-                args=(q, sourceUrl, htmlDesitinationDir, logger, minimumPageTokenCount),
-         )
-      t.start()
-   threads.append(t)
-
-   # wait for all threads to finish
-   for t in threads:
-      t.join()
+      logger.info("Total HTML files to be downloaded: %s", q.qsize())
+
+      start_time = time.time()
+
+      # create multiple threads to process the queue
+      threads = []
+      for i in range(min(PROCESSING_THREADS, max(1, q.qsize()))):
+         t = threading.Thread(
+            target=process_queue,
+                   args=(q, sourceUrl, htmlDesitinationDir, logger, minimumPageTokenCount, fetcher, pageStore, crawlState, extractor, documents),
+            )
+         t.start()
+         threads.append(t)
+
+      # wait for all threads to finish
+      for t in threads:
+         t.join()
+
+      if crawlState is not None:
+         logger.info("Revalidation: %s", crawlState.stats())
 
    finish_time = time.time()
    logger.debug("Total time taken: %s", finish_time - start_time)
@@ -0,0 +1,62 @@
+""" Thread safe page fetching for the crawler: one pooled requests.Session shared by every thread, with a cap on requests in flight to each host."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import threading
+from urllib.parse import urlsplit
+
+# Third-Party Packages
+import requests
+from requests.adapters import HTTPAdapter
+
+# Hosts whose connection pools are kept open at once; a crawl rarely leaves its own site
+POOLED_HOSTS = 16
+
+class PageFetcher:
+    """
+    Shares one requests.Session, and so one pool of keep-alive connections, across every
+    thread of a crawl. Each page after the first on a host reuses an open connection rather
+    than paying TCP and TLS setup again, and cookies the site sets carry over between pages.
+
+    At most connectionsPerHost connections are kept to a host, and at most requestsPerHost
+    requests are in flight to it, however many threads are crawling.
+    """
+
+    def __init__(self, headers : dict, connectionsPerHost : int = 8, requestsPerHost : int = 4, timeout : float = 30) -> None:
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=POOLED_HOSTS, pool_maxsize=connectionsPerHost, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.requestsPerHost = max(1, requestsPerHost)
+        self.timeout = timeout
+        self.hostLimits = {}
+        self.lock = threading.Lock()
+
+    def host_limit(self, url : str):
+        """Returns the semaphore that bounds requests in flight to url's host."""
+        host = urlsplit(url).netloc.lower()
+        with self.lock:
+            limit = self.hostLimits.get(host)
+            if limit is None:
+                limit = threading.BoundedSemaphore(self.requestsPerHost)
+                self.hostLimits[host] = limit
+        return limit
+
+    def get(self, url : str, headers : dict = None):
+        """
+        GETs url on the shared session, waiting first if its host already has requestsPerHost
+        requests in flight. headers are added to the session's own for this request only.
+        """
+        with self.host_limit(url):
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,72 @@
+""" Holds page bodies fetched during link discovery until text extraction takes them, so each page is only fetched once."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import tempfile
+import threading
+
+class PageStore:
+    """
+    A thread safe map from URL to page body. Bodies are kept in memory up to memoryLimit bytes
+    in total; past that they are spilled to files in a temporary directory, which close removes.
+    take hands a body over and forgets it, so the store only holds pages not yet extracted.
+    """
+
+    def __init__(self, memoryLimit : int) -> None:
+        self.memoryLimit = memoryLimit
+        self.memoryUsed = 0
+        self.pages = {}     # url -> bytes held in memory, or the str path of a spilled file
+        self.spilled = 0
+        self.spillDir = None
+        self.lock = threading.Lock()
+
+    def put(self, url : str, content : bytes):
+        with self.lock:
+            if self.memoryUsed + len(content) <= self.memoryLimit:
+                self.pages[url] = content
+                self.memoryUsed += len(content)
+                return
+
+            if self.spillDir is None:
+                self.spillDir = tempfile.TemporaryDirectory(prefix="page_store_")
+            self.spilled += 1
+            path = os.path.join(self.spillDir.name, f"{self.spilled}.html")
+
+        with open(path, "wb") as f:
+            f.write(content)
+        with self.lock:
+            self.pages[url] = path
+
+    def take(self, url : str):
+        """Returns the body stored for url and removes it from the store, or None if there is none."""
+        with self.lock:
+            stored = self.pages.pop(url, None)
+            if isinstance(stored, bytes):
+                self.memoryUsed -= len(stored)
+                return stored
+
+        if stored is None:
+            return None
+        with open(stored, "rb") as f:
+            content = f.read()
+        os.remove(stored)
+        return content
+
+    def __len__(self):
+        with self.lock:
+            return len(self.pages)
+
+    def close(self):
+        with self.lock:
+            self.pages.clear()
+            self.memoryUsed = 0
+            if self.spillDir is not None:
+                self.spillDir.cleanup()
+                self.spillDir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -5,6 +5,7 @@ import os
 
 # Local Modules
 from common.ApiConfiguration import ApiConfiguration
+from common.chunk_store import chunk_file_name
 from common.Urls import webUrls, countUrlHits
 from web.download_html import download_html
 from common.common_functions import ensure_directory_exists
@@ -22,7 +23,7 @@ config = ApiConfiguration()
 
 # For debugging purposes, you might want to comment out the following block
 for item in webUrls:
-    download_html(item[1], item[2], HTML_DESTINATION_DIR, config.discardIfBelow)
+    download_html(item[1], item[2], HTML_DESTINATION_DIR, config.discardIfBelow, config)
 
 # Keep this comment as example of how to just process one file for debugging
 #download_html("https://www.interaction-design.org/literature/topics/design-thinking", 
@@ -32,9 +33,9 @@ for item in webUrls:
 enrich_text_chunks(config, HTML_DESTINATION_DIR) 
 enrich_text_summaries(config, HTML_DESTINATION_DIR)
 enrich_text_embeddings(config, HTML_DESTINATION_DIR)
-enrich_lite(HTML_DESTINATION_DIR)
+enrich_lite(HTML_DESTINATION_DIR, config)
 
 ENRICHMENT_OUTPUT_DIR = os.path.join(HTML_DESTINATION_DIR, "output")
 
 # Count URL hits 
-countUrlHits(ENRICHMENT_OUTPUT_DIR, webUrls, "master_text.json", "hit_test_results_web.json")
\ No newline at end of file
+countUrlHits(ENRICHMENT_OUTPUT_DIR, webUrls, chunk_file_name("master_text", config), "hit_test_results_web.json")
\ No newline at end of file
@@ -1,4 +1,5 @@
-from .download_transcripts import download_transcripts
+from .download_transcripts import download_transcripts, download_transcripts_for_playlists
+from .enrich_video_metadata import enrich_video_metadata
 from .enrich_transcript_chunks import enrich_transcript_chunks
 from .enrich_transcript_summaries import enrich_transcript_summaries
 from .enrich_transcript_embeddings import enrich_transcript_embeddings
@@ -6,13 +6,20 @@ import json
 import logging
 import time
 import threading
-import queue
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # Third-Party Packages
+import requests
 import googleapiclient.discovery
 import googleapiclient.errors
-from youtube_transcript_api import YouTubeTranscriptApi, NoTranscriptFound, TranscriptsDisabled, VideoUnavailable
-from youtube_transcript_api.formatters import WebVTTFormatter
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+from youtube_transcript_api import (
+    YouTubeTranscriptApi, NoTranscriptFound, TranscriptsDisabled, VideoUnavailable, TooManyRequests, YouTubeRequestFailed
+)
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from common.rate_limiter import RateLimiter
 
 
 logger = logging.getLogger(__name__)
@@ -24,7 +31,10 @@ GOOGLE_API_SERVICE_NAME = "youtube"
 GOOGLE_API_VERSION = "v3"
 
 MAX_RESULTS = 50
-PROCESSING_THREADS = 1
+
+# Failures worth another try: throttling, server errors and dropped connections, not a video without a transcript
+TRANSIENT_ERRORS = (TooManyRequests, YouTubeRequestFailed, requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+TRANSIENT_HTTP_STATUSES = {429, 500, 502, 503, 504}
 
 class Counter:
     """thread safe counter"""
@@ -40,6 +50,48 @@ class Counter:
             self.value += 1
 
 
+def is_transient(exception):
+    """True if a failed YouTube call may succeed if tried again."""
+    if isinstance(exception, googleapiclient.errors.HttpError):
+        return exception.resp.status in TRANSIENT_HTTP_STATUSES
+    return isinstance(exception, TRANSIENT_ERRORS)
+
+
+class YouTubeFetcher:
+    """
+    Makes the calls of a transcript download, from any number of threads. Each endpoint, the
+    transcript site and the Data API, has its own requests-per-minute limit shared by every
+    thread, and a call that fails transiently is retried after a random exponential wait,
+    so threads throttled together do not all come back at once.
+    """
+
+    def __init__(self, config : ApiConfiguration) -> None:
+        self.transcriptLimiter = RateLimiter(config.transcriptRequestsPerMinute, 0)
+        self.dataApiLimiter = RateLimiter(config.youTubeApiRequestsPerMinute, 0)
+        self.attempts = max(1, config.transcriptAttempts)
+        self.maxWait = config.transcriptRetryMaxSeconds
+
+    def call(self, limiter : RateLimiter, function, *args, **kwargs):
+        """Calls function through limiter, retrying transient failures. The last failure is raised."""
+        retrying = Retrying(
+            retry=retry_if_exception(is_transient),
+            wait=wait_random_exponential(multiplier=self.maxWait / 16, max=self.maxWait),
+            stop=stop_after_attempt(self.attempts),
+            reraise=True
+        )
+        for attempt in retrying:
+            with attempt:
+                limiter.acquire(0)
+                return function(*args, **kwargs)
+
+    def get_transcript(self, video_id : str):
+        return self.call(self.transcriptLimiter, YouTubeTranscriptApi.get_transcript, video_id)
+
+    def execute(self, request):
+        """Executes a Data API request."""
+        return self.call(self.dataApiLimiter, request.execute)
+
+
 def gen_metadata(playlist_item, transcriptDestinationDir):
     """Generate metadata for a video"""
 
@@ -63,8 +115,8 @@ def gen_metadata(playlist_item, transcriptDestinationDir):
 
 
 
-def get_transcript(playlist_item, counter_id, transcriptDestinationDir, logger):
-    """Get the transcript for a video"""
+def get_transcript(playlist_item, counter_id, transcriptDestinationDir, logger, fetcher : YouTubeFetcher = None):
+    """Get the transcript for a video, through fetcher's rate limits and retries if given"""
 
     video_id = playlist_item["snippet"]["resourceId"]["videoId"]
     filename = os.path.join(transcriptDestinationDir, video_id + ".json.vtt")
@@ -75,7 +127,10 @@ def get_transcript(playlist_item, counter_id, transcriptDestinationDir, logger):
         return False
 
     try:
-        transcript = YouTubeTranscriptApi.get_transcript(video_id)
+        if fetcher is not None:
+            transcript = fetcher.get_transcript(video_id)
+        else:
+            transcript = YouTubeTranscriptApi.get_transcript(video_id)
         # Remove \n from the text
         for item in transcript:
             item["text"] = item["text"].replace("\n", " ")
@@ -107,56 +162,28 @@ def get_transcript(playlist_item, counter_id, transcriptDestinationDir, logger):
 
 
 
-def process_queue(q, counter, transcriptDestinationDir, logger):
-    """Process the queue"""
-    while not q.empty():
-        video = q.get()
-
-        counter.increment()
-
-        if get_transcript(video, counter.value, transcriptDestinationDir, logger):
-            gen_metadata(video, transcriptDestinationDir)
-        q.task_done()
-
-def download_transcripts (playlistId, transcriptDestinationDir): 
-   
-   logging.basicConfig(level=logging.INFO)
-   logger = logging.getLogger(__name__)
-
-   formatter = WebVTTFormatter()
-   q = queue.Queue()
-
-
-   if not transcriptDestinationDir:
-      logger.error("Transcript folder not provided")
-      exit(1)
+def download_video(playlist_item, counter, transcriptDestinationDir, logger, fetcher):
+    """Download one video's transcript and metadata"""
+    counter.increment()
 
-   if not playlistId:
-      logger.error("Playlist ID not provided")
-      exit(1)
+    if get_transcript(playlist_item, counter.value, transcriptDestinationDir, logger, fetcher):
+        gen_metadata(playlist_item, transcriptDestinationDir)
 
-   counter = Counter()   
 
-   logger.debug("Transcription folder: %s", transcriptDestinationDir)
-
-   youtube = googleapiclient.discovery.build(
-      GOOGLE_API_SERVICE_NAME, GOOGLE_API_VERSION, developerKey=GOOGLE_DEVELOPER_API_KEY
-   )
+def list_playlist_items(youtube, playlistId, fetcher):
+   """Yields the items of a playlist, a page of results at a time"""
 
    # Create a request object with the playlist ID and the max results
    request = youtube.playlistItems().list(
       part="snippet", playlistId=playlistId, maxResults=MAX_RESULTS
    )
 
-
    # Loop through the pages of results until there is no next page token
    while request:
       # Execute the request and get the response
-      response = request.execute()
+      response = fetcher.execute(request)
 
-      # Iterate over the items in the response and append the video IDs to the list
-      for item in response["items"]:
-        q.put(item)
+      yield from response["items"]
 
       # Get the next page token from the response and create a new request object
       next_page_token = response.get("nextPageToken")
@@ -170,24 +197,63 @@ def download_transcripts (playlistId, transcriptDestinationDir):
       else:
          request = None
 
-   logger.info("Total transcriptions to be download: %s", q.qsize())
 
-   start_time = time.time()
+def download_transcripts_for_playlists(playlistIds, transcriptDestinationDir, config : ApiConfiguration = None):
+   """
+   Downloads the transcripts of every video in the playlists on one pool of config.transcriptThreads
+   threads. Videos are handed to the pool as each page of a playlist is listed, so downloads from
+   one playlist run while the next is listed. A video in more than one playlist is downloaded once,
+   for the first playlist it is in.
+   """
+
+   logging.basicConfig(level=logging.INFO)
+   logger = logging.getLogger(__name__)
+
+   if config is None:
+      config = ApiConfiguration()
+
+   if not transcriptDestinationDir:
+      logger.error("Transcript folder not provided")
+      exit(1)
+
+   if not playlistIds or not all(playlistIds):
+      logger.error("Playlist ID not provided")
+      exit(1)
 
-   # create multiple threads to process the queue
-   threads = []
-   for i in range(PROCESSING_THREADS):
-      t = threading.Thread(
-             target=process_queue,
-             args=(q, counter, transcriptDestinationDir, logger),
-             )
-      t.start()
-      threads.append(t)
+   counter = Counter()
+   fetcher = YouTubeFetcher(config)
 
-   # wait for all threads to finish
-   for t in threads:
-      t.join()
+   logger.debug("Transcription folder: %s", transcriptDestinationDir)
+
+   youtube = googleapiclient.discovery.build(
+      GOOGLE_API_SERVICE_NAME, GOOGLE_API_VERSION, developerKey=GOOGLE_DEVELOPER_API_KEY
+   )
+
+   start_time = time.time()
+
+   # The Data API client is not thread safe, so playlists are listed on this thread only
+   videos = set()
+   futures = []
+   with ThreadPoolExecutor(max_workers=max(1, config.transcriptThreads)) as executor:
+      for playlistId in playlistIds:
+         for item in list_playlist_items(youtube, playlistId, fetcher):
+            video_id = item["snippet"]["resourceId"]["videoId"]
+            if video_id in videos:
+               continue
+            videos.add(video_id)
+            futures.append(executor.submit(download_video, item, counter, transcriptDestinationDir, logger, fetcher))
+
+      logger.info("Total transcriptions to be download: %s", len(futures))
+      wait(futures)
+
+   # Surface anything get_transcript did not handle itself
+   for future in futures:
+      future.result()
 
    finish_time = time.time()
    logger.debug("Total time taken: %s", finish_time - start_time)
 
+
+def download_transcripts (playlistId, transcriptDestinationDir, config : ApiConfiguration = None):
+   """Downloads the transcripts of every video in a playlist"""
+   download_transcripts_for_playlists([playlistId], transcriptDestinationDir, config)
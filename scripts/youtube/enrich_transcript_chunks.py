@@ -15,6 +15,8 @@ from typing import List, Dict
 import tiktoken
 from rich.progress import Progress
 
+# Local Modules
+from common.chunk_store import chunk_file_name, ChunkWriter
 
 # Define constants
 PERCENTAGE_OVERLAP = 0.05
@@ -101,7 +103,9 @@ def parse_json_vtt_transcript(vtt, metadata, chunks, chunkMinutes, maxTokens):
         metadata["description"] = clean_text(metadata.get("description"))
         text += metadata.get("description") + ". "
 
+    # Token counts are kept running as segments are added, so each piece of text is encoded once
     current_token_length = len(tokenizer.encode(text))
+    previous_chunk_tokens = 0
 
     try:
         with open(vtt, "r", encoding="utf-8") as json_file:
@@ -124,7 +128,8 @@ def parse_json_vtt_transcript(vtt, metadata, chunks, chunkMinutes, maxTokens):
             seg_begin_seconds = current_seconds
             seg_finish_seconds = seg_begin_seconds + chunkMinutes * 60
 
-        total_tokens = len(tokenizer.encode(current_text)) + current_token_length
+        segment_tokens = len(tokenizer.encode(current_text))
+        total_tokens = segment_tokens + current_token_length
 
         if current_seconds < seg_finish_seconds and total_tokens < maxTokens:
             text += current_text + " "
@@ -134,16 +139,17 @@ def parse_json_vtt_transcript(vtt, metadata, chunks, chunkMinutes, maxTokens):
                 append_text_to_previous_chunk(text, chunks)
             first_chunk = False
             add_new_chunk(metadata, text, seg_begin_seconds, chunks)
+            previous_chunk_tokens = current_token_length
 
             text = current_text + " "
             seg_begin_seconds = current_seconds
             seg_finish_seconds = seg_begin_seconds + chunkMinutes * 60
-            current_token_length = len(tokenizer.encode(text))
+            current_token_length = segment_tokens
 
     if seg_begin_seconds is not None and text != "":
         if chunks and not first_chunk:
-            previous_chunk_tokens = len(tokenizer.encode(chunks[-1]["text"]))
-            current_chunk_tokens = len(tokenizer.encode(text))
+            # The last chunk in chunks is the one this transcript added last, and nothing has been appended to it since
+            current_chunk_tokens = current_token_length
 
             if previous_chunk_tokens + current_chunk_tokens < maxTokens:
                 chunks[-1]["text"] += text
@@ -186,24 +192,30 @@ def enrich_transcript_chunks (config, transcriptDestinationDir):
 
     folder = os.path.join(transcriptDestinationDir, "*.json")
 
-    with Progress() as progress:
+    output_file = os.path.join(transcriptDestinationDir, "output", chunk_file_name("master_transcriptions", config))
+
+    ensure_directory_exists(os.path.dirname(output_file))
+
+    with ChunkWriter(output_file) as writer, Progress() as progress:
         task1 = progress.add_task("[green]Enriching chunks...", total=total_files)
 
         for file in glob.glob(folder):
-            meta = json.load(open(file, encoding="utf-8"))
+            with open(file, encoding="utf-8") as f:
+                meta = json.load(f)
 
             get_transcript(meta, transcriptDestinationDir, chunks, config.chunkDurationMins, (config.maxTokens - config.summaryWordCount * 4))
             progress.update(task1, advance=1)
 
-    logger.debug("Total files: %s", total_files)
-    logger.debug("Total chunks: %s", len(chunks))
+            # write out finished chunks as we go; the last one stays, as the next file may still append to it
+            for chunk in chunks[:-1]:
+                writer.write(chunk)
+            del chunks[:-1]
 
-    output_subdir = "output"
-    output_file = os.path.join(transcriptDestinationDir, output_subdir, "master_transcriptions.json")
+        for chunk in chunks:
+            writer.write(chunk)
 
-    ensure_directory_exists(os.path.dirname(output_file))
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, ensure_ascii=False, indent=4)
+    logger.debug("Total files: %s", total_files)
+    logger.debug("Total chunks: %s", writer.count)
 
 def ensure_directory_exists(directory):
     """Ensure directory exists; if not, create it."""
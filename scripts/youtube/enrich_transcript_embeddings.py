@@ -7,7 +7,7 @@ import threading
 import queue
 
 # Third-Party Packages
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from openai import BadRequestError
 import tiktoken
 from tenacity import (
@@ -21,7 +21,14 @@ from rich.progress import Progress
 # Local Modules
 from common.ApiConfiguration import ApiConfiguration
 from common.common_functions import ensure_directory_exists
+from common.common_functions import make_chunk_key, chunk_index
+from common.common_functions import open_embedding_cache
 from common.common_functions import get_embedding
+from common.common_functions import get_embedding_async, make_async_client
+from common.async_runner import run_async
+from common.chunk_store import chunk_file_name, count_chunks, read_chunk_windows, ChunkWriter
+from common.ann_index import build_ann_index_file
+from common.rate_limiter import wait_unless_rate_limited
 
 tokenizer = tiktoken.get_encoding("cl100k_base")
 
@@ -37,7 +44,7 @@ def normalize_text(s, sep_token=" \n "):
     return s
 
 @retry(
-    wait=wait_random_exponential(min=10, max=45),
+    wait=wait_unless_rate_limited(wait_random_exponential(min=10, max=45)),
     stop=stop_after_attempt(5),
     retry=retry_if_not_exception_type(BadRequestError),
 )
@@ -48,28 +55,34 @@ def get_text_embedding(client : AzureOpenAI, config : ApiConfiguration, text: st
                               config)
     return embedding
 
-def process_queue(client, config, progress, task, q, logger, output_chunks, current_chunks):
-    """process the queue"""
+@retry(
+    wait=wait_unless_rate_limited(wait_random_exponential(min=10, max=45)),
+    stop=stop_after_attempt(5),
+    retry=retry_if_not_exception_type(BadRequestError),
+)
+async def get_text_embedding_async(client : AsyncAzureOpenAI, config : ApiConfiguration, text: str):
+    """get the embedding for a text with the async client"""
+    embedding = await get_embedding_async(text, 
+                                          client, 
+                                          config)
+    return embedding
+
+def process_queue(client, config, progress, task, q, logger, cache_index):
+    """process the queue, storing each embedding on its chunk"""
     while not q.empty():
         chunk = q.get()
         found = False
 
-        for i in current_chunks: 
-           if i.get('sourceId') == chunk.get('sourceId'):           
-              current_summary = i.get("summary")
-              current_ada = i.get("ada_v2")
-              if current_summary and current_ada: 
-                 chunk["summary"] = current_summary
-                 chunk["ada_v2"] = current_ada   
-                 output_chunks.append(chunk.copy())                                 
-                 found = True  
-                 break
+        cached = cache_index.get(make_chunk_key(chunk))
+        if cached: 
+           chunk["summary"] = cached.get("summary")
+           chunk["ada_v2"] = cached.get("ada_v2")
+           found = True  
         
         if not found:
            try:
               embedding = get_text_embedding(client, config, chunk["text"])
               chunk["ada_v2"] = embedding.copy()     
-              output_chunks.append(chunk.copy())                          
            except BadRequestError as request_error:
               logger.warning("Error: %s %s", chunk.get('sourceId'), request_error)
            except Exception as e:
@@ -78,6 +91,23 @@ def process_queue(client, config, progress, task, q, logger, output_chunks, curr
         progress.update(task, advance=1)
         q.task_done()
 
+async def process_chunk_async(client, config, progress, task, chunk, logger, cache_index):
+    """async version of one pass of process_queue"""
+    cached = cache_index.get(make_chunk_key(chunk))
+    if cached: 
+       chunk["summary"] = cached.get("summary")
+       chunk["ada_v2"] = cached.get("ada_v2")
+    else:
+       try:
+          embedding = await get_text_embedding_async(client, config, chunk["text"])
+          chunk["ada_v2"] = embedding.copy()     
+       except BadRequestError as request_error:
+          logger.warning("Error: %s %s", chunk.get('sourceId'), request_error)
+       except Exception as e:
+          logger.warning("Error: %s %s", chunk.get('sourceId'), 'Unknown error')          
+
+    progress.update(task, advance=1)
+
 def convert_time_to_seconds(value):
     """convert time to seconds"""
     time_value = value.split(":")
@@ -92,7 +122,8 @@ def enrich_transcript_embeddings(config, transcriptDestinationDir):
    client = AzureOpenAI(
       azure_endpoint = config.resourceEndpoint, 
       api_key=config.apiKey,  
-      api_version=config.apiVersion
+      api_version=config.apiVersion,
+      max_retries=0  # tenacity retries instead, so every 429 reaches the rate limiter
    )   
 
    logger = logging.getLogger(__name__)
@@ -105,45 +136,52 @@ def enrich_transcript_embeddings(config, transcriptDestinationDir):
       exit(1)
 
    total_chunks = 0
-   output_chunks = []
-
-   input_file = os.path.join(transcriptDestinationDir, "output", "master_enriched.json")
-   with open(input_file, "r", encoding="utf-8") as f:
-      chunks = json.load(f)
 
-   total_chunks = len(chunks)
+   # the input is also the cache: chunks already embedded keep their vectors
+   input_file = os.path.join(transcriptDestinationDir, "output", chunk_file_name("master_enriched", config))
+   output_file = input_file
 
-   logger.debug("Starting OpenAI Embeddings")
-   logger.debug("Total chunks to be processed: %s", len(chunks))
+   ensure_directory_exists(os.path.dirname(output_file))
 
-   q = queue.Queue()
-   for chunk in chunks:
-      q.put(chunk)
+   total_chunks = count_chunks(input_file)
 
-   cache_file = os.path.join(transcriptDestinationDir, "output", "master_enriched.json")
-   if os.path.isfile(cache_file):
-      with open(cache_file, "r", encoding="utf-8") as f:
-         current = json.load(f) 
+   logger.debug("Starting OpenAI Embeddings")
+   logger.debug("Total chunks to be processed: %s", total_chunks)
 
-   with Progress() as progress:
+   # index the existing chunks once so each lookup is O(1); the new output replaces them only once it is complete, after the index is closed
+   with ChunkWriter(output_file) as writer, chunk_index(output_file) as cache_index, Progress() as progress:
       task1 = progress.add_task("[green]Enriching Embeddings...", total=total_chunks)
-      threads = []
-      for i in range(config.processingThreads):
-         t = threading.Thread(target=process_queue, args=(client, config, progress, task1, q, logger, output_chunks, current))
-         t.start()
-         threads.append(t)
-
-      for t in threads:
-         t.join()
-
-   output_chunks.sort(key=lambda x: (x["sourceId"], convert_time_to_seconds(x["start"])))
-
-   logger.debug("Total chunks processed: %s", len(output_chunks))
-
-   output_subdir = "output"
-   output_file = os.path.join(transcriptDestinationDir, output_subdir, "master_enriched.json")
-
-   ensure_directory_exists(os.path.dirname(output_file))
 
-   with open(output_file, "w", encoding="utf-8") as f:
-      json.dump(chunks, f, ensure_ascii=False, indent=4)
+      # only one window of chunks is held in memory at a time
+      for chunks in read_chunk_windows(input_file, config.chunkWindow):
+         if config.asyncMode:
+            run_async(lambda: make_async_client(config),
+                      lambda async_client, chunk: process_chunk_async(async_client, config, progress, task1, chunk, logger, cache_index),
+                      chunks, config.maxConcurrentRequests)
+         else:
+            q = queue.Queue()
+            for chunk in chunks:
+               q.put(chunk)
+
+            threads = []
+            for i in range(config.processingThreads):
+               t = threading.Thread(target=process_queue, args=(client, config, progress, task1, q, logger, cache_index))
+               t.start()
+               threads.append(t)
+
+            for t in threads:
+               t.join()
+
+         for chunk in chunks:
+            writer.write(chunk)
+
+   logger.debug("Total chunks processed: %s", writer.count)
+
+   # Report how much of the work the embedding cache saved, as a warning since every logger is set to WARNING above
+   cache = open_embedding_cache(config)
+   if cache:
+      logger.warning("Embedding cache: %s", cache.stats())
+
+   # Optionally index the new embeddings for approximate nearest neighbour search
+   if config.buildAnnIndex:
+      build_ann_index_file(output_file, config.annLists, config.annProbe)
@@ -0,0 +1,146 @@
+""" Adds each video's duration and statistics to its metadata, from batched YouTube Data API videos.list calls."""
+# Copyright (c) 2024 Braid Technologies Ltd
+
+# Standard Library Imports
+import os
+import re
+import json
+import glob
+import time
+import logging
+
+# Third-Party Packages
+import googleapiclient.discovery
+
+# Local Modules
+from common.ApiConfiguration import ApiConfiguration
+from common.common_functions import open_cache
+from common.content_cache import make_cache_key
+from youtube.download_transcripts import (
+    YouTubeFetcher, GOOGLE_API_SERVICE_NAME, GOOGLE_API_VERSION, GOOGLE_DEVELOPER_API_KEY
+)
+
+logger = logging.getLogger(__name__)
+
+# videos.list takes at most 50 ids a call
+VIDEOS_PER_REQUEST = 50
+VIDEO_PARTS = "contentDetails,statistics"
+
+ISO_DURATION = re.compile(r"^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+def parse_duration(duration : str):
+    """Seconds in an ISO 8601 duration such as PT1H2M3S, or None if it cannot be read."""
+    match = ISO_DURATION.match(duration or "")
+    if match is None:
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def video_fields(item):
+    """The metadata fields taken from a videos.list item; statistics a video hides are left out."""
+    fields = {}
+    duration = parse_duration(item.get("contentDetails", {}).get("duration"))
+    if duration is not None:
+        fields["durationSeconds"] = duration
+    for name in ["viewCount", "likeCount", "commentCount"]:
+        value = item.get("statistics", {}).get(name)
+        if value is not None:
+            fields[name] = int(value)
+    return fields
+
+
+def make_video_key(videoId : str):
+    return make_cache_key("videos.list", VIDEO_PARTS, videoId)
+
+
+def cached_item(cache, videoId : str, maxAgeSeconds : float):
+    """Returns the videos.list item cached for videoId, or None if there is none or it is older than maxAgeSeconds."""
+    if cache is None:
+        return None
+    value = cache.get(make_video_key(videoId))
+    if value is None:
+        return None
+    entry = json.loads(value)
+    if time.time() - entry["fetched"] > maxAgeSeconds:
+        return None
+    return entry["item"]
+
+
+def fetch_video_items(youtube, fetcher : YouTubeFetcher, videoIds):
+    """Calls videos.list for up to VIDEOS_PER_REQUEST ids at a time. Returns videoId -> item for the videos YouTube knows."""
+    items = {}
+    for begin in range(0, len(videoIds), VIDEOS_PER_REQUEST):
+        batch = videoIds[begin:begin + VIDEOS_PER_REQUEST]
+        request = youtube.videos().list(part=VIDEO_PARTS, id=",".join(batch), maxResults=VIDEOS_PER_REQUEST)
+        response = fetcher.execute(request)
+        for item in response.get("items", []):
+            items[item["id"]] = item
+    return items
+
+
+def enrich_video_metadata(config : ApiConfiguration, transcriptDestinationDir, youtube=None):
+    """
+    Adds durationSeconds, viewCount, likeCount and commentCount to the metadata .json of every video
+    in transcriptDestinationDir. Videos are looked up VIDEOS_PER_REQUEST to a videos.list call, and each
+    item is cached on disk under its video id with its etag, so a rerun only calls the API for new
+    videos and for items older than config.videoMetadataMaxAgeDays. A metadata file is only rewritten
+    when its fields change.
+    """
+
+    logging.basicConfig(level=logging.INFO)
+
+    if not transcriptDestinationDir:
+        logger.error("Transcript folder not provided")
+        exit(1)
+
+    if youtube is None:
+        youtube = googleapiclient.discovery.build(
+            GOOGLE_API_SERVICE_NAME, GOOGLE_API_VERSION, developerKey=GOOGLE_DEVELOPER_API_KEY
+        )
+    fetcher = YouTubeFetcher(config)
+    cache = open_cache(config.videoMetadataCacheFile, config.videoMetadataCacheMaxEntries)
+    maxAgeSeconds = config.videoMetadataMaxAgeDays * 24 * 60 * 60
+
+    metadataFiles = {}
+    for file in sorted(glob.glob(os.path.join(transcriptDestinationDir, "*.json"))):
+        with open(file, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        metadataFiles[metadata["sourceId"]] = (file, metadata)
+
+    items = {}
+    stale = []
+    for videoId in metadataFiles:
+        item = cached_item(cache, videoId, maxAgeSeconds)
+        if item is None:
+            stale.append(videoId)
+        else:
+            items[videoId] = item
+
+    logger.info("Video metadata: %d cached, %d to fetch in %d requests", len(items), len(stale),
+                -(-len(stale) // VIDEOS_PER_REQUEST))
+
+    unchanged = 0
+    for videoId, item in fetch_video_items(youtube, fetcher, stale).items():
+        if cache is not None:
+            previous = cache.get(make_video_key(videoId))
+            if previous is not None and json.loads(previous)["item"].get("etag") == item.get("etag"):
+                unchanged += 1
+            cache.put(make_video_key(videoId), json.dumps({"fetched": time.time(), "item": item}).encode("utf-8"))
+        items[videoId] = item
+
+    updated = 0
+    for videoId, (file, metadata) in metadataFiles.items():
+        item = items.get(videoId)
+        if item is None:
+            logger.debug("No videos.list item for video: %s", videoId)
+            continue
+        fields = video_fields(item)
+        if all(metadata.get(name) == value for name, value in fields.items()):
+            continue
+        metadata.update(fields)
+        with open(file, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=4, ensure_ascii=False)
+        updated += 1
+
+    logger.info("Video metadata: %d files updated, %d refreshed items unchanged", updated, unchanged)
@@ -6,9 +6,11 @@ import logging
 
 # Local Modules
 from common.ApiConfiguration import ApiConfiguration
+from common.chunk_store import chunk_file_name
 from common.Urls import youTubeUrls, countUrlHits
 from common.common_functions import ensure_directory_exists
-from youtube.download_transcripts import download_transcripts
+from youtube.download_transcripts import download_transcripts_for_playlists
+from youtube.enrich_video_metadata import enrich_video_metadata
 from youtube.enrich_transcript_chunks import enrich_transcript_chunks
 from youtube.enrich_transcript_summaries import enrich_transcript_summaries
 from youtube.enrich_transcript_embeddings import enrich_transcript_embeddings
@@ -28,14 +30,16 @@ ensure_directory_exists(TRANSCRIPT_DESTINATION_DIR)
 
 config = ApiConfiguration()
 
-for item in youTubeUrls:
-   logger.debug(f"Downloading transcripts for URL: {item[1]}")
-   download_transcripts(item[1], TRANSCRIPT_DESTINATION_DIR)
+logger.debug(f"Downloading transcripts for playlists: {[item[1] for item in youTubeUrls]}")
+download_transcripts_for_playlists([item[1] for item in youTubeUrls], TRANSCRIPT_DESTINATION_DIR, config)
 
 # Keep this comment as example of how to just process one file for debugging   
 #download_transcripts ("PL1T8fO7ArWleyIqOy37OVXsP4hFXymdOZ", TRANSCRIPT_DESTINATION_DIR)
 #download_transcripts ("PLFnkruiXQop4Robpmim_3FMZbv_1lAwBu", TRANSCRIPT_DESTINATION_DIR)
 
+logger.info("Fetching video durations and statistics...")
+enrich_video_metadata(config, TRANSCRIPT_DESTINATION_DIR)
+
 logger.info("Enriching transcript chunks...")
 enrich_transcript_chunks(config, TRANSCRIPT_DESTINATION_DIR)
 
@@ -46,10 +50,10 @@ logger.info("Enriching transcript embeddings...")
 enrich_transcript_embeddings(config, TRANSCRIPT_DESTINATION_DIR)
 
 logger.info("Enriching transcripts with lite enrichment...")
-enrich_lite(TRANSCRIPT_DESTINATION_DIR)
+enrich_lite(TRANSCRIPT_DESTINATION_DIR, config)
 
 logger.info("Counting URL hits...")
 output_dir = os.path.join(TRANSCRIPT_DESTINATION_DIR, "output") 
-countUrlHits(output_dir, youTubeUrls, "master_transcriptions.json","hit_test_results.json")
+countUrlHits(output_dir, youTubeUrls, chunk_file_name("master_transcriptions", config),"hit_test_results.json")
 
 logger.info("Script finished.")
\ No newline at end of file